@@ -0,0 +1,27 @@
+# agent_protocol.py
+# Wire format between collector agents and the aggregator: every frame is a
+# 4-byte big-endian length followed by a zlib-compressed JSON object with a
+# 'type' field (hello, welcome, batch, ack).
+import json
+import struct
+import zlib
+
+MAX_FRAME = 64 * 1024 * 1024
+DEFAULT_PORT = 9500
+
+
+def shard_of(host, shards):
+    return zlib.crc32(host.encode()) % shards
+
+
+def encode(msg):
+    payload = zlib.compress(json.dumps(msg, separators=(',', ':')).encode(), 6)
+    return struct.pack('>I', len(payload)) + payload
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(4)
+    (length,) = struct.unpack('>I', header)
+    if length > MAX_FRAME:
+        raise ValueError(f"frame of {length} bytes exceeds limit")
+    return json.loads(zlib.decompress(await reader.readexactly(length)))
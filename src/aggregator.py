@@ -0,0 +1,118 @@
+# aggregator.py
+# Central end of the collector-agent setup. Agents connect, receive their
+# shard of the hosts table and push compressed result batches; each batch is
+# evaluated and stored through probe_engine.finish_batch, then acknowledged.
+# Agents must present the shared token in their hello before anything is sent
+# or stored.
+# Run: python aggregator.py --token SECRET [--bind 127.0.0.1] [--port 9500]
+import argparse
+import asyncio
+import hmac
+import logging
+import os
+import zlib
+
+import agent_protocol
+import database
+import probe_engine
+
+log = logging.getLogger("netpulse.aggregator")
+
+
+class Aggregator:
+    def __init__(self, host='127.0.0.1', port=agent_protocol.DEFAULT_PORT, window=4, token=None):
+        self.host = host
+        self.port = port
+        self.window = window  # batches an agent may have in flight before waiting for acks
+        self.token = token    # shared secret agents send in their hello; None accepts any agent
+        self.ingested = 0
+        self.duplicates = 0
+        self.rejected = 0     # connections closed for a bad token or a malformed frame
+        self.agents = {}  # agent_id -> (shard, shards)
+        self._server = None
+        self._write_lock = None
+
+    def shard_hosts(self, shard, shards):
+        return [(host, group_id) for _, host, group_id, _ in database.list_hosts()
+                if agent_protocol.shard_of(host, shards) == shard]
+
+    def _ingest(self, agent_id, seq, results):
+        # SQLite has a single writer; this also keeps ingest and progress atomic
+        if seq <= database.get_agent_seq(agent_id):
+            self.duplicates += 1
+            return
+        probe_engine.finish_batch(results, agent_progress=(agent_id, seq))
+        self.ingested += len(results)
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info('peername')
+        agent_id = None
+        try:
+            hello = await agent_protocol.read_frame(reader)
+            if hello.get('type') != 'hello':
+                return
+            if self.token is not None and not hmac.compare_digest(str(hello.get('token', '')), self.token):
+                self.rejected += 1
+                log.warning("rejected agent %r from %s: bad token", hello.get('agent_id'), peer)
+                writer.write(agent_protocol.encode({'type': 'error', 'error': 'unauthorized'}))
+                await writer.drain()
+                return
+            agent_id = hello['agent_id']
+            shard, shards = int(hello['shard']), int(hello['shards'])
+            self.agents[agent_id] = (shard, shards)
+            hosts = await loop.run_in_executor(None, self.shard_hosts, shard, shards)
+            last_seq = await loop.run_in_executor(None, database.get_agent_seq, agent_id)
+            writer.write(agent_protocol.encode({'type': 'welcome', 'last_seq': last_seq,
+                                                'hosts': hosts, 'window': self.window}))
+            await writer.drain()
+            while True:
+                msg = await agent_protocol.read_frame(reader)
+                if msg.get('type') != 'batch':
+                    continue
+                # frames are handled one at a time, so a slow database stops us
+                # reading and the agent's send window fills: that is the backpressure
+                async with self._write_lock:
+                    await loop.run_in_executor(None, self._ingest, agent_id, msg['seq'], msg['results'])
+                writer.write(agent_protocol.encode({'type': 'ack', 'seq': msg['seq']}))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, KeyError, TypeError, AttributeError, zlib.error) as e:
+            # a malformed frame (json.JSONDecodeError is a ValueError): drop this agent only
+            self.rejected += 1
+            log.warning("closing agent %r from %s: malformed frame: %r", agent_id, peer, e)
+        finally:
+            self.agents.pop(agent_id, None)
+            writer.close()
+
+    async def start(self):
+        self._write_lock = asyncio.Lock()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="NetPulse result aggregator")
+    parser.add_argument('--bind', default='127.0.0.1',
+                        help="address to listen on; use 0.0.0.0 to accept remote agents")
+    parser.add_argument('--port', type=int, default=agent_protocol.DEFAULT_PORT)
+    parser.add_argument('--token', default=os.environ.get('NETPULSE_AGENT_TOKEN'),
+                        help="shared secret agents must send (default: $NETPULSE_AGENT_TOKEN)")
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("a shared --token (or NETPULSE_AGENT_TOKEN) is required")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    database.init_db()
+    log.info("Aggregator listening on %s:%s", args.bind, args.port)
+    asyncio.run(Aggregator(args.bind, args.port, token=args.token).serve_forever())
@@ -0,0 +1,295 @@
+# alert_pipeline.py
+# Turns per-sweep alerts into firing/resolved transitions (each alert is raised
+# once, not on every sweep) and fans them out to notification sinks from a
+# background asyncio loop. Probe threads only touch an in-memory dict and a
+# bounded queue, so a flood of alerts during an outage never blocks them.
+import asyncio
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import database
+
+
+class AlertTracker:
+    """Keeps the state of every (host, rule) pair seen firing."""
+
+    def __init__(self):
+        self._active = {}  # host -> {rule: event dict}
+        self._lock = threading.Lock()
+
+    def process(self, results):
+        """results: probe results carrying 'alert_list'. Returns the transitions."""
+        events = []
+        now = time.time()
+        with self._lock:
+            for r in results:
+                host = r['host']
+                current = {rule: msg for rule, msg in r.get('alert_list', [])}
+                host_active = self._active.get(host)
+                if not current and not host_active:
+                    continue
+                if host_active is None:
+                    host_active = self._active[host] = {}
+                for rule, msg in current.items():
+                    active = host_active.get(rule)
+                    if active is None:
+                        active = host_active[rule] = {'host': host, 'group_id': r.get('group_id'), 'rule': rule,
+                                                      'state': 'firing', 'message': msg, 'since': now,
+                                                      'timestamp': r.get('timestamp'), 'count': 1}
+                        events.append(dict(active))
+                    else:
+                        active['count'] += 1
+                        active['message'] = msg
+                # anything active for this host that did not fire this time has cleared
+                for rule in [k for k in host_active if k not in current]:
+                    active = host_active.pop(rule)
+                    events.append(dict(active, state='resolved', timestamp=r.get('timestamp'),
+                                       duration=now - active['since']))
+                if not host_active:
+                    del self._active[host]
+        return events
+
+    def active(self):
+        with self._lock:
+            return [dict(a) for rules in self._active.values() for a in rules.values()]
+
+
+def format_event(e):
+    return f"[{e['state'].upper()}] {e['host']} {e['message']}"
+
+
+class WebhookSink:
+    """POSTs a JSON batch over one keep-alive HTTP/1.1 connection (meant for a local receiver)."""
+
+    def __init__(self, url, timeout=5.0):
+        parts = urlsplit(url)
+        if parts.scheme != 'http':
+            raise ValueError("only http:// webhooks are supported")
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 80
+        self.path = parts.path or '/'
+        self.timeout = timeout
+        self._reader = self._writer = None
+
+    async def _connect(self):
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def _post(self, body):
+        await self._connect()
+        self._writer.write((f"POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                            f"Connection: keep-alive\r\n\r\n").encode() + body)
+        await self._writer.drain()
+        status = await self._reader.readline()
+        length = 0
+        keep_alive = True
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value.strip())
+            elif name.strip().lower() == 'connection' and value.strip().lower() == 'close':
+                keep_alive = False
+        if length:
+            await self._reader.readexactly(length)
+        if not keep_alive:
+            await self.close()
+        if not status.split(b' ')[1:2] or not status.split(b' ')[1].startswith(b'2'):
+            raise IOError(f"webhook returned {status.strip()!r}")
+
+    async def send(self, events):
+        body = json.dumps({'source': 'NetPulse', 'alerts': events}).encode()
+        try:
+            await asyncio.wait_for(self._post(body), self.timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            # stale keep-alive connection: reconnect once
+            await self.close()
+            await asyncio.wait_for(self._post(body), self.timeout)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class SyslogSink:
+    """RFC 5424 messages over UDP, one datagram per event, one socket for the sink's lifetime."""
+
+    def __init__(self, address='127.0.0.1:514', facility=16):
+        host, _, port = address.partition(':')
+        self.addr = (host or '127.0.0.1', int(port or 514))
+        self.facility = facility  # local0
+        self._transport = None
+        self._hostname = socket.gethostname()
+
+    async def send(self, events):
+        if self._transport is None:
+            loop = asyncio.get_running_loop()
+            self._transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol,
+                                                                     remote_addr=self.addr)
+        for e in events:
+            severity = 4 if e['state'] == 'firing' else 6  # warning / informational
+            msg = (f"<{self.facility * 8 + severity}>1 {time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())} "
+                   f"{self._hostname} NetPulse - - - {format_event(e)}")
+            self._transport.sendto(msg.encode())
+
+    async def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+
+class FileSink:
+    """Appends one JSON line per event; the write runs off the event loop."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+
+    def _write(self, lines):
+        if self._fh is None:
+            self._fh = open(self.path, 'a', encoding='utf-8')
+        self._fh.write(lines)
+        self._fh.flush()
+
+    async def send(self, events):
+        lines = "".join(json.dumps(e) + "\n" for e in events)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, lines)
+
+    async def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+SINK_TYPES = {'webhook': WebhookSink, 'syslog': SyslogSink, 'file': FileSink}
+
+
+def sink_from_config(kind, target):
+    return SINK_TYPES[kind](target)
+
+
+class NotificationDispatcher:
+    """Bounded, batching fan-out. submit() never blocks: when the queue is full
+    the event is dropped and counted."""
+
+    def __init__(self, sinks=(), max_queue=10000, batch_size=200, batch_interval=1.0):
+        self.sinks = list(sinks)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self._loop = asyncio.new_event_loop()
+        self._queue = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(self.max_queue)
+        self._ready.set()
+        self._loop.run_until_complete(self._consume())
+
+    def _enqueue(self, events):
+        for e in events:
+            try:
+                self._queue.put_nowait(e)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    def submit(self, events):
+        self._loop.call_soon_threadsafe(self._enqueue, list(events))
+
+    def set_sinks(self, sinks):
+        old = self.sinks
+        self.sinks = list(sinks)
+        for sink in old:
+            asyncio.run_coroutine_threadsafe(sink.close(), self._loop)
+
+    async def _consume(self):
+        while True:
+            batch = [await self._queue.get()]
+            if batch[0] is None:
+                return
+            deadline = self._loop.time() + self.batch_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    self._queue.put_nowait(None)
+                    break
+                batch.append(item)
+            results = await asyncio.gather(*(s.send(batch) for s in self.sinks), return_exceptions=True)
+            self.errors += sum(1 for r in results if isinstance(r, Exception))
+            self.sent += len(batch)
+
+    def stats(self):
+        return {'queued': self._queue.qsize(), 'sent': self.sent, 'dropped': self.dropped,
+                'errors': self.errors, 'sinks': len(self.sinks)}
+
+    def stop(self, timeout=5.0):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+        self._thread.join(timeout)
+        for sink in self.sinks:
+            try:
+                self._loop.run_until_complete(sink.close())
+            except Exception:
+                pass
+
+
+class AlertPipeline:
+    def __init__(self, dispatcher=None):
+        self.tracker = AlertTracker()
+        self.dispatcher = dispatcher or NotificationDispatcher()
+        self.sink_errors = []
+
+    def reload_sinks(self):
+        """Rebuilds the sinks from the database, skipping any that cannot be
+        set up. Returns a message per skipped sink (kept in sink_errors) for
+        the caller to show in its log."""
+        sinks, errors = [], []
+        for _, kind, target in database.list_sinks():
+            try:
+                sinks.append(sink_from_config(kind, target))
+            except Exception as e:
+                errors.append(f"Ignoring notification sink {kind}:{target}: {e}")
+        self.dispatcher.set_sinks(sinks)
+        self.sink_errors = errors
+        return errors
+
+    def process(self, results):
+        events = self.tracker.process(results)
+        if events and self.dispatcher.sinks:
+            self.dispatcher.submit(events)
+        return events
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = AlertPipeline()
+            try:
+                _pipeline.reload_sinks()
+            except Exception:
+                pass
+    return _pipeline
@@ -0,0 +1,330 @@
+# alerts.py
+# Batch alert evaluation over a whole sweep. Results are turned into NumPy
+# columns once and every rule is a vectorized comparison; thresholds come from
+# database.get_thresholds, which is cached, so there is no DB round trip per host.
+import threading
+import numpy as np
+import database
+import baseline
+from instrumentation import span
+
+# metric name -> how to read it from a probe result dict
+METRICS = {
+    'avg_latency': lambda r: r['stats'].get('avg_latency'),
+    'packet_loss': lambda r: r['stats'].get('packet_loss'),
+    'jitter': lambda r: r['stats'].get('jitter'),
+    'dns_time': lambda r: r.get('dns_time'),
+    'tcp_retrans_rate': lambda r: r.get('tcp_retrans_rate'),
+    'tcp_connect_ms': lambda r: r.get('tcp_connect_ms'),
+    'tls_handshake_ms': lambda r: r.get('tls_handshake_ms'),
+    'http_ttfb_ms': lambda r: r.get('http_ttfb_ms'),
+}
+
+
+SERVICE_TIMES = ('tcp_connect_ms', 'tls_handshake_ms', 'http_ttfb_ms')
+
+
+def _column(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _grown(array, size):
+    """'array' extended to 'size' with zeros for the new hosts."""
+    return np.concatenate([array, np.zeros(size - len(array), dtype=array.dtype)])
+
+
+class Sweep:
+    """Columnar view of one sweep's results shared by all rules."""
+
+    def __init__(self, results, host_index):
+        self.results = results
+        self.hosts = [r['host'] for r in results]
+        self.idx = np.array([host_index(h) for h in self.hosts], dtype=np.int64)
+        self._columns = {}
+        self._thresholds = {}
+
+    def __len__(self):
+        return len(self.results)
+
+    def metric(self, name):
+        if name not in self._columns:
+            getter = METRICS[name]
+            self._columns[name] = _column(getter(r) for r in self.results)
+        return self._columns[name]
+
+    def service_reachable(self):
+        """Mask of hosts with service checks (probe_engine.probe_services) of
+        which at least one succeeded: up, whatever ICMP says."""
+        if 'service_reachable' not in self._columns:
+            self._columns['service_reachable'] = np.array(
+                [bool(r.get('services')) and any(r.get(k) is not None for k in SERVICE_TIMES)
+                 for r in self.results], dtype=bool)
+        return self._columns['service_reachable']
+
+    def epochs(self):
+        if 'epoch' not in self._columns:
+            self._columns['epoch'] = _column(r.get('epoch') or baseline.to_epoch(r['timestamp'])
+                                             for r in self.results)
+        return self._columns['epoch']
+
+    def threshold(self, key):
+        if key not in self._thresholds:
+            with span('alerts.thresholds'):
+                self._thresholds[key] = self._load_threshold(key)
+        return self._thresholds[key]
+
+    def _load_threshold(self, key):
+        per_group = {}
+        for r in self.results:
+            gid = r.get('group_id')
+            if gid not in per_group:
+                per_group[gid] = database.get_thresholds(gid) if gid else dict(database.DEFAULT_THRESHOLDS)
+        return _column(per_group[r.get('group_id')].get(key) for r in self.results)
+
+
+class Rule:
+    name = 'rule'
+
+    def fired(self, sweep):
+        """Returns a boolean mask over the sweep."""
+        raise NotImplementedError
+
+    def message(self, sweep, i):
+        raise NotImplementedError
+
+    def grow(self, size):
+        """Called when new hosts are registered so per-host state can be resized."""
+        pass
+
+
+class ThresholdRule(Rule):
+    def __init__(self, metric, threshold_key, label, unit, unless_service_reachable=False):
+        self.name = f"{metric}>{threshold_key}"
+        self.metric = metric
+        self.threshold_key = threshold_key
+        self.label = label
+        self.unit = unit
+        # for ICMP-only metrics: hosts that drop ping but answer a service check are up
+        self.unless_service_reachable = unless_service_reachable
+
+    def fired(self, sweep):
+        values = sweep.metric(self.metric)
+        limits = sweep.threshold(self.threshold_key)
+        with np.errstate(invalid='ignore'):
+            out = values > limits  # NaN on either side never fires
+        if self.unless_service_reachable:
+            out &= ~sweep.service_reachable()
+        return out
+
+    def message(self, sweep, i):
+        value = sweep.metric(self.metric)[i]
+        limit = sweep.threshold(self.threshold_key)[i]
+        return f"{self.label} {value:.1f}{self.unit} > {limit:g}{self.unit}"
+
+
+class SustainedRule(Rule):
+    """Fires when the inner rule fired in at least n of the host's last m sweeps."""
+
+    def __init__(self, inner, n=3, m=5):
+        if not 0 < n <= m <= 64:
+            raise ValueError("need 0 < n <= m <= 64")
+        self.name = f"sustained({inner.name},{n}/{m})"
+        self.inner = inner
+        self.n = n
+        self.m = m
+        self._mask = np.uint64((1 << m) - 1)
+        self._history = np.zeros(0, dtype=np.uint64)
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    def grow(self, size):
+        self.inner.grow(size)
+        if size > len(self._history):
+            self._history = _grown(self._history, size)
+            self._counts = _grown(self._counts, size)
+
+    def fired(self, sweep):
+        hit = self.inner.fired(sweep).astype(np.uint64)
+        h = ((self._history[sweep.idx] << np.uint64(1)) | hit) & self._mask
+        self._history[sweep.idx] = h
+        counts = np.unpackbits(h.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        self._counts[sweep.idx] = counts
+        return counts >= self.n
+
+    def message(self, sweep, i):
+        return f"Sustained: {self.inner.message(sweep, i)} in {self._counts[sweep.idx[i]]}/{self.m} sweeps"
+
+
+class BaselineDeviationRule(Rule):
+    """Per-host EWMA mean/variance; fires when a value is more than k standard
+    deviations above the host's own baseline. State is updated after the check."""
+
+    def __init__(self, metric, label, unit, k=4.0, alpha=0.1, min_samples=30, min_delta=5.0):
+        self.name = f"baseline({metric})"
+        self.metric = metric
+        self.label = label
+        self.unit = unit
+        self.k = k
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.min_delta = min_delta  # ignore deviations too small to matter on quiet links
+        self._mean = np.zeros(0)
+        self._var = np.zeros(0)
+        self._n = np.zeros(0, dtype=np.int64)
+
+    def grow(self, size):
+        if size > len(self._n):
+            self._mean = _grown(self._mean, size)
+            self._var = _grown(self._var, size)
+            self._n = _grown(self._n, size)
+
+    def fired(self, sweep):
+        x = sweep.metric(self.metric)
+        idx = sweep.idx
+        mean, var, n = self._mean[idx], self._var[idx], self._n[idx]
+        sd = np.sqrt(var)
+        valid = ~np.isnan(x)
+        with np.errstate(invalid='ignore'):
+            out = valid & (n >= self.min_samples) & (x - mean > np.maximum(self.k * sd, self.min_delta))
+        self._last = (mean.copy(), sd)
+        # EWMA update (first sample seeds the mean); a missing sample leaves
+        # the host's state as it was instead of decaying its variance
+        d = np.where(valid, x - mean, 0.0)
+        first = valid & (n == 0)
+        new_mean = np.where(first, np.nan_to_num(x), mean + self.alpha * d)
+        new_var = np.where(first, 0.0, np.where(valid, (1 - self.alpha) * (var + self.alpha * d * d), var))
+        self._mean[idx] = new_mean
+        self._var[idx] = new_var
+        self._n[idx] = n + valid
+        return out
+
+    def message(self, sweep, i):
+        mean, sd = self._last
+        return (f"{self.label} {sweep.metric(self.metric)[i]:.1f}{self.unit} deviates from baseline "
+                f"{mean[i]:.1f}±{sd[i]:.1f}{self.unit}")
+
+
+class ServiceDownRule(Rule):
+    """Fires for each configured service check (r['services'], set by
+    probe_engine.probe_services) that failed or got an HTTP error status."""
+    name = 'service_down'
+
+    def __init__(self):
+        self._found = {}
+
+    def fired(self, sweep):
+        mask = np.zeros(len(sweep), dtype=bool)
+        self._found = {}
+        for i, r in enumerate(sweep.results):
+            services = r.get('services')
+            if not services:
+                continue
+            tcp_port, tls_port, http_url = services
+            failed = []
+            if tcp_port and r.get('tcp_connect_ms') is None:
+                failed.append(f"TCP {tcp_port}")
+            if tls_port and r.get('tls_handshake_ms') is None:
+                failed.append(f"TLS {tls_port}")
+            if http_url:
+                status = r.get('http_status')
+                if r.get('http_ttfb_ms') is None:
+                    failed.append("HTTP")
+                elif status is None or status >= 500:
+                    failed.append(f"HTTP {status or 'bad response'}")
+            if failed:
+                mask[i] = True
+                self._found[i] = failed
+        return mask
+
+    def message(self, sweep, i):
+        return f"Service down: {', '.join(self._found[i])}"
+
+
+class SeasonalBaselineRule(Rule):
+    """Compares each value against the host's hour-of-week baseline kept by
+    baseline.BaselineDetector, feeding the sample into it at the same time."""
+
+    def __init__(self, metric, label, unit, detector=None):
+        self.name = f"seasonal({metric})"
+        self.metric = metric
+        self.label = label
+        self.unit = unit
+        self.detector = detector
+        self._found = {}
+
+    def fired(self, sweep):
+        detector = self.detector or baseline.get_detector()
+        self._found = detector.update_many(sweep.hosts, self.metric, sweep.epochs(), sweep.metric(self.metric))
+        mask = np.zeros(len(sweep), dtype=bool)
+        mask[list(self._found)] = True
+        return mask
+
+    def message(self, sweep, i):
+        hit = self._found[i]
+        return (f"{self.label} {hit['value']:.1f}{self.unit} unusual for this hour "
+                f"(baseline {hit['mean']:.1f}±{hit['stdev']:.1f}{self.unit})")
+
+
+def default_rules():
+    return [
+        ThresholdRule('avg_latency', 'max_latency', 'Latency', 'ms'),
+        ThresholdRule('packet_loss', 'max_packet_loss', 'PacketLoss', '%', unless_service_reachable=True),
+        ThresholdRule('jitter', 'max_jitter', 'Jitter', 'ms'),
+        ThresholdRule('dns_time', 'max_dns_time', 'DNS', 'ms'),
+        ThresholdRule('tcp_retrans_rate', 'max_retrans_rate', 'Retrans', '%'),
+        ThresholdRule('tcp_connect_ms', 'max_tcp_connect', 'TCP connect', 'ms'),
+        ThresholdRule('tls_handshake_ms', 'max_tls_handshake', 'TLS handshake', 'ms'),
+        ThresholdRule('http_ttfb_ms', 'max_http_ttfb', 'HTTP TTFB', 'ms'),
+        ServiceDownRule(),
+        SeasonalBaselineRule('avg_latency', 'Latency', 'ms'),
+        SeasonalBaselineRule('jitter', 'Jitter', 'ms'),
+    ]
+
+
+class AlertEvaluator:
+    def __init__(self, rules=None):
+        self.rules = rules if rules is not None else default_rules()
+        self._hosts = {}
+        self._lock = threading.Lock()  # manual tests and scheduled jobs share one evaluator
+
+    def add_rule(self, rule):
+        with self._lock:
+            rule.grow(len(self._hosts))
+            self.rules.append(rule)
+
+    def _host_index(self, host):
+        i = self._hosts.get(host)
+        if i is None:
+            i = self._hosts[host] = len(self._hosts)
+        return i
+
+    def evaluate(self, results):
+        """results: list of probe result dicts (see probe_engine.probe_host).
+        Returns a list, aligned with results, of [(rule_name, message), ...]."""
+        if not results:
+            return []
+        with self._lock:
+            sweep = Sweep(results, self._host_index)
+            for rule in self.rules:
+                rule.grow(len(self._hosts))
+            out = [[] for _ in results]
+            for rule in self.rules:
+                for i in np.flatnonzero(rule.fired(sweep)):
+                    out[i].append((rule.name, rule.message(sweep, i)))
+        return out
+
+
+def alerts_text(alerts):
+    return "; ".join(msg for _, msg in alerts)
+
+
+_evaluator = None
+_evaluator_lock = threading.Lock()
+
+
+def get_evaluator():
+    """Process-wide evaluator so per-host rule state survives across sweeps and jobs."""
+    global _evaluator
+    with _evaluator_lock:
+        if _evaluator is None:
+            _evaluator = AlertEvaluator()
+    return _evaluator
@@ -0,0 +1,318 @@
+# archive.py
+# Cold storage for old results. Whole days older than ARCHIVE_AFTER_DAYS move
+# out of SQLite into Arrow IPC files, one per UTC day and group:
+#     <db folder>/archive/<YYYY-MM-DD>/group-<id|none>.arrow
+# Hosts and alert texts are dictionary-encoded. Files are left uncompressed so
+# reads can memory-map them: a query only pages in the partitions its date and
+# group filters select, and only the columns it asks for.
+# pyarrow is optional; without it nothing is archived and queries see SQLite only.
+import itertools
+import os
+import threading
+from datetime import datetime, timedelta
+
+import database
+
+ARCHIVE_AFTER_DAYS = 30
+_lock = threading.Lock()
+
+
+def available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def configure(after_days):
+    global ARCHIVE_AFTER_DAYS
+    ARCHIVE_AFTER_DAYS = int(after_days)
+
+
+def archive_dir():
+    return os.path.join(os.path.dirname(database.DB_FILE), "archive")
+
+
+def _schema():
+    import pyarrow as pa
+    types = {'id': pa.int64(), 'host': pa.dictionary(pa.int32(), pa.string()), 'group_id': pa.int64(),
+             'timestamp': pa.timestamp('s'), 'traceroute': pa.string(),
+             'alerts': pa.dictionary(pa.int32(), pa.string()), 'http_status': pa.int32()}
+    return pa.schema([(c, types.get(c, pa.float64())) for c in database.RESULT_COLUMNS])
+
+
+def _partition_path(day, group_id):
+    return os.path.join(archive_dir(), day, f"group-{'none' if group_id is None else group_id}.arrow")
+
+
+def _partitions(start_ts=None, end_ts=None, group_ids=None):
+    """(day, group_id, path) for partitions that can hold matching rows."""
+    root = archive_dir()
+    if not os.path.isdir(root):
+        return
+    wanted = set(group_ids) if group_ids else None
+    for day in sorted(os.listdir(root)):
+        if (start_ts and day < start_ts[:10]) or (end_ts and day > end_ts[:10]):
+            continue
+        for name in sorted(os.listdir(os.path.join(root, day))):
+            if not (name.startswith("group-") and name.endswith(".arrow")):
+                continue
+            gid = name[6:-6]
+            gid = None if gid == 'none' else int(gid)
+            if wanted is None or gid in wanted:
+                yield day, gid, os.path.join(root, day, name)
+
+
+def _to_table(rows):
+    """Raises ValueError if a timestamp does not parse: the rows are deleted
+    from SQLite once archived, so nothing may be dropped on the way."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    schema = _schema()
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(schema, columns):
+        if field.name == 'timestamp':
+            raw = pa.array(values, pa.string())
+            parsed = pc.strptime(raw, format='%Y-%m-%d %H:%M:%S', unit='s', error_is_null=True)
+            if parsed.null_count != raw.null_count:
+                bad = raw.filter(pc.and_(pc.is_null(parsed), pc.is_valid(raw)))[0].as_py()
+                raise ValueError(f"{parsed.null_count - raw.null_count} timestamps not in "
+                                 f"'YYYY-MM-DD HH:MM:SS' form, e.g. {bad!r}")
+            arrays.append(parsed)
+        elif pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _read(path, columns=None):
+    import pyarrow as pa
+    # the table keeps the mapping alive; nothing is copied until a column is used
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.select(columns) if columns else table
+
+
+def _write_partition(path, table):
+    import pyarrow as pa
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        # late rows for an archived day: merge, skipping rows archived by an interrupted earlier run
+        old = _read(path)
+        import pyarrow.compute as pc
+        table = table.filter(pc.invert(pc.is_in(table['id'], value_set=old['id'])))
+        if not table.num_rows:
+            return
+        table = pa.concat_tables([old, table]).unify_dictionaries().combine_chunks()
+        table = table.sort_by([('timestamp', 'ascending'), ('id', 'ascending')])
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def archive_older_than(days=None, now=None):
+    """Moves results from whole UTC days older than 'days' into the archive,
+    one day per transaction. Returns the number of rows moved. A day with
+    rows that cannot be converted stays in SQLite untouched; the other days
+    are still moved, then ValueError names the days kept back."""
+    if not available():
+        return 0
+    days = ARCHIVE_AFTER_DAYS if days is None else days
+    cutoff = ((now or datetime.utcnow()) - timedelta(days=days)).strftime('%Y-%m-%d') + " 00:00:00"
+    cols = ", ".join(database.RESULT_COLUMNS)
+    moved = 0
+    kept = []
+    with _lock:
+        conn = database.get_conn()
+        try:
+            c = conn.cursor()
+            c.execute("SELECT DISTINCT substr(timestamp, 1, 10) FROM results WHERE timestamp < ?", (cutoff,))
+            for (day,) in sorted(c.fetchall()):
+                start = day + " 00:00:00"
+                end = (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d') + " 00:00:00"
+                c.execute(f"SELECT {cols} FROM results WHERE timestamp >= ? AND timestamp < ? "
+                          "ORDER BY group_id, timestamp, id", (start, end))
+                by_group = {}
+                for row in c.fetchall():
+                    by_group.setdefault(row[2], []).append(row)
+                # convert the whole day before writing any of it
+                try:
+                    tables = {group_id: _to_table(rows) for group_id, rows in by_group.items()}
+                except ValueError as e:
+                    kept.append(f"{day} ({e})")
+                    continue
+                # files first: if we stop before the delete, the next run skips the ids already archived
+                for group_id, table in tables.items():
+                    _write_partition(_partition_path(day, group_id), table)
+                    moved += table.num_rows
+                # only the rows just written: others for this day may have been saved meanwhile
+                c.executemany("DELETE FROM results WHERE id = ?",
+                              ((i,) for rows in by_group.values() for i in (row[0] for row in rows)))
+                conn.commit()
+        finally:
+            conn.close()
+    if kept:
+        raise ValueError(f"archived {moved} results; kept in SQLite: {'; '.join(kept)}")
+    return moved
+
+
+def read(start_ts=None, end_ts=None, group_ids=None, columns=None, ordered=True, host=None, alerts_only=False):
+    """Archived rows as one pyarrow Table ordered by (timestamp, id), or None.
+    Aggregations pass ordered=False to skip the sort. host / alerts_only
+    filter like database.query_page."""
+    if not available():
+        return None
+    wanted = list(columns or database.RESULT_COLUMNS)
+    needed = wanted + [c for c in ('timestamp', 'id') if c not in wanted]
+    needed += [c for c, on in (('host', host), ('alerts', alerts_only)) if on and c not in needed]
+    table = _concat([_filter(_clip(_read(path, needed), day, start_ts, end_ts), host, alerts_only)
+                     for day, _, path in _partitions(start_ts, end_ts, group_ids)])
+    if table is None:
+        return None
+    if ordered:
+        table = table.sort_by([('timestamp', 'ascending'), ('id', 'ascending')])
+    return table.select(wanted)
+
+
+def _ts(value):
+    import pyarrow as pa
+    return pa.scalar(datetime.fromisoformat(value[:19]) if isinstance(value, str) else value, pa.timestamp('s'))
+
+
+def _clip(table, day, start_ts, end_ts):
+    """Only the first and last day of a range need a row filter."""
+    import pyarrow.compute as pc
+    if start_ts and day == start_ts[:10]:
+        table = table.filter(pc.greater_equal(table['timestamp'], _ts(start_ts)))
+    if end_ts and day == end_ts[:10]:
+        table = table.filter(pc.less_equal(table['timestamp'], _ts(end_ts)))
+    return table
+
+
+def _filter(table, host, alerts_only):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    if host:
+        table = table.filter(pc.equal(table['host'].cast(pa.string()), host))
+    if alerts_only:
+        alerts = table['alerts'].cast(pa.string())
+        table = table.filter(pc.and_(pc.is_valid(alerts), pc.not_equal(alerts, '')))
+    return table
+
+
+def _concat(tables):
+    import pyarrow as pa
+    tables = [t for t in tables if t.num_rows]
+    if not tables:
+        return None
+    if len(tables) == 1:
+        return tables[0]
+    # one dictionary per column across partitions, as grouping and sorting need
+    return pa.concat_tables(tables, promote_options='permissive').unify_dictionaries()
+
+
+def page(start_ts, end_ts, group_ids, host, alerts_only, after, limit, columns):
+    """Archived part of database.query_page: up to 'limit' rows after the
+    (timestamp, id) key 'after', ordered by it. Reads a day at a time and
+    stops as soon as the page is full."""
+    if not available():
+        return []
+    import pyarrow.compute as pc
+    needed = list(columns) + [c for c in ('host', 'alerts') if c not in columns]
+    lo = max(start_ts or "", after[0] if after else "") or None
+    rows = []
+    for day, parts in itertools.groupby(_partitions(lo, end_ts, group_ids), key=lambda p: p[0]):
+        table = _concat([_filter(_clip(_read(path, needed), day, start_ts, end_ts), host, alerts_only)
+                         for _, _, path in parts])
+        if table is None:
+            continue
+        if after and day == after[0][:10]:
+            ts, key = table['timestamp'], _ts(after[0])
+            table = table.filter(pc.or_(pc.greater(ts, key),
+                                        pc.and_(pc.equal(ts, key), pc.greater(table['id'], after[1]))))
+        table = table.sort_by([('timestamp', 'ascending'), ('id', 'ascending')]).slice(0, limit - len(rows))
+        rows.extend(zip(*(_pylist(table[name]) for name in columns)))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def _pylist(col):
+    """Column to Python values. Repetitive columns (hosts, alert texts and the
+    timestamps shared by a sweep) are converted once per distinct value."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    col = col.combine_chunks()
+    if pa.types.is_timestamp(col.type):
+        col = col.dictionary_encode()
+        col = pa.DictionaryArray.from_arrays(col.indices, pc.strftime(col.dictionary, format='%Y-%m-%d %H:%M:%S'))
+    if pa.types.is_dictionary(col.type):
+        values = col.dictionary.to_pylist()
+        return [None if i is None else values[i] for i in col.indices.to_pylist()]
+    return col.to_pylist()
+
+
+def read_rows(start_ts=None, end_ts=None, group_ids=None, columns=None):
+    """Archived rows as tuples in the column order of database.query_results."""
+    table = read(start_ts, end_ts, group_ids, columns)
+    if table is None:
+        return []
+    return list(zip(*(_pylist(table[name]) for name in table.column_names)))
+
+
+def summarize(start_ts=None, end_ts=None, group_ids=None, host=None, alerts_only=False):
+    """Per-host partial aggregates of archived rows, laid out like the rows of
+    database._SUMMARY_SQL so the two can be merged."""
+    table = read(start_ts, end_ts, group_ids, ['host', 'group_id', 'timestamp', 'avg_latency', 'min_latency',
+                                               'max_latency', 'packet_loss', 'jitter', 'tcp_retrans_rate', 'alerts'],
+                 ordered=False, host=host, alerts_only=alerts_only)
+    if table is None:
+        return []
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    alerts = table['alerts'].cast(pa.string())
+    alerted = pc.and_(pc.is_valid(alerts), pc.not_equal(alerts, '')).fill_null(False).cast(pa.int64())
+    table = table.append_column('alerted', alerted)
+    g = table.group_by('host').aggregate([
+        ('group_id', 'max'), ('timestamp', 'count', pc.CountOptions(mode='all')),
+        ('avg_latency', 'count'), ('avg_latency', 'sum'), ('min_latency', 'min'), ('max_latency', 'max'),
+        ('avg_latency', 'tdigest', pc.TDigestOptions(q=[0.5, 0.95])),
+        ('packet_loss', 'count'), ('packet_loss', 'sum'), ('packet_loss', 'max'),
+        ('jitter', 'count'), ('jitter', 'sum'), ('tcp_retrans_rate', 'count'), ('tcp_retrans_rate', 'sum'),
+        ('alerted', 'sum'), ('timestamp', 'min'), ('timestamp', 'max')])
+    col = {name: _pylist(g[name]) for name in g.column_names}
+    digests = [d if d else [None, None] for d in col['avg_latency_tdigest']]
+    return list(zip(col['host'], col['group_id_max'], col['timestamp_count'],
+                    col['avg_latency_count'], col['avg_latency_sum'], col['min_latency_min'], col['max_latency_max'],
+                    [d[0] for d in digests], [d[1] for d in digests],
+                    col['packet_loss_count'], col['packet_loss_sum'], col['packet_loss_max'],
+                    col['jitter_count'], col['jitter_sum'], col['tcp_retrans_rate_count'],
+                    col['tcp_retrans_rate_sum'], col['alerted_sum'], col['timestamp_min'], col['timestamp_max']))
+
+
+def latency_series(start_ts, end_ts, group_ids, start, points, span, host=None, alerts_only=False):
+    """Archived part of database.latency_series, bucketed the same way:
+    (host, bucket, latency sum, latency count, first timestamp) partials."""
+    table = read(start_ts, end_ts, group_ids, ['host', 'timestamp', 'avg_latency'], ordered=False,
+                 host=host, alerts_only=alerts_only)
+    if table is None:
+        return []
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    epoch = table['timestamp'].cast(pa.int64())
+    bucket = pc.divide(pc.multiply(pc.subtract(epoch, start), points), span)
+    g = table.append_column('bucket', bucket).group_by(['host', 'bucket']).aggregate(
+        [('avg_latency', 'sum'), ('avg_latency', 'count'), ('timestamp', 'min')])
+    return list(zip(_pylist(g['host']), _pylist(g['bucket']), _pylist(g['avg_latency_sum']),
+                    _pylist(g['avg_latency_count']), _pylist(g['timestamp_min'])))
+
+
+def stats():
+    files = list(_partitions())
+    size = sum(os.path.getsize(path) for _, _, path in files)
+    days = sorted({day for day, _, _ in files})
+    return {'partitions': len(files), 'bytes': size, 'first_day': days[0] if days else None,
+            'last_day': days[-1] if days else None}
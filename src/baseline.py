@@ -0,0 +1,176 @@
+# baseline.py
+# Streaming per-host baselines: for every host, metric and hour-of-week slot we
+# keep an EWMA mean/variance and a small t-digest. Updates are O(1) amortized,
+# state is persisted compactly in the host_baselines table and restored on start.
+import math
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+import database
+from tdigest import TDigest
+
+METRICS = ('avg_latency', 'jitter')
+SLOTS = 168  # hours in a week, Monday 00:00 UTC is slot 0
+
+
+def hour_of_week(epoch):
+    # 1970-01-01 was a Thursday, i.e. 72 hours after a Monday midnight
+    return (int(epoch) // 3600 + 72) % SLOTS
+
+
+def to_epoch(ts):
+    if isinstance(ts, (int, float)):
+        return ts
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class BaselineDetector:
+    """Flags a sample when it is more than k standard deviations above the slot's
+    EWMA mean and above the slot's p99. Needs min_samples in the slot first.
+
+    Each (host, metric, slot) owns one row of the n/mean/var arrays and one
+    t-digest, so a sweep is gathered, tested and written back with array ops."""
+
+    def __init__(self, alpha=0.05, k=3.0, quantile=0.99, min_samples=20, min_delta=5.0):
+        self.alpha = alpha
+        self.k = k
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delta = min_delta
+        self._rows = {}      # (host, metric, slot) -> row in the arrays below
+        self._n = np.zeros(1024, dtype=np.int64)
+        self._mean = np.zeros(1024)
+        self._var = np.zeros(1024)
+        self._digests = []
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _row(self, key, n=0, mean=0.0, var=0.0, digest=None):
+        """Row of 'key', allocated on first sight. Caller holds the lock."""
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = len(self._digests)
+            if row == len(self._n):
+                self._n, self._mean, self._var = (np.concatenate([a, np.zeros_like(a)])
+                                                  for a in (self._n, self._mean, self._var))
+            self._n[row], self._mean[row], self._var[row] = n, mean, var
+            self._digests.append(digest or TDigest())
+        return row
+
+    def update(self, host, metric, epoch, value):
+        """Feeds one sample. Returns a description dict when it is anomalous, else None."""
+        if value is None or value != value:
+            return None
+        key = (host, metric, hour_of_week(epoch))
+        with self._lock:
+            row = self._row(key)
+            n, mean, var = int(self._n[row]), float(self._mean[row]), float(self._var[row])
+            anomaly = None
+            if n >= self.min_samples:
+                sd = math.sqrt(var)
+                if value - mean > max(self.k * sd, self.min_delta):
+                    p = self._digests[row].quantile(self.quantile)
+                    if p is None or value > p:
+                        anomaly = {'host': host, 'metric': metric, 'value': value,
+                                   'mean': mean, 'stdev': sd, 'quantile': p}
+            if n == 0:
+                self._mean[row] = value
+            else:
+                d = value - mean
+                self._mean[row] = mean + self.alpha * d
+                self._var[row] = (1 - self.alpha) * (var + self.alpha * d * d)
+            self._n[row] = n + 1
+            self._digests[row].add(value)
+            self._dirty.add(key)
+        return anomaly
+
+    def update_many(self, hosts, metric, epochs, values):
+        """Feeds one sweep's samples of a metric; values may hold NaN for missing.
+        Returns {position: description} for the anomalous samples."""
+        values = np.asarray(values, dtype=np.float64)
+        slots = ((np.asarray(epochs, dtype=np.float64).astype(np.int64) // 3600 + 72) % SLOTS).tolist()
+        found = {}
+        with self._lock:
+            todo = np.flatnonzero(~np.isnan(values)).tolist()
+            while todo:
+                # a key repeated within the sweep goes to the next pass so it
+                # sees the update of its earlier sample
+                first, keys, repeats, seen = [], [], [], set()
+                for i in todo:
+                    key = (hosts[i], metric, slots[i])
+                    if key in seen:
+                        repeats.append(i)
+                    else:
+                        seen.add(key)
+                        first.append(i)
+                        keys.append(key)
+                rows = np.fromiter((self._row(key) for key in keys), dtype=np.int64, count=len(keys))
+                n, mean, var, v = self._n[rows], self._mean[rows], self._var[rows], values[first]
+                sd = np.sqrt(var)
+                candidates = (n >= self.min_samples) & (v - mean > np.maximum(self.k * sd, self.min_delta))
+                for j in np.flatnonzero(candidates).tolist():
+                    p = self._digests[rows[j]].quantile(self.quantile)
+                    if p is None or v[j] > p:
+                        found[first[j]] = {'host': keys[j][0], 'metric': metric, 'value': float(v[j]),
+                                           'mean': float(mean[j]), 'stdev': float(sd[j]), 'quantile': p}
+                d = v - mean
+                self._mean[rows] = np.where(n == 0, v, mean + self.alpha * d)
+                self._var[rows] = np.where(n == 0, var, (1 - self.alpha) * (var + self.alpha * d * d))
+                self._n[rows] = n + 1
+                digests = self._digests
+                for row, x in zip(rows.tolist(), v.tolist()):
+                    digests[row].add(x)
+                self._dirty.update(keys)
+                todo = repeats
+        return found
+
+    def stats(self, host, metric, epoch):
+        row = self._rows.get((host, metric, hour_of_week(epoch)))
+        if row is None:
+            return None
+        digest = self._digests[row]
+        return {'n': int(self._n[row]), 'mean': float(self._mean[row]), 'stdev': math.sqrt(self._var[row]),
+                'p50': digest.quantile(0.5), 'p99': digest.quantile(0.99)}
+
+    def load(self):
+        rows = database.load_baselines()
+        with self._lock:
+            for host, metric, slot, n, mean, var, blob in rows:
+                self._row((host, metric, slot), n, mean, var, TDigest.from_bytes(blob))
+            self._dirty.clear()
+        return len(rows)
+
+    def flush(self):
+        """Writes slots changed since the last flush."""
+        with self._lock:
+            rows = []
+            for key in self._dirty:
+                row = self._rows[key]
+                rows.append(key + (int(self._n[row]), float(self._mean[row]), float(self._var[row]),
+                                   self._digests[row].to_bytes()))
+            self._dirty.clear()
+        database.save_baselines(rows)
+        return len(rows)
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_detector():
+    """Process-wide detector, restored from the database on first use."""
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = BaselineDetector()
+            try:
+                _detector.load()
+            except Exception:
+                pass
+    return _detector
@@ -0,0 +1,570 @@
+# benchmarks.py
+# Benchmarks for the hot paths, run against probe_backend.SimulatedBackend and a
+# throwaway database so they never touch the network or netpulse.db (the
+# service_probes benchmark talks to servers it starts on localhost).
+# Run: python benchmarks.py [name ...] [--sizes 100,10000,100000] [--record FILE] [--compare FILE]
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DEFAULT_SIZES = (100, 10000, 100000)
+
+
+@contextlib.contextmanager
+def temp_database():
+    import database
+    old = database.DB_FILE
+    folder = tempfile.mkdtemp(prefix="netpulse-bench-")
+    database.DB_FILE = os.path.join(folder, "bench.db")
+    database.init_db()
+    database.invalidate_thresholds()
+    try:
+        yield database.DB_FILE
+    finally:
+        database.DB_FILE = old
+        database.invalidate_thresholds()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def simulated_network(seed=0, **params):
+    import probe_backend
+    import rate_limiter
+    previous = probe_backend.set_backend(probe_backend.SimulatedBackend(seed=seed, **params))
+    limiter = rate_limiter.stats()
+    rate_limiter.configure(rate=1e9, burst=1e9)
+    try:
+        yield
+    finally:
+        probe_backend.set_backend(previous)
+        rate_limiter.configure(rate=limiter['rate'], burst=limiter['burst'])
+
+
+def host_names(n):
+    return [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(n)]
+
+
+def fill_results(hosts, per_host=5, groups=4, span=timedelta(days=1), seed=0):
+    """Inserts synthetic results spread over 'span' ending now; returns the row count."""
+    import database
+    for g in range(groups):
+        database.add_group(f"bench{g}")
+    rnd = random.Random(seed)
+    names = host_names(hosts)
+    end = datetime.utcnow()
+    step = span / max(per_host, 1)
+    rows = []
+    for k in range(per_host):
+        ts = (end - span + step * k).isoformat(sep=' ', timespec='seconds')
+        for i, host in enumerate(names):
+            lat = rnd.lognormvariate(3, 0.3)
+            rows.append((host, i % groups + 1, ts, lat, 0.0, lat / 10, lat * 0.8, lat * 1.3, 12.0,
+                         "", 0.0, ""))
+            if len(rows) >= 20000:
+                database.save_results(rows)
+                rows = []
+    database.save_results(rows)
+    return hosts * per_host
+
+
+def bench_baseline(samples=200000, hosts=1000, seed=1):
+    """Streaming baseline detector throughput (one core) and t-digest accuracy."""
+    import baseline
+    from tdigest import TDigest
+    rnd = random.Random(seed)
+    det = baseline.BaselineDetector()
+    host_names = [f"10.0.{i // 256}.{i % 256}" for i in range(hosts)]
+    data = [(host_names[i % hosts], 1700000000 + i * 0.5, rnd.lognormvariate(3, 0.3)) for i in range(samples)]
+    start = time.perf_counter()
+    flagged = 0
+    for host, epoch, value in data:
+        if det.update(host, 'avg_latency', epoch, value):
+            flagged += 1
+    elapsed = time.perf_counter() - start
+
+    # the same stream fed a sweep at a time, as SeasonalBaselineRule does
+    batched = baseline.BaselineDetector()
+    sweeps = [data[i:i + hosts] for i in range(0, samples, hosts)]
+    start = time.perf_counter()
+    batch_flagged = 0
+    for sweep in sweeps:
+        names, epochs, values = zip(*sweep)
+        batch_flagged += len(batched.update_many(names, 'avg_latency', epochs, values))
+    batch_elapsed = time.perf_counter() - start
+
+    digest = TDigest()
+    values = [rnd.lognormvariate(3, 0.5) for _ in range(100000)]
+    for v in values:
+        digest.add(v)
+    values.sort()
+    errors = {q: abs(digest.quantile(q) - values[int(q * (len(values) - 1))]) / values[int(q * (len(values) - 1))]
+              for q in (0.5, 0.9, 0.99)}
+    return {'samples_per_sec': samples / elapsed, 'flagged': flagged,
+            'batch_samples_per_sec': samples / batch_elapsed, 'batch_matches': batch_flagged == flagged,
+            'digest_bytes': len(digest.to_bytes()),
+            'quantile_rel_error': {q: round(e, 4) for q, e in errors.items()}}
+
+
+def bench_ping_stats(samples=100000, loss=0.02, seed=2):
+    """RttAccumulator correctness against a two-pass reference and per-sample cost."""
+    import statistics
+    from stream_stats import RttAccumulator
+    rnd = random.Random(seed)
+    probes = [(rnd.gauss(40, 6), rnd.random() >= loss) for _ in range(samples)]
+    acc = RttAccumulator()
+    start = time.perf_counter()
+    for rtt, ok in probes:
+        acc.add(rtt, ok)
+    elapsed = time.perf_counter() - start
+    summary = acc.summary()
+
+    ok_rtts = [rtt for rtt, ok in probes if ok]
+    ok_rtts_sorted = sorted(ok_rtts)
+    # jitter against references that do not use the estimator's own update:
+    # the mean absolute difference of consecutive RTTs, which J averages to
+    # over a long stream, and a 5-ping probe alternating 10/30 ms, where every
+    # |D| is 20 ms so J = 20 * (1 - (15/16)**4) from a start of 0
+    mean_abs_diff = statistics.fmean(abs(b - a) for a, b in zip(ok_rtts, ok_rtts[1:]))
+    tracked, running = RttAccumulator(), []
+    for rtt in ok_rtts:
+        tracked.add(rtt)
+        running.append(tracked.jitter)
+    short = RttAccumulator()
+    for rtt in (10.0, 30.0, 10.0, 30.0, 10.0):
+        short.add(rtt)
+    checks = {
+        'mean': abs(summary['avg_latency'] - statistics.fmean(ok_rtts)) < 1e-9,
+        'stdev': abs(summary['stdev'] - statistics.stdev(ok_rtts)) < 1e-6,
+        'jitter_long_run': abs(statistics.fmean(running[1:]) - mean_abs_diff) < 0.02 * mean_abs_diff,
+        'jitter_short_probe': abs(short.jitter - 20.0 * (1 - (15 / 16) ** 4)) < 1e-9,
+        'mean_rtt_delta': abs(summary['mean_rtt_delta'] - mean_abs_diff) < 1e-9
+                          and short.mean_rtt_delta() == 20.0,
+        'loss': abs(summary['packet_loss'] - 100.0 * (1 - len(ok_rtts) / samples)) < 1e-9,
+        'p99': abs(summary['p99'] - ok_rtts_sorted[int(0.99 * (len(ok_rtts) - 1))]) < 0.5,
+    }
+    return {'ns_per_sample': elapsed / samples * 1e9, 'checks_passed': all(checks.values()), 'checks': checks}
+
+
+def bench_sweep(hosts):
+    """Full probe pipeline (probe, alert evaluation, batch save) on the simulator."""
+    import alerts
+    import probe_engine
+    with temp_database(), simulated_network():
+        targets = [(h, i % 4 + 1) for i, h in enumerate(host_names(hosts))]
+        start = time.perf_counter()
+        results = probe_engine.run_sweep(targets, batch_size=1000, evaluator=alerts.AlertEvaluator())
+        elapsed = time.perf_counter() - start
+    return {'hosts_per_sec': len(results) / elapsed, 'seconds': elapsed}
+
+
+def bench_rate_limit(hosts=60):
+    """Sweep speed on a simulator that really waits for ping RTTs, without a
+    limit and with the default rate limit, and the tokens each host costs."""
+    import alerts
+    import probe_engine
+    import rate_limiter
+    out = {}
+    targets = [(h, i % 4 + 1) for i, h in enumerate(host_names(hosts))]
+    for label, rate, burst in (('unlimited', 1e9, 1e9),
+                               ('default', rate_limiter.DEFAULT_RATE, rate_limiter.DEFAULT_BURST)):
+        # a fresh simulator each time, so both sweeps see the same replies and losses
+        with temp_database(), simulated_network(sleep=True):
+            rate_limiter.configure(rate=rate, burst=burst)
+            before = rate_limiter.stats()
+            start = time.perf_counter()
+            probe_engine.run_sweep(targets, batch_size=1000, evaluator=alerts.AlertEvaluator())
+            elapsed = time.perf_counter() - start
+            after = rate_limiter.stats()
+            out[label + '_hosts_per_sec'] = hosts / elapsed
+            out[label + '_wait_seconds'] = after['wait_time'] - before['wait_time']
+            out['tokens_per_host'] = (after['acquired'] - before['acquired']) / hosts
+    out['slowdown'] = out['unlimited_hosts_per_sec'] / out['default_hosts_per_sec']
+    return out
+
+
+def _self_signed_cert(folder):
+    """(certfile, keyfile) made with the openssl CLI, or None without it."""
+    cert, key = os.path.join(folder, "cert.pem"), os.path.join(folder, "key.pem")
+    try:
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+                       capture_output=True, check=True, timeout=60)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return cert, key
+
+
+def bench_service_probes(checks=200):
+    """TCP connect, TLS handshake and HTTP TTFB checks against asyncio servers
+    on localhost: correctness of each check (and of a refused port) and the
+    rate of concurrent checks."""
+    import asyncio
+    import ssl
+    import service_probes
+
+    async def accept(reader, writer):
+        writer.close()
+
+    async def http(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok")
+        await writer.drain()
+        writer.close()
+
+    async def main(folder):
+        tcp = await asyncio.start_server(accept, '127.0.0.1', 0, backlog=checks)
+        web = await asyncio.start_server(http, '127.0.0.1', 0, backlog=checks)
+        tls, tls_port = None, None
+        cert = _self_signed_cert(folder)
+        if cert:
+            server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            server_ctx.load_cert_chain(*cert)
+            tls = await asyncio.start_server(accept, '127.0.0.1', 0, ssl=server_ctx, backlog=checks)
+            tls_port = tls.sockets[0].getsockname()[1]
+        tcp_port = tcp.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{web.sockets[0].getsockname()[1]}/health"
+        # a port that was free a moment ago and is now closed
+        closed = await asyncio.start_server(accept, '127.0.0.1', 0)
+        closed_port = closed.sockets[0].getsockname()[1]
+        closed.close()
+        await closed.wait_closed()
+
+        out = {}
+        ctx = service_probes.tls_context()  # shared, as probe_many does
+        single = await service_probes.check_host('127.0.0.1', tcp_port, tls_port, url, ctx=ctx)
+        refused = await service_probes.tcp_connect('127.0.0.1', closed_port, timeout=2.0)
+        out['checks'] = {'tcp': single['tcp_connect_ms'] is not None,
+                         'tls': single['tls_handshake_ms'] is not None if tls else None,
+                         'http': single['http_ttfb_ms'] is not None and single['http_status'] == 200,
+                         'refused': refused is None}
+        start = time.perf_counter()
+        many = await asyncio.gather(*(service_probes.check_host('127.0.0.1', tcp_port, tls_port, url, ctx=ctx)
+                                      for _ in range(checks)))
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for m in many if m['tcp_connect_ms'] is None or m['http_status'] != 200
+                     or (tls and m['tls_handshake_ms'] is None))
+        out['hosts_per_sec'] = checks / elapsed
+        out['failed'] = failed
+        for server in filter(None, (tcp, web, tls)):
+            server.close()
+            await server.wait_closed()
+        return out
+
+    folder = tempfile.mkdtemp(prefix="netpulse-bench-")
+    try:
+        out = asyncio.run(main(folder))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    out['checks_passed'] = all(v is not False for v in out['checks'].values()) and not out['failed']
+    return out
+
+
+def bench_sharded_sweep(hosts, worker_counts=None):
+    """Sweep throughput with 1..cpu_count probe processes feeding the single
+    writer, plus the writer's own ceiling (finish_batch alone)."""
+    import alerts
+    import probe_engine
+    import sharded_probe
+    cpus = os.cpu_count() or 1
+    counts = worker_counts or sorted({1, 2, cpus} | {2 ** k for k in range(1, 8) if 2 ** k <= cpus})
+    out = {'cpus': cpus}
+    base = None
+    with simulated_network():
+        targets = [(h, i % 4 + 1) for i, h in enumerate(host_names(hosts))]
+        for workers in counts:
+            with temp_database():
+                prober = sharded_probe.ShardedProber(workers, batch_size=500)
+                prober.start()  # process start-up is not part of the sweep
+                try:
+                    start = time.perf_counter()
+                    results = prober.sweep(targets, evaluator=alerts.AlertEvaluator())
+                    elapsed = time.perf_counter() - start
+                finally:
+                    prober.close()
+            rate = len(results) / elapsed
+            base = base or rate
+            out[f'{workers}_workers'] = {'hosts_per_sec': rate, 'efficiency': rate / (base * workers)}
+        with temp_database():
+            start = time.perf_counter()
+            for i in range(0, len(results), 500):
+                probe_engine.finish_batch(results[i:i + 500], alerts.AlertEvaluator())
+            out['writer_hosts_per_sec'] = len(results) / (time.perf_counter() - start)
+    return out
+
+
+def bench_db_ingest(hosts):
+    """Rows per second through database.save_results in sweep-sized batches."""
+    with temp_database():
+        start = time.perf_counter()
+        rows = fill_results(hosts, per_host=1)
+        elapsed = time.perf_counter() - start
+    return {'rows_per_sec': rows / elapsed, 'seconds': elapsed}
+
+
+def bench_history_query(hosts, per_host=5):
+    """Latency of the History tab query over one day for one group and for all
+    groups: the whole range at once, and the first and a middle page of it."""
+    import database
+    with temp_database():
+        fill_results(hosts, per_host=per_host)
+        start_ts = (datetime.utcnow() - timedelta(days=1, hours=1)).isoformat(sep=' ', timespec='seconds')
+        out = {}
+        for label, group_ids in (('one_group', [1]), ('all_groups', None)):
+            t = time.perf_counter()
+            rows = database.query_results(start_ts=start_ts, group_ids=group_ids)
+            out[label + '_seconds'] = time.perf_counter() - t
+            out[label + '_rows'] = len(rows)
+            t = time.perf_counter()
+            _, key = database.query_page(start_ts=start_ts, group_ids=group_ids, limit=500)
+            out[label + '_first_page_seconds'] = time.perf_counter() - t
+            if len(rows) > 500:
+                middle = rows[len(rows) // 2]
+                t = time.perf_counter()
+                database.query_page(start_ts=start_ts, group_ids=group_ids, limit=500, after=(middle[3], middle[0]))
+                out[label + '_middle_page_seconds'] = time.perf_counter() - t
+    return out
+
+
+def bench_export(hosts, per_host=5, max_pdf_hosts=200):
+    """Excel and PDF export time. The PDF draws one chart per host, so it is
+    skipped above max_pdf_hosts."""
+    import database
+    import reporting
+    out = {}
+    with temp_database() as db_file:
+        fill_results(hosts, per_host=per_host)
+        rows = database.query_results()
+        folder = os.path.dirname(db_file)
+        t = time.perf_counter()
+        reporting.export_to_excel(os.path.join(folder, "bench.xlsx"), rows, summary=database.summarize_results())
+        out['excel_seconds'] = time.perf_counter() - t
+        if hosts <= max_pdf_hosts:
+            t = time.perf_counter()
+            reporting.export_to_pdf(os.path.join(folder, "bench.pdf"), database.summarize_results(),
+                                    database.latency_series())
+            out['pdf_seconds'] = time.perf_counter() - t
+        else:
+            out['pdf_seconds'] = None
+    return out
+
+
+def bench_report_summary(hosts, per_host=50):
+    """Per-host report summary aggregated in SQLite, against loading the raw
+    rows and grouping them in pandas."""
+    import database
+    import reporting
+    with temp_database():
+        fill_results(hosts, per_host=per_host)
+        t = time.perf_counter()
+        summary = database.summarize_results()
+        sql = time.perf_counter() - t
+        t = time.perf_counter()
+        df = reporting.df_from_query(database.query_results())
+        df.groupby('host').agg({'avg_latency': ['mean', 'min', 'max', 'count'], 'packet_loss': 'mean'})
+        pandas = time.perf_counter() - t
+    return {'sql_seconds': sql, 'pandas_seconds': pandas, 'hosts': len(summary), 'samples': hosts * per_host}
+
+
+def bench_inventory_sync(hosts, changed=0.001):
+    """Importing a CSV inventory of 'hosts' lines, then re-syncing it with
+    'changed' of the hosts moved to another group."""
+    import inventory
+    with temp_database() as db_file:
+        path = os.path.join(os.path.dirname(db_file), "inventory.csv")
+        names = host_names(hosts)
+        moved = set(names[::max(1, int(1 / changed))]) if changed else set()
+
+        def write(move):
+            with open(path, 'w') as f:
+                f.write("host,group,tcp_port\n")
+                for i, host in enumerate(names):
+                    f.write(f"{host},{'moved' if host in move else f'site{i % 20}'},{443 if i % 10 == 0 else ''}\n")
+        write(set())
+        t = time.perf_counter()
+        first = inventory.sync(path)
+        import_seconds = time.perf_counter() - t
+        write(moved)
+        t = time.perf_counter()
+        second = inventory.sync(path)
+        resync_seconds = time.perf_counter() - t
+    return {'import_seconds': import_seconds, 'added': first['added'],
+            'resync_seconds': resync_seconds, 'moved': second['moved']}
+
+
+def bench_plot_frame(hosts, frames=5):
+    """Redraw time of the live plot holding 'hosts' points spread over up to 10 series."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from main_app import LivePlot
+    app = QApplication.instance() or QApplication([])
+    plot = LivePlot(width=8, height=3)
+    series = min(hosts, 10)
+    per_series = min(hosts // series, 2000)
+    import numpy as np
+    base = int(time.time())
+    ts = np.arange(base, base + per_series, dtype=np.int64)
+    for s_i in range(series):
+        plot.set_series(f"host{s_i}", ts, (20.0 + s_i + np.arange(per_series) % 7).astype(np.float32))
+    t = time.perf_counter()
+    for _ in range(frames):
+        plot.draw_plot()
+    return {'frame_seconds': (time.perf_counter() - t) / frames, 'points': series * per_series}
+
+
+def bench_topology(hosts, changed=0.01):
+    """Topology update for a full sweep of simulated traceroutes, then a sweep
+    where 'changed' of the hosts moved to a different route, and a shared-fate query."""
+    import probe_backend
+    import topology
+    backend = probe_backend.SimulatedBackend()
+    names = host_names(hosts)
+    results = [{'host': h, 'traceroute': backend.traceroute(h, 30), 'epoch': time.time()} for h in names]
+    graph = topology.TopologyGraph()
+    t = time.perf_counter()
+    graph.update(results)
+    first = time.perf_counter() - t
+    moved = set(names[::max(1, int(1 / changed))]) if changed else set()
+    for r in results:
+        if r['host'] in moved:
+            r['traceroute'] = r['traceroute'].replace(" 10.254.", " 10.253.", 1)
+    t = time.perf_counter()
+    n_changed = graph.update(results)
+    second = time.perf_counter() - t
+    # every host behind one regional hop alerts
+    regional = backend.route(names[0])[backend.params['core_hops']]
+    alerting = graph.hosts_sharing(regional)
+    t = time.perf_counter()
+    suspects = graph.shared_fate(alerting)
+    fate = time.perf_counter() - t
+    return {'first_sweep_seconds': first, 'update_seconds': second, 'changed': n_changed,
+            'shared_fate_seconds': fate, 'top_suspect_ok': bool(suspects) and suspects[0]['hop'] == regional}
+
+
+def bench_archive(hosts, per_host=60, days=365):
+    """Moving a year of results (per_host samples each) to the cold archive,
+    then a full-year report summary and a one-group week read from it."""
+    import archive
+    import database
+    import pyarrow  # noqa: F401  (skip the benchmark without it)
+    with temp_database() as db_file:
+        rows = fill_results(hosts, per_host=per_host, span=timedelta(days=days))
+        sqlite_bytes = os.path.getsize(db_file)
+        t = time.perf_counter()
+        moved = archive.archive_older_than(days=1)
+        archive_seconds = time.perf_counter() - t
+        start = (datetime.utcnow() - timedelta(days=days + 1)).isoformat(sep=' ', timespec='seconds')
+        t = time.perf_counter()
+        year = database.summarize_results(start_ts=start)
+        year_seconds = time.perf_counter() - t
+        week_start = (datetime.utcnow() - timedelta(days=60)).isoformat(sep=' ', timespec='seconds')
+        week_end = (datetime.utcnow() - timedelta(days=53)).isoformat(sep=' ', timespec='seconds')
+        t = time.perf_counter()
+        week = database.query_results(start_ts=week_start, end_ts=week_end, group_ids=[1])
+        week_seconds = time.perf_counter() - t
+        stats = archive.stats()
+    return {'rows': rows, 'archived': moved, 'archive_seconds': archive_seconds,
+            'sqlite_bytes_before': sqlite_bytes, 'archive_bytes': stats['bytes'], 'partitions': stats['partitions'],
+            'year_report_seconds': year_seconds, 'year_report_hosts': len(year),
+            'group_week_seconds': week_seconds, 'group_week_rows': len(week)}
+
+
+BENCHMARKS = {
+    'baseline': bench_baseline,
+    'ping_stats': bench_ping_stats,
+    'rate_limit': bench_rate_limit,
+    'service_probes': bench_service_probes,
+}
+# benchmarks that take a host count and run once per size
+SIZED_BENCHMARKS = {
+    'sweep': bench_sweep,
+    'sharded_sweep': bench_sharded_sweep,
+    'db_ingest': bench_db_ingest,
+    'history_query': bench_history_query,
+    'export': bench_export,
+    'report_summary': bench_report_summary,
+    'inventory_sync': bench_inventory_sync,
+    'plot_frame': bench_plot_frame,
+    'topology': bench_topology,
+    'archive': bench_archive,
+}
+
+
+def run(names, sizes):
+    results = {}
+    for name in names:
+        if name in SIZED_BENCHMARKS:
+            results[name] = {}
+            for size in sizes:
+                try:
+                    results[name][str(size)] = SIZED_BENCHMARKS[name](size)
+                except ImportError as e:
+                    results[name][str(size)] = {'skipped': str(e)}
+                print(name, size, results[name][str(size)], flush=True)
+        else:
+            results[name] = BENCHMARKS[name]()
+            print(name, results[name], flush=True)
+    return results
+
+
+def record(path, results, sizes):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    entry = {'time': datetime.utcnow().isoformat(timespec='seconds'), 'commit': commit,
+             'python': platform.python_version(), 'machine': platform.machine(),
+             'sizes': list(sizes), 'results': results}
+    with open(path, 'a', encoding='utf-8') as fh:
+        fh.write(json.dumps(entry) + "\n")
+
+
+def _flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}.{k}" if prefix else k, v, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+    return out
+
+
+def compare(path):
+    """Prints every numeric metric of the last two recorded runs side by side."""
+    with open(path, encoding='utf-8') as fh:
+        runs = [json.loads(line) for line in fh if line.strip()]
+    if len(runs) < 2:
+        print("Need at least two recorded runs to compare")
+        return
+    old, new = runs[-2], runs[-1]
+    a, b = _flatten("", old['results'], {}), _flatten("", new['results'], {})
+    print(f"{old['commit'] or old['time']} -> {new['commit'] or new['time']}")
+    for key in sorted(set(a) & set(b)):
+        ratio = b[key] / a[key] if a[key] else float('nan')
+        print(f"{key:60s} {a[key]:14.4f} {b[key]:14.4f}  x{ratio:.2f}")
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="NetPulse benchmarks")
+    parser.add_argument('names', nargs='*', help="benchmarks to run (default: all)")
+    parser.add_argument('--sizes', default=",".join(map(str, DEFAULT_SIZES)), help="host counts, comma separated")
+    parser.add_argument('--record', metavar='FILE', help="append results as a JSON line to FILE")
+    parser.add_argument('--compare', metavar='FILE', help="compare the last two runs recorded in FILE and exit")
+    args = parser.parse_args()
+    if args.compare:
+        compare(args.compare)
+        sys.exit(0)
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+    names = args.names or list(BENCHMARKS) + list(SIZED_BENCHMARKS)
+    results = run(names, sizes)
+    if args.record:
+        record(args.record, results, sizes)
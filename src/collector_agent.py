@@ -0,0 +1,201 @@
+# collector_agent.py
+# Lightweight collector: probes one shard of the hosts table and pushes
+# compressed result batches to the aggregator. Unacknowledged batches are kept
+# and re-sent after a reconnect; when the aggregator falls behind the outbox
+# fills up and the probe loop blocks instead of buffering without limit.
+# Run: python collector_agent.py --aggregator 10.0.0.5:9500 --shard 0 --shards 4 --token SECRET
+import argparse
+import asyncio
+import collections
+import os
+import queue
+import socket
+import threading
+import time
+
+import agent_protocol
+import probe_engine
+
+
+class CollectorAgent:
+    def __init__(self, aggregator, shard, shards, agent_id=None, interval=60, batch_size=100,
+                 flush_interval=2.0, max_batches=50, probe=probe_engine.probe_host, token=None):
+        host, _, port = aggregator.partition(':')
+        self.addr = (host, int(port or agent_protocol.DEFAULT_PORT))
+        self.shard = shard
+        self.shards = shards
+        self.agent_id = agent_id or f"{socket.gethostname()}-{shard}of{shards}"
+        self.interval = interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_batches = max_batches
+        self.probe = probe
+        self.token = token
+        self.hosts = []
+        self.sent_results = 0
+        self.acked_results = 0
+        self.reconnects = 0
+        self._results = queue.Queue(maxsize=batch_size * 2)
+        self._outbox = collections.deque()  # [seq, count, frame] awaiting ack, oldest first
+        self._next_seq = 1
+        self._running = True
+        self._hosts_ready = threading.Event()
+        self._loop = None
+
+    # probe side (own thread)
+    def _probe_loop(self):
+        self._hosts_ready.wait()
+        while self._running:
+            started = time.monotonic()
+            for host, group_id in list(self.hosts):
+                if not self._running:
+                    return
+                result = self.probe(host, group_id)
+                while self._running:
+                    try:
+                        self._results.put(result, timeout=0.5)  # blocks while the outbox is full
+                        break
+                    except queue.Full:
+                        pass
+            remaining = self.interval - (time.monotonic() - started)
+            while self._running and remaining > 0:
+                time.sleep(min(remaining, 0.5))
+                remaining -= 0.5
+
+    def _take_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and self._running:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._results.get(timeout=min(timeout, 0.5)))
+            except queue.Empty:
+                pass
+        return batch
+
+    # network side (asyncio)
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while self._running:
+            if len(self._outbox) >= self.max_batches:
+                self._space.clear()
+                await self._space.wait()
+                continue
+            batch = await loop.run_in_executor(None, self._take_batch)
+            if batch:
+                seq = self._next_seq
+                self._next_seq += 1
+                frame = agent_protocol.encode({'type': 'batch', 'seq': seq, 'results': batch})
+                self._outbox.append([seq, len(batch), frame])
+                self._wake.set()
+
+    async def _session(self, reader, writer):
+        writer.write(agent_protocol.encode({'type': 'hello', 'agent_id': self.agent_id, 'token': self.token,
+                                            'shard': self.shard, 'shards': self.shards}))
+        await writer.drain()
+        welcome = await agent_protocol.read_frame(reader)
+        if welcome.get('type') != 'welcome':
+            raise ConnectionError(f"aggregator refused the agent: {welcome.get('error')}")
+        self.hosts = [tuple(h) for h in welcome['hosts']]
+        self._hosts_ready.set()
+        last_seq = welcome['last_seq']
+        self._ack(last_seq)
+        if not self._outbox:
+            # agent restarted: continue after what the aggregator already has
+            self._next_seq = max(self._next_seq, last_seq + 1)
+        window = welcome.get('window', 4)
+        sent = 0  # outbox entries (from the left) sent on this connection
+
+        async def read_acks():
+            nonlocal sent
+            while True:
+                msg = await agent_protocol.read_frame(reader)
+                if msg.get('type') == 'ack':
+                    sent -= self._ack(msg['seq'])
+                    self._wake.set()
+
+        acks = asyncio.ensure_future(read_acks())
+        try:
+            while self._running:
+                if acks.done():
+                    acks.result()  # re-raise the connection error
+                while sent < min(window, len(self._outbox)):
+                    seq, count, frame = self._outbox[sent]
+                    writer.write(frame)
+                    self.sent_results += count
+                    sent += 1
+                await writer.drain()
+                self._wake.clear()
+                woken = asyncio.ensure_future(self._wake.wait())
+                await asyncio.wait([acks, woken], return_when=asyncio.FIRST_COMPLETED)
+                woken.cancel()
+        finally:
+            acks.cancel()
+
+    def _ack(self, seq):
+        dropped = 0
+        while self._outbox and self._outbox[0][0] <= seq:
+            self.acked_results += self._outbox.popleft()[1]
+            dropped += 1
+        if dropped:
+            self._space.set()
+        return dropped
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._space = asyncio.Event()
+        batcher = asyncio.ensure_future(self._batcher())
+        backoff = 1.0
+        while self._running:
+            try:
+                reader, writer = await asyncio.open_connection(*self.addr)
+            except OSError:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            try:
+                await self._session(reader, writer)
+            except (asyncio.IncompleteReadError, ConnectionError, OSError):
+                self.reconnects += 1
+            finally:
+                writer.close()
+        batcher.cancel()
+
+    def run(self):
+        threading.Thread(target=self._probe_loop, name="agent-probe", daemon=True).start()
+        asyncio.run(self._main())
+
+    def start(self):
+        """Runs the agent on background threads (handy for tests and embedding)."""
+        t = threading.Thread(target=self.run, name=f"agent-{self.agent_id}", daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._running = False
+        self._hosts_ready.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def stats(self):
+        return {'agent_id': self.agent_id, 'hosts': len(self.hosts), 'sent': self.sent_results,
+                'acked': self.acked_results, 'pending_batches': len(self._outbox),
+                'reconnects': self.reconnects}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="NetPulse collector agent")
+    parser.add_argument('--aggregator', required=True, help="host:port of the aggregator")
+    parser.add_argument('--shard', type=int, required=True)
+    parser.add_argument('--shards', type=int, required=True)
+    parser.add_argument('--agent-id')
+    parser.add_argument('--interval', type=int, default=60, help="seconds between sweeps")
+    parser.add_argument('--token', default=os.environ.get('NETPULSE_AGENT_TOKEN'),
+                        help="shared secret of the aggregator (default: $NETPULSE_AGENT_TOKEN)")
+    args = parser.parse_args()
+    CollectorAgent(args.aggregator, args.shard, args.shards, args.agent_id, args.interval,
+                   token=args.token).run()
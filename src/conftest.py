@@ -0,0 +1,27 @@
+# conftest.py
+# Shared pytest fixtures: a throwaway database and the simulated network, so
+# tests never touch netpulse.db or send real packets.
+import pytest
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    import database
+    monkeypatch.setattr(database, 'DB_FILE', str(tmp_path / "test.db"))
+    database.init_db()
+    database.invalidate_thresholds()
+    yield database
+    database.invalidate_thresholds()
+
+
+@pytest.fixture
+def sim():
+    import probe_backend
+    import rate_limiter
+    backend = probe_backend.SimulatedBackend(seed=0)
+    previous = probe_backend.set_backend(backend)
+    limiter = rate_limiter.stats()
+    rate_limiter.configure(rate=1e9, burst=1e9)
+    yield backend
+    probe_backend.set_backend(previous)
+    rate_limiter.configure(rate=limiter['rate'], burst=limiter['burst'])
@@ -1,9 +1,32 @@
 # database.py
+import heapq
+import math
 import sqlite3
 import os
+import threading
+from instrumentation import timed
 
 DB_FILE = os.path.join(os.path.dirname(__file__), "..", "netpulse.db")
 
+# default sensible thresholds if none defined; None disables a check
+DEFAULT_THRESHOLDS = {"max_latency": 200.0, "max_packet_loss": 5.0, "max_jitter": 50.0,
+                      "max_dns_time": None, "max_retrans_rate": None,
+                      "max_tcp_connect": None, "max_tls_handshake": None, "max_http_ttfb": None}
+THRESHOLD_COLUMNS = list(DEFAULT_THRESHOLDS)
+
+# results columns in query_results order; new columns go at the end so row
+# positions used by existing callers stay valid
+RESULT_COLUMNS = ['id', 'host', 'group_id', 'timestamp', 'avg_latency', 'packet_loss', 'jitter',
+                  'min_latency', 'max_latency', 'dns_time', 'traceroute', 'tcp_retrans_rate', 'alerts',
+                  'tcp_connect_ms', 'tls_handshake_ms', 'http_ttfb_ms', 'http_status']
+_INSERT_COLUMNS = RESULT_COLUMNS[1:]
+_INSERT_SQL = "INSERT INTO results ({}) VALUES ({})".format(", ".join(_INSERT_COLUMNS),
+                                                            ", ".join("?" * len(_INSERT_COLUMNS)))
+
+# group_id -> thresholds dict, loaded once and dropped by set_thresholds/delete_group
+_thresholds_cache = None
+_thresholds_lock = threading.Lock()
+
 def get_conn():
     db_dir = os.path.dirname(DB_FILE)
     os.makedirs(db_dir, exist_ok=True)
@@ -31,6 +54,8 @@ def init_db():
         max_latency REAL,
         max_packet_loss REAL,
         max_jitter REAL,
+        max_dns_time REAL,
+        max_retrans_rate REAL,
         FOREIGN KEY(group_id) REFERENCES host_groups(id)
     )''')
     c.execute('''
@@ -50,9 +75,68 @@ def init_db():
         alerts TEXT,
         FOREIGN KEY(group_id) REFERENCES host_groups(id)
     )''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS host_baselines (
+        host TEXT,
+        metric TEXT,
+        slot INTEGER,
+        n INTEGER,
+        mean REAL,
+        var REAL,
+        digest BLOB,
+        PRIMARY KEY(host, metric, slot)
+    )''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS notification_sinks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT,
+        target TEXT
+    )''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS agent_progress (
+        agent_id TEXT PRIMARY KEY,
+        last_seq INTEGER
+    )''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS host_routes (
+        host TEXT PRIMARY KEY,
+        path TEXT
+    )''')
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS route_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        host TEXT,
+        epoch REAL,
+        old_path TEXT,
+        new_path TEXT
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_route_changes_epoch ON route_changes(epoch)")
+    # range scans for queries and for moving old days to the archive
+    c.execute("CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results(timestamp)")
+    # History paging by host, and over alerting rows only (see query_page)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_results_host_ts ON results(host, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_results_alerted ON results(timestamp) "
+              "WHERE alerts IS NOT NULL AND alerts != ''")
+    # host lookups by name and group (inventory sync, group sweeps)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hosts_host ON hosts(host)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_hosts_group ON hosts(group_id)")
+    _add_missing_columns(c, "alert_thresholds", {"max_dns_time": "REAL", "max_retrans_rate": "REAL",
+                                                 "max_tcp_connect": "REAL", "max_tls_handshake": "REAL",
+                                                 "max_http_ttfb": "REAL"})
+    # service checks (see service_probes.py): per-host targets and their results
+    _add_missing_columns(c, "hosts", {"tcp_port": "INTEGER", "tls_port": "INTEGER", "http_url": "TEXT"})
+    _add_missing_columns(c, "results", {"tcp_connect_ms": "REAL", "tls_handshake_ms": "REAL",
+                                        "http_ttfb_ms": "REAL", "http_status": "INTEGER"})
     conn.commit()
     conn.close()
 
+def _add_missing_columns(c, table, columns):
+    """Upgrades databases created by older versions in place."""
+    existing = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+    for name, col_type in columns.items():
+        if name not in existing:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+
 # Group management
 def add_group(name):
     conn = get_conn()
@@ -77,15 +161,36 @@ def delete_group(group_id):
     c.execute("DELETE FROM alert_thresholds WHERE group_id=?", (group_id,))
     conn.commit()
     conn.close()
+    invalidate_thresholds()
 
 # Hosts
-def add_host(host, group_id=None):
+def add_host(host, group_id=None, tcp_port=None, tls_port=None, http_url=None):
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("INSERT INTO hosts (host, group_id, tcp_port, tls_port, http_url) VALUES (?, ?, ?, ?, ?)",
+              (host, group_id, tcp_port, tls_port, http_url or None))
+    conn.commit()
+    conn.close()
+
+def set_host_services(host_id, tcp_port=None, tls_port=None, http_url=None):
     conn = get_conn()
     c = conn.cursor()
-    c.execute("INSERT INTO hosts (host, group_id) VALUES (?, ?)", (host, group_id))
+    c.execute("UPDATE hosts SET tcp_port=?, tls_port=?, http_url=? WHERE id=?",
+              (tcp_port, tls_port, http_url or None, host_id))
     conn.commit()
     conn.close()
 
+def host_services():
+    """host -> (tcp_port, tls_port, http_url) for hosts with at least one service check."""
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute('''SELECT host, tcp_port, tls_port, http_url FROM hosts
+                 WHERE tcp_port IS NOT NULL OR tls_port IS NOT NULL OR http_url IS NOT NULL''')
+    rows = c.fetchall()
+    conn.close()
+    return {host: (tcp_port, tls_port, http_url) for host, tcp_port, tls_port, http_url in rows}
+
+@timed('db.list_hosts')
 def list_hosts():
     conn = get_conn()
     c = conn.cursor()
@@ -103,44 +208,191 @@ def delete_host(host_id):
     conn.commit()
     conn.close()
 
+@timed('db.sync_hosts')
+def sync_hosts(entries, thresholds=None, remove=True):
+    """Applies an inventory in one transaction (see inventory.py).
+    entries: host -> {'group': name or None, 'tcp_port', 'tls_port', 'http_url'};
+    a key left out keeps the current value. thresholds: group name -> partial
+    thresholds, merged over the group's current ones. Groups are created as
+    needed. Host names match case-insensitively and a matched host keeps its
+    stored spelling. With remove=True, hosts not in 'entries' and duplicate
+    rows of a host are deleted. Returns counts of added/moved/updated/unchanged hosts and
+    the list of removed host names."""
+    thresholds = thresholds or {}
+    conn = get_conn()
+    c = conn.cursor()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        names = {e['group'] for e in entries.values() if e.get('group')} | set(thresholds)
+        c.executemany("INSERT OR IGNORE INTO host_groups (group_name) VALUES (?)", [(n,) for n in names])
+        c.execute("SELECT group_name, id FROM host_groups")
+        group_ids = dict(c.fetchall())
+
+        c.execute("SELECT group_id, {} FROM alert_thresholds".format(", ".join(THRESHOLD_COLUMNS)))
+        current = {row[0]: dict(zip(THRESHOLD_COLUMNS, row[1:])) for row in c.fetchall()}
+        upserts = []
+        for name, limits in thresholds.items():
+            gid = group_ids[name]
+            merged = dict(current.get(gid) or DEFAULT_THRESHOLDS, **limits)
+            upserts.append((gid, *(merged[k] for k in THRESHOLD_COLUMNS)))
+        c.executemany("INSERT INTO alert_thresholds (group_id, {}) VALUES (?, {}) ON CONFLICT(group_id) DO UPDATE SET {}"
+                      .format(", ".join(THRESHOLD_COLUMNS), ", ".join("?" * len(THRESHOLD_COLUMNS)),
+                              ", ".join(f"{k}=excluded.{k}" for k in THRESHOLD_COLUMNS)), upserts)
+
+        c.execute("SELECT id, host, group_id, tcp_port, tls_port, http_url FROM hosts ORDER BY id")
+        wanted = {host.lower() for host in entries}
+        existing, deletes, removed = {}, [], {}
+        for host_id, host, *row in c.fetchall():
+            key = host.lower()
+            if key in existing or key not in wanted:
+                if remove:
+                    deletes.append((host_id,))
+                    if key not in wanted:
+                        removed[host] = None
+                continue
+            existing[key] = (host_id, tuple(row))
+
+        inserts, updates = [], []
+        counts = {'added': 0, 'moved': 0, 'updated': 0, 'unchanged': 0}
+        for host, e in entries.items():
+            gid = group_ids[e['group']] if e.get('group') else None
+            if host.lower() not in existing:
+                inserts.append((host, gid, e.get('tcp_port'), e.get('tls_port'), e.get('http_url')))
+                counts['added'] += 1
+                continue
+            host_id, old = existing[host.lower()]
+            new = (gid if 'group' in e else old[0],
+                   *(e[k] if k in e else v for k, v in zip(('tcp_port', 'tls_port', 'http_url'), old[1:])))
+            if new == old:
+                counts['unchanged'] += 1
+                continue
+            counts['moved' if new[0] != old[0] else 'updated'] += 1
+            updates.append((*new, host_id))
+        c.executemany("DELETE FROM hosts WHERE id=?", deletes)
+        c.executemany("INSERT INTO hosts (host, group_id, tcp_port, tls_port, http_url) VALUES (?, ?, ?, ?, ?)",
+                      inserts)
+        c.executemany("UPDATE hosts SET group_id=?, tcp_port=?, tls_port=?, http_url=? WHERE id=?", updates)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    invalidate_thresholds()
+    counts['removed'] = list(removed)
+    return counts
+
 # Thresholds
-def set_thresholds(group_id, max_latency, max_packet_loss, max_jitter):
+def set_thresholds(group_id, max_latency, max_packet_loss, max_jitter, max_dns_time=None, max_retrans_rate=None,
+                   max_tcp_connect=None, max_tls_handshake=None, max_http_ttfb=None):
     conn = get_conn()
     c = conn.cursor()
-    c.execute('''INSERT INTO alert_thresholds (group_id, max_latency, max_packet_loss, max_jitter)
-                 VALUES (?, ?, ?, ?)
+    c.execute('''INSERT INTO alert_thresholds (group_id, max_latency, max_packet_loss, max_jitter, max_dns_time, max_retrans_rate,
+                                               max_tcp_connect, max_tls_handshake, max_http_ttfb)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                  ON CONFLICT(group_id) DO UPDATE SET max_latency=excluded.max_latency,
-                 max_packet_loss=excluded.max_packet_loss, max_jitter=excluded.max_jitter''',
-              (group_id, max_latency, max_packet_loss, max_jitter))
+                 max_packet_loss=excluded.max_packet_loss, max_jitter=excluded.max_jitter,
+                 max_dns_time=excluded.max_dns_time, max_retrans_rate=excluded.max_retrans_rate,
+                 max_tcp_connect=excluded.max_tcp_connect, max_tls_handshake=excluded.max_tls_handshake,
+                 max_http_ttfb=excluded.max_http_ttfb''',
+              (group_id, max_latency, max_packet_loss, max_jitter, max_dns_time, max_retrans_rate,
+               max_tcp_connect, max_tls_handshake, max_http_ttfb))
     conn.commit()
     conn.close()
+    invalidate_thresholds()
+
+@timed('db.load_thresholds')
+def load_thresholds():
+    """Reads every group's thresholds in one query. Returns {group_id: thresholds}."""
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("SELECT group_id, {} FROM alert_thresholds".format(", ".join(THRESHOLD_COLUMNS)))
+    rows = c.fetchall()
+    conn.close()
+    return {row[0]: dict(zip(THRESHOLD_COLUMNS, row[1:])) for row in rows}
+
+def invalidate_thresholds():
+    global _thresholds_cache
+    with _thresholds_lock:
+        _thresholds_cache = None
 
 def get_thresholds(group_id):
+    """Served from an in-memory cache; the table is only read after an invalidation."""
+    global _thresholds_cache
+    with _thresholds_lock:
+        if _thresholds_cache is None:
+            _thresholds_cache = load_thresholds()
+        row = _thresholds_cache.get(group_id)
+    return dict(row) if row else dict(DEFAULT_THRESHOLDS)
+
+# Notification sinks (see alert_pipeline.py)
+def add_sink(kind, target):
     conn = get_conn()
     c = conn.cursor()
-    c.execute("SELECT max_latency, max_packet_loss, max_jitter FROM alert_thresholds WHERE group_id=?", (group_id,))
-    row = c.fetchone()
+    c.execute("INSERT INTO notification_sinks (kind, target) VALUES (?, ?)", (kind, target))
+    conn.commit()
+    conn.close()
+
+def list_sinks():
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("SELECT id, kind, target FROM notification_sinks ORDER BY id")
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def delete_sink(sink_id):
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("DELETE FROM notification_sinks WHERE id=?", (sink_id,))
+    conn.commit()
     conn.close()
-    if row:
-        return {"max_latency": row[0], "max_packet_loss": row[1], "max_jitter": row[2]}
-    else:
-        # default sensible thresholds if none defined
-        return {"max_latency": 200.0, "max_packet_loss": 5.0, "max_jitter": 50.0}
 
 # Results saving & querying
-def save_result(host, group_id, timestamp, avg_latency, packet_loss, jitter, min_latency, max_latency, dns_time, traceroute_text, tcp_retrans_rate, alerts_text):
+@timed('db.save_result')
+def save_result(host, group_id, timestamp, avg_latency, packet_loss, jitter, min_latency, max_latency, dns_time, traceroute_text, tcp_retrans_rate, alerts_text,
+                tcp_connect_ms=None, tls_handshake_ms=None, http_ttfb_ms=None, http_status=None):
     conn = get_conn()
     c = conn.cursor()
-    c.execute('''INSERT INTO results (host, group_id, timestamp, avg_latency, packet_loss, jitter, min_latency, max_latency, dns_time, traceroute, tcp_retrans_rate, alerts)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-              (host, group_id, timestamp, avg_latency, packet_loss, jitter, min_latency, max_latency, dns_time, traceroute_text, tcp_retrans_rate, alerts_text))
+    c.execute(_INSERT_SQL,
+              (host, group_id, timestamp, avg_latency, packet_loss, jitter, min_latency, max_latency, dns_time, traceroute_text, tcp_retrans_rate, alerts_text,
+               tcp_connect_ms, tls_handshake_ms, http_ttfb_ms, http_status))
     conn.commit()
     conn.close()
 
-def query_results(start_ts=None, end_ts=None, group_ids=None):
+@timed('db.save_results')
+def save_results(rows, agent_progress=None):
+    """Inserts many results in one transaction. Each row is a tuple in save_result's argument order.
+    agent_progress=(agent_id, seq) records a collector agent's batch in the same transaction,
+    so a batch re-sent after a disconnect is never stored twice."""
+    if not rows and not agent_progress:
+        return
+    # rows written before the service-check columns existed get NULLs for them
+    width = len(_INSERT_COLUMNS)
+    if rows and len(rows[0]) < width:
+        rows = [tuple(r) + (None,) * (width - len(r)) for r in rows]
     conn = get_conn()
     c = conn.cursor()
-    q = "SELECT * FROM results WHERE 1=1"
+    c.executemany(_INSERT_SQL, rows)
+    if agent_progress:
+        c.execute("INSERT OR REPLACE INTO agent_progress (agent_id, last_seq) VALUES (?, ?)", agent_progress)
+    conn.commit()
+    conn.close()
+
+def get_agent_seq(agent_id):
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("SELECT last_seq FROM agent_progress WHERE agent_id=?", (agent_id,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+# matched by the partial index idx_results_alerted; keep the two in step
+_ALERTED = "alerts IS NOT NULL AND alerts != ''"
+
+def _result_filters(start_ts=None, end_ts=None, group_ids=None, host=None, alerts_only=False):
+    """WHERE clause and parameters shared by the results queries."""
+    q = "WHERE 1=1"
     params = []
     if start_ts:
         q += " AND timestamp >= ?"
@@ -151,8 +403,277 @@ def query_results(start_ts=None, end_ts=None, group_ids=None):
     if group_ids:
         q += " AND group_id IN ({})".format(",".join("?"*len(group_ids)))
         params.extend(group_ids)
-    q += " ORDER BY timestamp ASC"
-    c.execute(q, params)
+    if host:
+        q += " AND host = ?"
+        params.append(host)
+    if alerts_only:
+        q += f" AND {_ALERTED}"
+    return q, params
+
+@timed('db.query_results')
+def query_results(start_ts=None, end_ts=None, group_ids=None, columns=None, include_archive=True):
+    """Results ordered by timestamp. 'columns' picks a subset of RESULT_COLUMNS
+    (default all, in that order). Rows already moved to the cold archive are
+    read back from it and merged in, unless include_archive is False."""
+    columns = list(columns or RESULT_COLUMNS)
+    conn = get_conn()
+    c = conn.cursor()
+    where, params = _result_filters(start_ts, end_ts, group_ids)
+    c.execute("SELECT {} FROM results {} ORDER BY timestamp ASC".format(", ".join(columns), where), params)
     rows = c.fetchall()
     conn.close()
+    if include_archive:
+        import archive
+        cold = archive.read_rows(start_ts, end_ts, group_ids, columns)
+        if cold:
+            if 'timestamp' in columns:
+                i = columns.index('timestamp')
+                rows = list(heapq.merge(cold, rows, key=lambda r: r[i]))
+            else:
+                rows = cold + rows
     return rows
+
+@timed('db.query_page')
+def query_page(start_ts=None, end_ts=None, group_ids=None, host=None, alerts_only=False, after=None,
+               limit=500, columns=None, include_archive=True):
+    """One page of results ordered by (timestamp, id), for scrolling through
+    long ranges without reading them whole. 'after' is the next_key returned
+    for the previous page. Returns (rows, next_key); next_key is None on the
+    last page."""
+    columns = list(columns or RESULT_COLUMNS)
+    select = columns + [c for c in ('timestamp', 'id') if c not in columns]
+    ts_i, id_i = select.index('timestamp'), select.index('id')
+    where, params = _result_filters(start_ts, end_ts, group_ids, host, alerts_only)
+    if after:
+        where += " AND (timestamp, id) > (?, ?)"
+        params.extend(after)
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("SELECT {} FROM results {} ORDER BY timestamp, id LIMIT ?".format(", ".join(select), where),
+              params + [limit + 1])
+    rows = c.fetchall()
+    conn.close()
+    if include_archive:
+        import archive
+        cold = archive.page(start_ts, end_ts, group_ids, host, alerts_only, after, limit + 1, select)
+        if cold:
+            rows = list(heapq.merge(cold, rows, key=lambda r: (r[ts_i], r[id_i])))[:limit + 1]
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_key = (rows[-1][ts_i], rows[-1][id_i])
+    if len(select) > len(columns):
+        rows = [r[:len(columns)] for r in rows]
+    return rows, next_key
+
+def iter_results(page_size=20000, **filters):
+    """Every row matching query_page's filters, fetched a page at a time."""
+    key = None
+    while True:
+        rows, key = query_page(after=key, limit=page_size, **filters)
+        yield from rows
+        if key is None:
+            return
+
+# per-host report summary, in summarize_results order
+SUMMARY_COLUMNS = ['host', 'group_id', 'samples', 'avg_latency', 'min_latency', 'max_latency', 'p50_latency',
+                   'p95_latency', 'avg_packet_loss', 'max_packet_loss', 'avg_jitter', 'avg_tcp_retrans_rate',
+                   'alert_count', 'first_seen', 'last_seen']
+
+class _Percentile:
+    """percentile(x, q) aggregate: nearest-rank q-quantile of the non-NULL x.
+    GROUP BY hands SQLite's groups over one at a time, so only the current
+    host's values are held."""
+    def __init__(self):
+        self.values = []
+        self.q = 0.5
+
+    def step(self, value, q):
+        if value is not None:
+            self.values.append(value)
+        self.q = q
+
+    def finalize(self):
+        if not self.values:
+            return None
+        self.values.sort()
+        return self.values[max(math.ceil(self.q * len(self.values)) - 1, 0)]
+
+# Partial aggregates per host: sums and counts rather than means so the hot
+# and archived parts of a range can be combined before the final division.
+_SUMMARY_SQL = """
+SELECT host, MAX(group_id), COUNT(*),
+       COUNT(avg_latency), SUM(avg_latency), MIN(min_latency), MAX(max_latency),
+       percentile(avg_latency, 0.5), percentile(avg_latency, 0.95),
+       COUNT(packet_loss), SUM(packet_loss), MAX(packet_loss), COUNT(jitter), SUM(jitter),
+       COUNT(tcp_retrans_rate), SUM(tcp_retrans_rate),
+       SUM(alerts IS NOT NULL AND alerts != ''), MIN(timestamp), MAX(timestamp)
+FROM results {where} GROUP BY host"""
+
+def _merge_partials(a, b):
+    """Combines two partial rows of one host; percentiles become a count-weighted
+    mean, an approximation used only when a host spans the archive boundary."""
+    def pick(f, x, y):
+        return y if x is None else x if y is None else f(x, y)
+    def add(x, y):
+        return pick(lambda u, v: u + v, x, y)
+    def weighted(x, y):
+        return pick(lambda u, v: (u * a[3] + v * b[3]) / (a[3] + b[3]), x, y)
+    return (a[0], pick(lambda u, v: v, a[1], b[1]), a[2] + b[2], a[3] + b[3], add(a[4], b[4]),
+            pick(min, a[5], b[5]), pick(max, a[6], b[6]), weighted(a[7], b[7]), weighted(a[8], b[8]),
+            a[9] + b[9], add(a[10], b[10]), pick(max, a[11], b[11]), a[12] + b[12], add(a[13], b[13]),
+            a[14] + b[14], add(a[15], b[15]), (a[16] or 0) + (b[16] or 0),
+            pick(min, a[17], b[17]), pick(max, a[18], b[18]))
+
+def _finish_partial(p):
+    def mean(total, n):
+        return total / n if n else None
+    return (p[0], p[1], p[2], mean(p[4], p[3]), p[5], p[6], p[7], p[8], mean(p[10], p[9]), p[11],
+            mean(p[13], p[12]), mean(p[15], p[14]), p[16] or 0, p[17], p[18])
+
+@timed('db.summarize_results')
+def summarize_results(start_ts=None, end_ts=None, group_ids=None, include_archive=True, host=None,
+                      alerts_only=False):
+    """One row per host (SUMMARY_COLUMNS), ordered by host, aggregated inside
+    SQLite so the cost of building a report grows with hosts, not samples.
+    host / alerts_only filter like query_page."""
+    conn = get_conn()
+    conn.create_aggregate("percentile", 2, _Percentile)
+    c = conn.cursor()
+    where, params = _result_filters(start_ts, end_ts, group_ids, host, alerts_only)
+    c.execute(_SUMMARY_SQL.format(where=where), params)
+    partials = {row[0]: row for row in c.fetchall()}
+    conn.close()
+    if include_archive:
+        import archive
+        for row in archive.summarize(start_ts, end_ts, group_ids, host, alerts_only):
+            hot = partials.get(row[0])
+            partials[row[0]] = row if hot is None else _merge_partials(row, hot)
+    return [_finish_partial(partials[h]) for h in sorted(partials)]
+
+def _range_bounds(start_ts, end_ts, include_archive):
+    """Epoch seconds covering [start_ts, end_ts], filling open ends from the data."""
+    from datetime import datetime
+    def epoch(ts):
+        return int((datetime.fromisoformat(ts[:19]) - datetime(1970, 1, 1)).total_seconds())
+    first, last = start_ts, end_ts
+    if not (first and last):
+        conn = get_conn()
+        c = conn.cursor()
+        c.execute("SELECT MIN(timestamp), MAX(timestamp) FROM results")
+        lo, hi = c.fetchone()
+        conn.close()
+        if include_archive:
+            import archive
+            a = archive.stats()
+            if a['first_day']:
+                lo = min(lo or "9", a['first_day'] + " 00:00:00")
+                hi = max(hi or "", a['last_day'] + " 23:59:59")
+        first, last = first or lo, last or hi
+    if not (first and last):
+        return None
+    return epoch(first), max(epoch(last), epoch(first) + 1)
+
+@timed('db.latency_series')
+def latency_series(start_ts=None, end_ts=None, group_ids=None, points=60, include_archive=True, host=None,
+                   alerts_only=False):
+    """(host, timestamp, avg_latency) with the range cut into 'points' equal
+    buckets and each host's samples averaged per bucket; ordered by host, time.
+    For charts, where a year of samples would only be drawn on top of itself."""
+    bounds = _range_bounds(start_ts, end_ts, include_archive)
+    if bounds is None:
+        return []
+    start, end = bounds
+    span = end - start + 1
+    conn = get_conn()
+    c = conn.cursor()
+    where, params = _result_filters(start_ts, end_ts, group_ids, host, alerts_only)
+    c.execute(f"""SELECT host, (CAST(strftime('%s', timestamp) AS INTEGER) - ?) * ? / ? AS bucket,
+                         SUM(avg_latency), COUNT(avg_latency), MIN(timestamp)
+                  FROM results {where} GROUP BY host, bucket""",
+              [start, points, span] + params)
+    partials = c.fetchall()
+    conn.close()
+    if include_archive:
+        import archive
+        partials += archive.latency_series(start_ts, end_ts, group_ids, start, points, span, host, alerts_only)
+    # a bucket spanning the archive boundary has a partial from each side
+    merged = {}
+    for host, bucket, total, count, first in partials:
+        m = merged.get((host, bucket))
+        if m is None:
+            merged[(host, bucket)] = [total or 0.0, count, first]
+        else:
+            m[0] += total or 0.0
+            m[1] += count
+            m[2] = min(m[2], first)
+    rows = [(host, first, total / count if count else None)
+            for (host, _), (total, count, first) in merged.items()]
+    rows.sort(key=lambda r: (r[0], r[1]))
+    return rows
+
+@timed('db.recent_results')
+def recent_results(per_host, since_ts=None):
+    """Newest 'per_host' results for every host, oldest first within a host:
+    (host, timestamp, avg_latency, packet_loss, jitter, dns_time, tcp_retrans_rate)."""
+    conn = get_conn()
+    c = conn.cursor()
+    where, params = "", []
+    if since_ts:
+        where = "WHERE timestamp >= ?"
+        params.append(since_ts)
+    c.execute(f'''SELECT host, timestamp, avg_latency, packet_loss, jitter, dns_time, tcp_retrans_rate
+                  FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY host ORDER BY timestamp DESC, id DESC) AS rn
+                        FROM results {where})
+                  WHERE rn <= ? ORDER BY host, timestamp, id''', params + [per_host])
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+# Routes (see topology.py)
+def load_routes():
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("SELECT host, path FROM host_routes")
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def route_changes_since(epoch):
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("SELECT host, epoch, old_path, new_path FROM route_changes WHERE epoch >= ? ORDER BY epoch, id", (epoch,))
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+@timed('db.save_routes')
+def save_routes(routes, changes):
+    """routes: (host, path); changes: (host, epoch, old_path, new_path). One transaction."""
+    conn = get_conn()
+    c = conn.cursor()
+    c.executemany("INSERT OR REPLACE INTO host_routes (host, path) VALUES (?, ?)", routes)
+    c.executemany("INSERT INTO route_changes (host, epoch, old_path, new_path) VALUES (?, ?, ?, ?)", changes)
+    conn.commit()
+    conn.close()
+
+# Baselines (see baseline.py)
+@timed('db.load_baselines')
+def load_baselines():
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute("SELECT host, metric, slot, n, mean, var, digest FROM host_baselines")
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+@timed('db.save_baselines')
+def save_baselines(rows):
+    if not rows:
+        return
+    conn = get_conn()
+    c = conn.cursor()
+    c.executemany('''INSERT OR REPLACE INTO host_baselines (host, metric, slot, n, mean, var, digest)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+    conn.commit()
+    conn.close()
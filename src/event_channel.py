@@ -0,0 +1,34 @@
+# event_channel.py
+# Hand-off from probe and scheduler threads to the GUI. Producers append to a
+# deque (append/popleft are atomic under the GIL, so no lock is taken on the
+# probe path) and the GUI drains everything queued so far on a QTimer, handling
+# a whole batch with one widget update instead of one signal per host.
+import collections
+
+
+class EventChannel:
+    def __init__(self, maxlen=100000):
+        # when the GUI stalls the oldest events are dropped rather than growing without limit
+        self._events = collections.deque(maxlen=maxlen)
+        self.pushed = 0   # counters are approximate when several threads push
+        self.drained = 0
+
+    def push(self, kind, payload):
+        self._events.append((kind, payload))
+        self.pushed += 1
+
+    def drain(self, limit=None):
+        """Removes and returns queued (kind, payload) events, oldest first."""
+        out = []
+        popleft = self._events.popleft
+        n = len(self._events) if limit is None else min(limit, len(self._events))
+        for _ in range(n):
+            out.append(popleft())
+        self.drained += n
+        return out
+
+    def dropped(self):
+        return max(0, self.pushed - self.drained - len(self._events))
+
+    def __len__(self):
+        return len(self._events)
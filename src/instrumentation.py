@@ -0,0 +1,239 @@
+# instrumentation.py
+# Per-stage timing for the probe pipeline, database calls and reports.
+# span()/timed() feed in-memory log-bucket histograms when timing is enabled;
+# when it is disabled span() returns a shared no-op object, so the cost is a
+# global lookup and an empty with-block. Also hosts the on-demand profilers.
+import collections
+import cProfile
+import functools
+import io
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+
+_enabled = False
+_histograms = {}
+_lock = threading.Lock()
+
+BUCKETS_PER_OCTAVE = 8  # ~9% bucket width
+
+
+class Histogram:
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = max(seconds * 1e6, 1.0)
+        self.buckets[int(math.log2(us) * BUCKETS_PER_OCTAVE)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Upper edge of the bucket holding the q-th sample, in seconds."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= target:
+                return min(2 ** ((b + 1) / BUCKETS_PER_OCTAVE) / 1e6, self.max)
+        return self.max
+
+
+def record(name, seconds):
+    with _lock:
+        h = _histograms.get(name)
+        if h is None:
+            h = _histograms[name] = Histogram()
+        h.add(seconds)
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name):
+    return _Span(name) if _enabled else _NOOP
+
+
+def timed(name):
+    """Decorator form of span()."""
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return inner
+    return wrap
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def summary():
+    """One dict per stage, times in milliseconds, sorted by total time spent."""
+    with _lock:
+        items = list(_histograms.items())
+        rows = [{'stage': name, 'count': h.count, 'total_ms': h.total * 1e3,
+                 'mean_ms': h.total / h.count * 1e3, 'p50_ms': h.percentile(0.5) * 1e3,
+                 'p99_ms': h.percentile(0.99) * 1e3, 'max_ms': h.max * 1e3}
+                for name, h in items if h.count]
+    return sorted(rows, key=lambda r: r['total_ms'], reverse=True)
+
+
+# Profilers
+_profiler = None          # cProfile.Profile while the deterministic profiler is on
+_profiler_lock = threading.Lock()
+_sampler = None
+
+
+class profile_block:
+    """Wrap a unit of work (one host probe, one batch) so it shows up in the
+    cProfile report. cProfile only sees the thread that enables it and a Profile cannot
+    run in two threads at once, so concurrent blocks are simply not profiled."""
+
+    def __enter__(self):
+        prof = _profiler  # read once: stop_profiler may clear it meanwhile
+        self._active = prof is not None and _profiler_lock.acquire(blocking=False)
+        if self._active and _profiler is not prof:
+            # stopped between the read and the lock; its report is being written
+            _profiler_lock.release()
+            self._active = False
+        if self._active:
+            self._prof = prof
+            prof.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self._active:
+            self._prof.disable()
+            _profiler_lock.release()
+        return False
+
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads every 'interval' seconds and
+    counts the innermost frames. Works across probe, scheduler and GUI threads."""
+
+    def __init__(self, interval=0.005, depth=3):
+        self.interval = interval
+        self.depth = depth
+        self.samples = 0
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+                    frame = frame.f_back
+                self.counts[" <- ".join(stack)] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self, top=40):
+        total = sum(self.counts.values()) or 1
+        lines = [f"{self.samples} samples every {self.interval * 1000:.0f} ms"]
+        for stack, n in self.counts.most_common(top):
+            lines.append(f"{100.0 * n / total:6.2f}%  {stack}")
+        return "\n".join(lines)
+
+
+def start_profiler(mode='cprofile'):
+    global _profiler, _sampler
+    stop_profiler()
+    if mode == 'sampling':
+        _sampler = SamplingProfiler()
+        _sampler.start()
+    else:
+        _profiler = cProfile.Profile()
+
+
+def stop_profiler(top=40):
+    """Stops whichever profiler is running and returns its text report."""
+    global _profiler, _sampler
+    report = ""
+    if _sampler is not None:
+        _sampler.stop()
+        report = _sampler.report(top)
+        _sampler = None
+    if _profiler is not None:
+        prof, _profiler = _profiler, None
+        # no new blocks start now; wait for the one in flight (at most one host probe)
+        with _profiler_lock:
+            pass
+        out = io.StringIO()
+        try:
+            pstats.Stats(prof, stream=out).sort_stats('cumulative').print_stats(top)
+            report = out.getvalue()
+        except TypeError:
+            report = "No profiled work ran while the profiler was on"
+    return report
+
+
+def profiler_running():
+    return _profiler is not None or _sampler is not None
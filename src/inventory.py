@@ -0,0 +1,208 @@
+# inventory.py
+# Bulk import and sync of hosts, groups and group thresholds from inventory
+# files. CSV and JSON Lines are read a line at a time; JSON and YAML documents
+# are loaded whole (YAML needs PyYAML). Every entry is validated first, then
+# database.sync_hosts applies the whole diff in one transaction.
+#
+# Entry fields (CSV header names, JSON/YAML keys):
+#   host            hostname, IP address or IPv4 range "a.b.c.d-e.f.g.h" (required)
+#   group           group name; empty for no group
+#   tcp_port, tls_port, http_url
+#                   service checks; "{host}" in http_url is replaced
+#   max_latency, max_packet_loss, max_jitter, max_dns_time, max_retrans_rate,
+#   max_tcp_connect, max_tls_handshake, max_http_ttfb
+#                   thresholds of the entry's group; empty leaves them as they are
+# A host field left out keeps the host's current value; one present but empty
+# clears it. JSON/YAML may also be {"groups": {name: {thresholds}}, "hosts": [...]}.
+import argparse
+import csv
+import ipaddress
+import json
+import os
+import re
+
+import database
+import utils
+from instrumentation import timed
+
+HOST_FIELDS = ('group', 'tcp_port', 'tls_port', 'http_url')
+_ALIASES = {'hostname': 'host', 'address': 'host', 'ip': 'host', 'group_name': 'group'}
+_LABEL = r'[A-Za-z0-9_]([A-Za-z0-9_-]{0,61}[A-Za-z0-9])?'
+_HOSTNAME = re.compile(rf'^(?=.{{1,253}}$){_LABEL}(\.{_LABEL})*\.?$')
+MAX_RANGE = 65536
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _port(value):
+    if _blank(value):
+        return None
+    port = int(str(value).strip())
+    if not 0 < port < 65536:
+        raise ValueError(f"port {port} out of range")
+    return port
+
+
+def _url(value):
+    if _blank(value):
+        return None
+    value = str(value).strip()
+    if not value.startswith(("http://", "https://")):
+        raise ValueError(f"http_url must start with http:// or https://: {value}")
+    return value
+
+
+def _threshold(value):
+    value = float(value)
+    if value < 0:
+        raise ValueError(f"threshold {value} is negative")
+    return value
+
+
+def _hosts(value):
+    """Host names for one entry; IPv4 ranges are expanded."""
+    value = str(value or "").strip()
+    if not value:
+        raise ValueError("host is required")
+    if '-' in value and value.replace('-', '').replace('.', '').replace(' ', '').isdigit():
+        start, end = (int(ipaddress.IPv4Address(p.strip())) for p in value.split('-'))
+        if abs(end - start) >= MAX_RANGE:
+            raise ValueError(f"range {value} has more than {MAX_RANGE} addresses")
+        return utils.expand_ip_range(value)
+    try:
+        return [str(ipaddress.ip_address(value))]
+    except ValueError:
+        pass
+    if not _HOSTNAME.match(value):
+        raise ValueError(f"not a hostname or IP address: {value}")
+    return [value.lower().rstrip('.')]
+
+
+def _normalize(raw):
+    return {_ALIASES.get(k.strip().lower(), k.strip().lower()): v for k, v in raw.items() if k}
+
+
+def _records(path, fmt=None):
+    """(line or position, dict) for each entry in the file; document-level
+    group thresholds come first as ('groups', {'group': name, ...})."""
+    fmt = (fmt or os.path.splitext(path)[1].lstrip('.')).lower()
+    if fmt == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            numbers = []  # file line number of each line handed to the reader
+
+            def lines():
+                for number, line in enumerate(f, start=1):
+                    if line.strip() and not line.lstrip().startswith('#'):
+                        numbers.append(number)
+                        yield line
+            reader = csv.DictReader(lines())
+            start = reader.line_num if reader.fieldnames else 0
+            for row in reader:
+                # a quoted field can span lines; report where the row begins
+                yield numbers[start], row
+                start = reader.line_num
+    elif fmt in ('jsonl', 'ndjson'):
+        with open(path, encoding='utf-8') as f:
+            for i, line in enumerate(f, start=1):
+                if line.strip():
+                    yield i, json.loads(line)
+    elif fmt in ('json', 'yaml', 'yml'):
+        with open(path, encoding='utf-8') as f:
+            if fmt == 'json':
+                doc = json.load(f)
+            else:
+                try:
+                    import yaml
+                except ImportError:
+                    raise ValueError("YAML inventories need PyYAML (pip install pyyaml)")
+                doc = yaml.safe_load(f)
+        if isinstance(doc, dict):
+            groups = doc.get('groups') or {}
+            if isinstance(groups, list):
+                groups = {g.get('name'): g for g in groups}
+            for name, thresholds in groups.items():
+                yield 'groups', dict(thresholds or {}, group=name)
+            doc = doc.get('hosts') or []
+        for i, entry in enumerate(doc, start=1):
+            yield i, entry if isinstance(entry, dict) else {'host': entry}
+    else:
+        raise ValueError(f"unsupported inventory format: {fmt}")
+
+
+@timed('inventory.parse')
+def parse(path, fmt=None, max_errors=100):
+    """Validates a file. Returns (entries, thresholds, errors):
+    entries   host -> {field: value} for the HOST_FIELDS present
+    thresholds group name -> {threshold column: value}
+    errors    ["line N: message", ...], at most max_errors."""
+    entries, thresholds, errors = {}, {}, []
+
+    def error(where, message):
+        if len(errors) < max_errors:
+            errors.append(f"{'groups' if where == 'groups' else f'line {where}'}: {message}")
+
+    for where, raw in _records(path, fmt):
+        try:
+            entry = _normalize(raw)
+            group = None if _blank(entry.get('group')) else str(entry['group']).strip()
+            limits = {k: _threshold(entry[k]) for k in database.THRESHOLD_COLUMNS if not _blank(entry.get(k))}
+            if limits:
+                if group is None:
+                    raise ValueError("thresholds need a group")
+                known = thresholds.setdefault(group, {})
+                for k, v in limits.items():
+                    if known.get(k, v) != v:
+                        raise ValueError(f"conflicting {k} for group {group}: {known[k]} and {v}")
+                    known[k] = v
+            if where == 'groups':
+                continue
+            fields = {}
+            if 'group' in entry:
+                fields['group'] = group
+            for k in ('tcp_port', 'tls_port'):
+                if k in entry:
+                    fields[k] = _port(entry[k])
+            for host in _hosts(entry.get('host')):
+                values = dict(fields)
+                if 'http_url' in entry:
+                    values['http_url'] = _url(str(entry['http_url'] or "").replace("{host}", host))
+                if host in entries and entries[host] != values:
+                    raise ValueError(f"{host} is listed more than once with different settings")
+                entries[host] = values
+        except (ValueError, TypeError) as e:
+            error(where, e)
+    return entries, thresholds, errors
+
+
+def sync(path, fmt=None, remove=True):
+    """Validates 'path' and, if every entry is valid, applies it: new hosts are
+    added, changed ones moved/updated and, with remove=True, hosts missing from
+    the file deleted. Returns database.sync_hosts' counts plus 'errors'; with
+    errors nothing is changed."""
+    entries, thresholds, errors = parse(path, fmt)
+    if errors:
+        return {'added': 0, 'moved': 0, 'updated': 0, 'unchanged': 0, 'removed': [], 'errors': errors}
+    result = database.sync_hosts(entries, thresholds, remove=remove)
+    result['errors'] = []
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or sync the NetPulse host inventory")
+    parser.add_argument('path')
+    parser.add_argument('--format', help="csv, jsonl, json or yaml (default: from the extension)")
+    parser.add_argument('--keep', action='store_true', help="do not remove hosts missing from the file")
+    args = parser.parse_args(argv)
+    database.init_db()
+    result = sync(args.path, args.format, remove=not args.keep)
+    for e in result['errors']:
+        print(e)
+    print(f"added {result['added']}, moved {result['moved']}, updated {result['updated']}, "
+          f"removed {len(result['removed'])}, unchanged {result['unchanged']}")
+    return 1 if result['errors'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,21 +1,38 @@
 # main_app.py - main application code (derived from prior large UI)
 # ui.py
-from scheduler import schedule_job, start_scheduler, stop_scheduler
+from scheduler import schedule_job, unschedule_job, start_scheduler, stop_scheduler
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+import collections
+import concurrent.futures
+import multiprocessing
+import os
 import sys
 import threading
 import time
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLineEdit,
-                             QLabel, QTextEdit, QTableWidget, QTableWidgetItem, QComboBox, QSpinBox,
+                             QLabel, QTextEdit, QPlainTextEdit, QTableWidget, QTableWidgetItem, QComboBox, QSpinBox,
                              QFileDialog, QMessageBox, QTabWidget, QGroupBox, QDateEdit, QCheckBox)
-from PyQt5.QtCore import QThread, pyqtSignal, Qt, QDate
+from PyQt5.QtCore import QThread, pyqtSignal, Qt, QDate, QTimer
 import database
 import utils
 import network_tests
+import probe_engine
+import sharded_probe
 import reporting
+import rate_limiter
+import alert_pipeline
+import metrics_exporter
+import instrumentation
+import recent_cache
+import topology
+import baseline
+import archive
+import inventory
+from event_channel import EventChannel
 from datetime import datetime
 import pandas as pd
+import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # for report generation
 
@@ -23,70 +40,20 @@ matplotlib.use('Agg')  # for report generation
 
 
 class TestWorker(QThread):
-    update = pyqtSignal(dict)  # emits dict with host and stats
-
-    def __init__(self, hosts_with_groups, interval=10, once=False):
+    def __init__(self, hosts_with_groups, channel, interval=10, once=False):
         super().__init__()
         # list of tuples: (host, group_id)
         self.hosts_with_groups = hosts_with_groups
+        self.channel = channel  # results are pushed as ('result', dict) events
         self.interval = interval
         self._running = True
         self.once = once
 
     def run(self):
         while self._running:
-            for host, group_id in self.hosts_with_groups:
-                if not self._running:
-                    break
-                stats = network_tests.ping_stats(host, count=5)
-                dns_time = network_tests.dns_lookup(host)
-                tracer = network_tests.traceroute(host)
-                timestamp = utils.now_iso()
-                # Check alerts
-                thresholds = database.get_thresholds(group_id) if group_id else {
-                    "max_latency": 200, "max_packet_loss": 5, "max_jitter": 50}
-                alerts = []
-                try:
-                    if stats['avg_latency'] is not None and stats['avg_latency'] > thresholds['max_latency']:
-                        alerts.append(
-                            f"Latency {stats['avg_latency']:.1f}ms > {thresholds['max_latency']}ms")
-                    if stats['packet_loss'] is not None and stats['packet_loss'] > thresholds['max_packet_loss']:
-                        alerts.append(
-                            f"PacketLoss {stats['packet_loss']:.1f}% > {thresholds['max_packet_loss']}%")
-                    if stats['jitter'] is not None and stats['jitter'] > thresholds['max_jitter']:
-                        alerts.append(
-                            f"Jitter {stats['jitter']:.1f}ms > {thresholds['max_jitter']}ms")
-                except Exception:
-                    pass
-                if alerts:
-                    alerts_text = "; ".join(alerts)
-                else:
-                    alerts_text = ""
-
-                database.save_result(
-                    host,
-                    group_id,
-                    timestamp,
-                    stats['avg_latency'] if stats['avg_latency'] else None,
-                    stats['packet_loss'] if stats['packet_loss'] else None,
-                    stats['jitter'] if stats['jitter'] else None,
-                    stats['min_latency'] if stats.get('min_latency') else None,
-                    stats['max_latency'] if stats.get('max_latency') else None,
-                    dns_time if dns_time else None,
-                    tracer,
-                    stats.get('tcp_retrans_rate', None),
-                    alerts_text
-                )
-
-                self.update.emit({
-                    "host": host,
-                    "group_id": group_id,
-                    "timestamp": timestamp,
-                    "stats": stats,
-                    "dns_time": dns_time,
-                    "traceroute": tracer,
-                    "alerts": alerts_text
-                })
+            # alerts are evaluated in small batches so the GUI still sees results while a sweep runs
+            probe_engine.run_sweep(self.hosts_with_groups, should_continue=lambda: self._running,
+                                   on_result=lambda r: self.channel.push('result', r), batch_size=10)
             if self.once:
                 break
             # sleep
@@ -102,29 +69,56 @@ class TestWorker(QThread):
 
 
 class LivePlot(FigureCanvas):
+    MAX_HOSTS = 50     # lines drawn; the most recently updated hosts win
+
     def __init__(self, parent=None, width=5, height=3, dpi=100):
         fig = Figure(figsize=(width, height), dpi=dpi)
         self.axes = fig.add_subplot(111)
         super().__init__(fig)
         self.setParent(parent)
-        self._data = {}  # host -> list of (timestamp, value)
-
-    def add_point(self, host, timestamp, value):
-        if value is None:
-            return
-        self._data.setdefault(host, []).append((timestamp, value))
-        # keep last N points
-        if len(self._data[host]) > 2000:
-            self._data[host] = self._data[host][-2000:]
+        self._data = {}  # host -> (epoch seconds int64 array, values float array)
+        self.dirty = False
+        self._next_draw = 0.0
+
+    def set_series(self, host, timestamps, values, redraw=False):
+        """Replaces a host's line. The arrays are kept as given (views into
+        recent_cache are fine) and only read when drawing."""
+        self._data.pop(host, None)
+        self._data[host] = (timestamps, values)  # dict order: least recently updated first
+        self.dirty = True
+        if redraw:
+            self.draw_plot()
+
+    def add_points(self, points):
+        """Plots (host, timestamp, value) tuples, e.g. database rows, with one redraw."""
+        by_host = {}
+        for host, timestamp, value in points:
+            if value is not None:
+                by_host.setdefault(host, ([], []))
+                by_host[host][0].append(int(baseline.to_epoch(timestamp)))
+                by_host[host][1].append(value)
+        for host, (ts, values) in by_host.items():
+            self.set_series(host, np.array(ts, dtype=np.int64), np.array(values, dtype=np.float32))
         self.draw_plot()
 
+    def redraw_if_dirty(self):
+        """Redraws at most as often as drawing itself allows, so a long sweep
+        cannot keep the GUI thread busy with back-to-back redraws."""
+        now = time.monotonic()
+        if self.dirty and now >= self._next_draw:
+            self.draw_plot()
+            self._next_draw = time.monotonic() + max(0.5, 4 * (time.monotonic() - now))
+
     def draw_plot(self):
+        self.dirty = False
         self.axes.clear()
-        for host, points in self._data.items():
-            xs = [pd.to_datetime(p[0]) for p in points]
-            ys = [p[1] for p in points]
-            self.axes.plot(xs, ys, marker='o', label=host)
-        self.axes.legend(loc='upper left', fontsize='small', ncol=1)
+        hosts = list(self._data.items())[-self.MAX_HOSTS:]
+        for host, (ts, values) in hosts:
+            self.axes.plot(ts.astype('datetime64[s]'), values, marker='o', label=host)
+        if hosts and len(hosts) <= 20:
+            self.axes.legend(loc='upper left', fontsize='small', ncol=1)
+        if len(self._data) > len(hosts):
+            self.axes.set_title(f"{len(hosts)} of {len(self._data)} hosts", fontsize='small')
         self.axes.set_ylabel('ms')
         self.axes.set_xlabel('Time')
         self.axes.grid(True)
@@ -132,8 +126,17 @@ class LivePlot(FigureCanvas):
 
     def clear(self):
         self._data = {}
+        self.dirty = False
         self.axes.clear()
-        self.draw()
+        self.draw_idle()
+
+
+def log_view(max_lines=5000):
+    """Read-only append-only log; old lines are discarded past max_lines."""
+    view = QPlainTextEdit()
+    view.setReadOnly(True)
+    view.setMaximumBlockCount(max_lines)
+    return view
 
 # Main GUI
 
@@ -147,6 +150,14 @@ class NetPulseApp(QWidget):
         database.init_db()
         self.worker = None
         self.scheduled_jobs = {}  # job_id -> job info
+        recent_cache.get_cache()  # warm recent results before the first view needs them
+        # probe and scheduler threads never touch widgets; they push here and
+        # drain_events applies everything queued on the GUI thread
+        self.events = EventChannel()
+        try:
+            metrics_exporter.start_exporter()
+        except OSError as e:
+            self.log_schedule(f"Metrics endpoint not started: {e}")
 
         layout = QVBoxLayout()
         tabs = QTabWidget()
@@ -154,9 +165,58 @@ class NetPulseApp(QWidget):
         tabs.addTab(self.setup_schedule_tab(), "Scheduled Tests")
         tabs.addTab(self.setup_manual_tab(), "Manual Test")
         tabs.addTab(self.setup_history_tab(), "Historical Reports")
+        tabs.addTab(self.setup_diagnostics_tab(), "Diagnostics")
         layout.addWidget(tabs)
         self.setLayout(layout)
 
+        self.event_timer = QTimer(self)
+        self.event_timer.timeout.connect(self.drain_events)
+        self.event_timer.start(100)
+        # move old days to the cold archive off the GUI thread
+        schedule_job('netpulse-archive', self.run_archive, {'type': 'interval', 'seconds': 6 * 3600}, ())
+
+    def drain_events(self):
+        logs = collections.defaultdict(list)
+        updated = set()
+        for kind, payload in self.events.drain():
+            if kind == 'result':
+                stats = payload['stats']
+                logs['manual'].append(
+                    f"{payload['timestamp']} - {payload['host']} - avg: {stats.get('avg_latency')}ms "
+                    f"loss: {stats.get('packet_loss')}% jitter: {stats.get('jitter')} alerts: {payload.get('alerts')}")
+                updated.add(payload['host'])
+            else:
+                logs[kind].append(payload)
+        if logs['manual']:
+            self.manual_log.appendPlainText("\n".join(logs['manual']))
+        if logs['schedule']:
+            self.schedule_log.appendPlainText("\n".join(logs['schedule']))
+        if logs['archive']:
+            self.show_archive_stats()
+        for result in logs['inventory']:
+            self.inventory_done(result)
+        for payload in logs['history_summary']:
+            self.show_history_summary(*payload)
+        for payload in logs['history_page']:
+            self.history_page_ready(*payload)
+        cache = recent_cache.get_cache()
+        for host in updated:
+            series = cache.series(host, 'avg_latency')
+            if series is not None:
+                self.live_plot.set_series(host, *series)
+        self.live_plot.redraw_if_dirty()
+
+    def log_schedule(self, text):
+        """Safe from any thread."""
+        self.events.push('schedule', text)
+
+    def closeEvent(self, event):
+        # no new jobs, then stop the probe processes so none outlive the window
+        stop_scheduler()
+        sharded_probe.shutdown_probers()
+        self._history_pool.shutdown(wait=False)
+        super().closeEvent(event)
+
     # Tab 1: Hosts & Groups
     def setup_hosts_tab(self):
         widget = QWidget()
@@ -199,15 +259,38 @@ class NetPulseApp(QWidget):
         hbox.addWidget(QLabel("IP Range (start-end):"))
         hbox.addWidget(self.range_input)
         hbox.addWidget(add_range_btn)
+        import_btn = QPushButton("Import / Sync Inventory...")
+        import_btn.clicked.connect(self.import_inventory)
+        hbox.addWidget(import_btn)
+        self.inventory_remove = QCheckBox("Remove hosts not in file")
+        hbox.addWidget(self.inventory_remove)
 
         host_box.setLayout(hbox)
         v.addWidget(host_box)
 
+        # Optional service checks for hosts that drop ICMP (0 / empty = off)
+        svc_box = QGroupBox("Service Checks for New Hosts")
+        svc_layout = QHBoxLayout()
+        self.svc_tcp_port = QSpinBox()
+        self.svc_tcp_port.setRange(0, 65535)
+        self.svc_tls_port = QSpinBox()
+        self.svc_tls_port.setRange(0, 65535)
+        self.svc_http_url = QLineEdit()
+        self.svc_http_url.setPlaceholderText("http(s)://host/path, {host} is replaced")
+        svc_layout.addWidget(QLabel("TCP Port:"))
+        svc_layout.addWidget(self.svc_tcp_port)
+        svc_layout.addWidget(QLabel("TLS Port:"))
+        svc_layout.addWidget(self.svc_tls_port)
+        svc_layout.addWidget(QLabel("HTTP URL:"))
+        svc_layout.addWidget(self.svc_http_url)
+        svc_box.setLayout(svc_layout)
+        v.addWidget(svc_box)
+
     # -------------------- Hosts Table --------------------
         self.host_table = QTableWidget()
-        self.host_table.setColumnCount(4)
+        self.host_table.setColumnCount(5)
         self.host_table.setHorizontalHeaderLabels(
-            ["ID", "Host", "Group", "Remove"])
+            ["ID", "Host", "Group", "Service Checks", "Remove"])
         v.addWidget(self.host_table)
 
         refresh_btn = QPushButton("Refresh Host List")
@@ -229,6 +312,18 @@ class NetPulseApp(QWidget):
         self.thr_jitter = QSpinBox()
         self.thr_jitter.setRange(0, 100000)
         self.thr_jitter.setValue(50)
+        # 0 disables the DNS / retransmission checks
+        self.thr_dns_time = QSpinBox()
+        self.thr_dns_time.setRange(0, 100000)
+        self.thr_retrans = QSpinBox()
+        self.thr_retrans.setRange(0, 100)
+        # service check limits, for hosts with TCP/TLS/HTTP checks; 0 disables
+        self.thr_tcp_connect = QSpinBox()
+        self.thr_tcp_connect.setRange(0, 100000)
+        self.thr_tls_handshake = QSpinBox()
+        self.thr_tls_handshake.setRange(0, 100000)
+        self.thr_http_ttfb = QSpinBox()
+        self.thr_http_ttfb.setRange(0, 100000)
         set_thr_btn = QPushButton("Set Thresholds")
         set_thr_btn.clicked.connect(self.set_thresholds)
 
@@ -240,6 +335,14 @@ class NetPulseApp(QWidget):
         thr_layout.addWidget(self.thr_pkt_loss)
         thr_layout.addWidget(QLabel("Max Jitter (ms):"))
         thr_layout.addWidget(self.thr_jitter)
+        thr_layout.addWidget(QLabel("Max DNS (ms):"))
+        thr_layout.addWidget(self.thr_dns_time)
+        thr_layout.addWidget(QLabel("Max Retrans (%):"))
+        thr_layout.addWidget(self.thr_retrans)
+        thr_layout.addWidget(QLabel("Max TCP/TLS/TTFB (ms):"))
+        thr_layout.addWidget(self.thr_tcp_connect)
+        thr_layout.addWidget(self.thr_tls_handshake)
+        thr_layout.addWidget(self.thr_http_ttfb)
         thr_layout.addWidget(set_thr_btn)
 
         thr_box.setLayout(thr_layout)
@@ -278,7 +381,7 @@ class NetPulseApp(QWidget):
             QMessageBox.warning(self, "Validation", "Host/IP required")
             return
         group_id = self.group_select.currentData()
-        database.add_host(host, group_id)
+        database.add_host(host, group_id, *self.service_settings(host))
         self.single_host_input.clear()
         self.refresh_hosts()
 
@@ -290,12 +393,47 @@ class NetPulseApp(QWidget):
         group_id = self.group_select.currentData()
         ips = utils.expand_ip_range(rng)
         for ip in ips:
-            database.add_host(ip, group_id)
+            database.add_host(ip, group_id, *self.service_settings(ip))
         self.range_input.clear()
         self.refresh_hosts()
 
+    def import_inventory(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Inventory File", "", "Inventory (*.csv *.jsonl *.json *.yaml *.yml);;All Files (*)")
+        if not path:
+            return
+        remove = self.inventory_remove.isChecked()
+
+        def run():
+            try:
+                self.events.push('inventory', inventory.sync(path, remove=remove))
+            except Exception as e:
+                self.events.push('inventory', {'errors': [str(e)]})
+        threading.Thread(target=run, name="inventory-sync", daemon=True).start()
+
+    def inventory_done(self, result):
+        if result['errors']:
+            QMessageBox.warning(self, "Inventory not imported", "\n".join(result['errors'][:20]))
+            return
+        for host in result['removed']:
+            recent_cache.get_cache().forget(host)
+            topology.get_graph().forget(host)
+            metrics_exporter.get_snapshot().forget_host(host)
+        self.refresh_groups()
+        self.refresh_hosts()
+        QMessageBox.information(
+            self, "Inventory imported",
+            f"Added {result['added']}, moved {result['moved']}, updated {result['updated']}, "
+            f"removed {len(result['removed'])}, unchanged {result['unchanged']}")
+
+    def service_settings(self, host):
+        """(tcp_port, tls_port, http_url) from the Service Checks inputs."""
+        url = self.svc_http_url.text().strip().replace("{host}", host)
+        return self.svc_tcp_port.value() or None, self.svc_tls_port.value() or None, url or None
+
     def refresh_hosts(self):
         rows = database.list_hosts()
+        services = database.host_services()
         self.host_table.setRowCount(len(rows))
         for i, row in enumerate(rows):
             host_id, host, group_id, group_name = row
@@ -303,15 +441,23 @@ class NetPulseApp(QWidget):
             self.host_table.setItem(i, 1, QTableWidgetItem(host))
             self.host_table.setItem(i, 2, QTableWidgetItem(
                 group_name if group_name else "None"))
+            tcp_port, tls_port, http_url = services.get(host, (None, None, None))
+            checks = [f"tcp:{tcp_port}" if tcp_port else "", f"tls:{tls_port}" if tls_port else "", http_url or ""]
+            self.host_table.setItem(i, 3, QTableWidgetItem(" ".join(c for c in checks if c)))
             rem_btn = QPushButton("Remove")
 
             def make_remove(rid):
                 return lambda: self.remove_host(rid)
             rem_btn.clicked.connect(make_remove(host_id))
-            self.host_table.setCellWidget(i, 3, rem_btn)
+            self.host_table.setCellWidget(i, 4, rem_btn)
 
     def remove_host(self, host_id):
+        host = next((r[1] for r in database.list_hosts() if r[0] == host_id), None)
         database.delete_host(host_id)
+        if host and not any(r[1] == host for r in database.list_hosts()):
+            recent_cache.get_cache().forget(host)
+            topology.get_graph().forget(host)
+            metrics_exporter.get_snapshot().forget_host(host)
         self.refresh_hosts()
 
     def set_thresholds(self):
@@ -320,7 +466,10 @@ class NetPulseApp(QWidget):
             QMessageBox.warning(self, "Validation", "Select a group")
             return
         database.set_thresholds(gid, float(self.thr_max_latency.value()), float(
-            self.thr_pkt_loss.value()), float(self.thr_jitter.value()))
+            self.thr_pkt_loss.value()), float(self.thr_jitter.value()),
+            float(self.thr_dns_time.value()) or None, float(self.thr_retrans.value()) or None,
+            float(self.thr_tcp_connect.value()) or None, float(self.thr_tls_handshake.value()) or None,
+            float(self.thr_http_ttfb.value()) or None)
         QMessageBox.information(self, "Success", "Thresholds updated")
 
     # Tab 2: Scheduling
@@ -343,6 +492,18 @@ class NetPulseApp(QWidget):
         self.schedule_job_name = QLineEdit("job1")
         blayout.addWidget(QLabel("Job name:"))
         blayout.addWidget(self.schedule_job_name)
+        blayout.addWidget(QLabel("Probe rate (pkts/s):"))
+        self.probe_rate = QSpinBox()
+        self.probe_rate.setRange(1, 10000)
+        self.probe_rate.setValue(int(rate_limiter.DEFAULT_RATE))
+        self.probe_rate.valueChanged.connect(
+            lambda v: rate_limiter.configure(rate=v, burst=max(v * 2, 10)))
+        blayout.addWidget(self.probe_rate)
+        blayout.addWidget(QLabel("Probe processes:"))
+        self.probe_processes = QSpinBox()
+        self.probe_processes.setRange(1, max(os.cpu_count() or 1, 1) * 2)
+        self.probe_processes.setValue(1)  # 1 = probe inside this process
+        blayout.addWidget(self.probe_processes)
         add_job_btn = QPushButton("Start Schedule")
         add_job_btn.clicked.connect(self.start_schedule)
         stop_job_btn = QPushButton("Stop Schedule")
@@ -368,14 +529,70 @@ class NetPulseApp(QWidget):
         export_box.setLayout(ex_layout)
         v.addWidget(export_box)
 
+        # Alert notifications (sent once when an alert starts firing and once when it resolves)
+        notify_box = QGroupBox("Alert Notifications")
+        n_layout = QHBoxLayout()
+        self.sink_kind = QComboBox()
+        self.sink_kind.addItems(sorted(alert_pipeline.SINK_TYPES))
+        self.sink_target = QLineEdit()
+        self.sink_target.setPlaceholderText(
+            "http://127.0.0.1:8080/alerts | 127.0.0.1:514 | /path/alerts.jsonl")
+        add_sink_btn = QPushButton("Add Sink")
+        add_sink_btn.clicked.connect(self.add_sink)
+        clear_sinks_btn = QPushButton("Remove All Sinks")
+        clear_sinks_btn.clicked.connect(self.clear_sinks)
+        self.sinks_label = QLabel()
+        n_layout.addWidget(QLabel("Type:"))
+        n_layout.addWidget(self.sink_kind)
+        n_layout.addWidget(QLabel("Target:"))
+        n_layout.addWidget(self.sink_target)
+        n_layout.addWidget(add_sink_btn)
+        n_layout.addWidget(clear_sinks_btn)
+        n_layout.addWidget(self.sinks_label)
+        notify_box.setLayout(n_layout)
+        v.addWidget(notify_box)
+        self.refresh_sinks()
+        for message in alert_pipeline.get_pipeline().sink_errors:  # from loading the saved sinks
+            self.log_schedule(message)
+
         # Status log
-        self.schedule_log = QTextEdit()
-        self.schedule_log.setReadOnly(True)
+        self.schedule_log = log_view()
         v.addWidget(self.schedule_log)
 
         widget.setLayout(v)
         return widget
 
+    def refresh_sinks(self):
+        sinks = database.list_sinks()
+        self.sinks_label.setText(
+            ", ".join(f"{kind}:{target}" for _, kind, target in sinks) or "No sinks")
+
+    def add_sink(self):
+        kind = self.sink_kind.currentText()
+        target = self.sink_target.text().strip()
+        if not target:
+            QMessageBox.warning(self, "Validation", "Sink target required")
+            return
+        try:
+            alert_pipeline.sink_from_config(kind, target)
+        except Exception as e:
+            QMessageBox.warning(self, "Validation", f"Invalid sink: {e}")
+            return
+        database.add_sink(kind, target)
+        self.reload_sinks()
+        self.sink_target.clear()
+        self.refresh_sinks()
+
+    def clear_sinks(self):
+        for sink_id, _, _ in database.list_sinks():
+            database.delete_sink(sink_id)
+        self.reload_sinks()
+        self.refresh_sinks()
+
+    def reload_sinks(self):
+        for message in alert_pipeline.get_pipeline().reload_sinks():
+            self.log_schedule(message)
+
     def select_export_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Export Folder")
         if folder:
@@ -402,63 +619,43 @@ class NetPulseApp(QWidget):
             return
         # define job function
 
-        def job_run(hosts_list, export_folder, export_format):
-            self.schedule_log.append(
+        def job_run(hosts_list, export_folder, export_format, processes):
+            self.log_schedule(
                 f"{datetime.utcnow().isoformat()} - Running scheduled test for group_id={group_id}")
-            # run once via TestWorker-like loop
-            for host, gid in hosts_list:
-                stats = network_tests.ping_stats(host, count=5)
-                dns_time = network_tests.dns_lookup(host)
-                tracer = network_tests.traceroute(host)
-                timestamp = utils.now_iso()
-                thresholds = database.get_thresholds(gid) if gid else {
-                    "max_latency": 200, "max_packet_loss": 5, "max_jitter": 50}
-                alerts = []
-                try:
-                    if stats['avg_latency'] is not None and stats['avg_latency'] > thresholds['max_latency']:
-                        alerts.append(
-                            f"Latency {stats['avg_latency']:.1f}ms > {thresholds['max_latency']}ms")
-                    if stats['packet_loss'] is not None and stats['packet_loss'] > thresholds['max_packet_loss']:
-                        alerts.append(
-                            f"PacketLoss {stats['packet_loss']:.1f}% > {thresholds['max_packet_loss']}%")
-                    if stats['jitter'] is not None and stats['jitter'] > thresholds['max_jitter']:
-                        alerts.append(
-                            f"Jitter {stats['jitter']:.1f}ms > {thresholds['max_jitter']}ms")
-                except Exception:
-                    pass
-                alerts_text = "; ".join(alerts) if alerts else ""
-                database.save_result(host, gid, timestamp,
-                                     stats['avg_latency'] if stats['avg_latency'] else None,
-                                     stats['packet_loss'] if stats['packet_loss'] else None,
-                                     stats['jitter'] if stats['jitter'] else None,
-                                     stats['min_latency'] if stats.get(
-                                         'min_latency') else None,
-                                     stats['max_latency'] if stats.get(
-                                         'max_latency') else None,
-                                     dns_time if dns_time else None,
-                                     tracer,
-                                     alerts_text)
+            if processes > 1:
+                results = sharded_probe.get_prober(processes).sweep(hosts_list)
+            else:
+                results = probe_engine.run_sweep(hosts_list)
+            alert_count = sum(1 for r in results if r['alerts'])
+            self.log_schedule(f"Probed {len(results)} hosts, {alert_count} with alerts")
+            if alert_count >= 3:
+                for s in topology.get_graph().shared_fate([r['host'] for r in results if r['alerts']])[:3]:
+                    self.log_schedule(f"Shared path {' > '.join(s['segment'])}: "
+                                      f"{s['alerting']} of {s['hosts']} hosts behind it alerting")
+            self.log_schedule(
+                f"Probe limiter wait so far: {network_tests.limiter_stats()['wait_time']:.1f}s")
             # export after run
             try:
-                rows = database.query_results()
                 folder = export_folder
                 if export_format == "Excel":
+                    rows = database.iter_results()
                     path = f"{folder}/NetPulse_Schedule_{job_name}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.xlsx"
-                    reporting.export_to_excel(path, rows)
-                    self.schedule_log.append(f"Exported Excel to {path}")
+                    reporting.export_to_excel(path, rows, summary=database.summarize_results())
+                    self.log_schedule(f"Exported Excel to {path}")
                 else:
                     path = f"{folder}/NetPulse_Schedule_{job_name}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.pdf"
-                    reporting.export_to_pdf(path, rows)
-                    self.schedule_log.append(f"Exported PDF to {path}")
+                    reporting.export_to_pdf(path, database.summarize_results(), database.latency_series())
+                    self.log_schedule(f"Exported PDF to {path}")
             except Exception as e:
-                self.schedule_log.append(f"Export error: {e}")
+                self.log_schedule(f"Export error: {e}")
 
         # schedule job
         start_scheduler()
         try:
             schedule_job(job_name, job_run, {'type': 'interval', 'seconds': interval}, (
-                hosts, self.export_folder_input.text(), self.export_format.currentText()))
-            self.schedule_log.append(
+                hosts, self.export_folder_input.text(), self.export_format.currentText(),
+                self.probe_processes.value()))
+            self.log_schedule(
                 f"Scheduled job '{job_name}' every {interval}s for group id {group_id}")
         except Exception as e:
             QMessageBox.critical(self, "Scheduler Error", str(e))
@@ -470,13 +667,8 @@ class NetPulseApp(QWidget):
                                 "Job name required to stop")
             return
         try:
-            from apscheduler.schedulers.base import JobLookupError
-            start_scheduler()
-            # remove job
-            from scheduler import _scheduler
-            if _scheduler:
-                _scheduler.remove_job(job_name)
-                self.schedule_log.append(f"Stopped job {job_name}")
+            unschedule_job(job_name)
+            self.log_schedule(f"Stopped job {job_name}")
         except Exception as e:
             QMessageBox.warning(self, "Error", f"Could not stop job: {e}")
 
@@ -506,8 +698,7 @@ class NetPulseApp(QWidget):
         v.addWidget(self.live_plot)
 
         # Results table/log
-        self.manual_log = QTextEdit()
-        self.manual_log.setReadOnly(True)
+        self.manual_log = log_view()
         v.addWidget(self.manual_log)
 
         # Export
@@ -553,34 +744,24 @@ class NetPulseApp(QWidget):
                                 "Another test is running")
             return
         self.live_plot.clear()
-        self.worker = TestWorker(hosts, interval=5, once=True)
-        self.worker.update.connect(self.handle_worker_update)
+        self.worker = TestWorker(hosts, self.events, interval=5, once=True)
         self.worker.start()
 
-    def handle_worker_update(self, data):
-        host = data['host']
-        stats = data['stats']
-        ts = data['timestamp']
-        self.manual_log.append(
-            f"{ts} - {host} - avg: {stats.get('avg_latency')}ms loss: {stats.get('packet_loss')}% jitter: {stats.get('jitter')} alerts: {data.get('alerts')}")
-        if stats.get('avg_latency') is not None:
-            self.live_plot.add_point(host, ts, stats.get('avg_latency'))
-
     def export_manual_results(self):
         # export all results for group within last day by default
         gid = self.manual_group_select.currentData()
-        rows = database.query_results()
         folder = QFileDialog.getExistingDirectory(self, "Select Export Folder")
         if not folder:
             return
         fmt = self.manual_export_format.currentText()
         if fmt == "Excel":
+            rows = database.iter_results()
             path = f"{folder}/NetPulse_Manual_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.xlsx"
-            reporting.export_to_excel(path, rows)
+            reporting.export_to_excel(path, rows, summary=database.summarize_results())
             QMessageBox.information(self, "Exported", f"Excel saved to {path}")
         else:
             path = f"{folder}/NetPulse_Manual_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.pdf"
-            reporting.export_to_pdf(path, rows)
+            reporting.export_to_pdf(path, database.summarize_results(), database.latency_series())
             QMessageBox.information(self, "Exported", f"PDF saved to {path}")
 
     # Tab 4: History
@@ -602,15 +783,33 @@ class NetPulseApp(QWidget):
         h.addWidget(self.start_date)
         h.addWidget(QLabel("End:"))
         h.addWidget(self.end_date)
+        self.history_host = QLineEdit()
+        self.history_host.setPlaceholderText("all hosts")
+        h.addWidget(QLabel("Host:"))
+        h.addWidget(self.history_host)
+        self.history_alerts_only = QCheckBox("Alerts only")
+        h.addWidget(self.history_alerts_only)
         load_btn = QPushButton("Load")
         load_btn.clicked.connect(self.load_history)
         h.addWidget(load_btn)
         v.addLayout(h)
-        # Table and plot
+        # the table is filled a page at a time while scrolling; the next page
+        # is fetched in the background as soon as the previous one is shown
+        self._history_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self._history_query = None
+        self._history_ready = None  # (rows, key) of the prefetched page, once it has arrived
+        self._history_gen = 0
+        # per-host summary, raw table and plot
+        self.history_summary = QTableWidget()
+        self.history_summary.setColumnCount(8)
+        self.history_summary.setHorizontalHeaderLabels(
+            ["Host", "Samples", "Avg Latency", "p50", "p95", "Max", "Avg PacketLoss", "Alerts"])
+        v.addWidget(self.history_summary)
         self.history_table = QTableWidget()
         self.history_table.setColumnCount(6)
         self.history_table.setHorizontalHeaderLabels(
             ["Timestamp", "Host", "Avg Latency", "PacketLoss", "Jitter", "Alerts"])
+        self.history_table.verticalScrollBar().valueChanged.connect(self.history_scrolled)
         v.addWidget(self.history_table)
         self.history_plot = LivePlot(self, width=8, height=3)
         v.addWidget(self.history_plot)
@@ -621,33 +820,92 @@ class NetPulseApp(QWidget):
         widget.setLayout(v)
         return widget
 
-    def load_history(self):
+    HISTORY_PAGE = 500
+    HISTORY_COLUMNS = ['timestamp', 'host', 'avg_latency', 'packet_loss', 'jitter', 'alerts']
+
+    def history_filters(self):
         gid = self.history_group_select.currentData()
-        start_ts = self.start_date.date().toString("yyyy-MM-dd") + " 00:00:00"
-        end_ts = self.end_date.date().toString("yyyy-MM-dd") + " 23:59:59"
-        group_ids = [gid] if gid else None
-        rows = database.query_results(
-            start_ts=start_ts, end_ts=end_ts, group_ids=group_ids)
-        self.history_table.setRowCount(len(rows))
+        return {'start_ts': self.start_date.date().toString("yyyy-MM-dd") + " 00:00:00",
+                'end_ts': self.end_date.date().toString("yyyy-MM-dd") + " 23:59:59",
+                'group_ids': [gid] if gid else None,
+                'host': self.history_host.text().strip() or None,
+                'alerts_only': self.history_alerts_only.isChecked()}
+
+    def load_history(self):
+        q = self.history_filters()
+        self._history_gen += 1
+        self._history_query = dict(q, limit=self.HISTORY_PAGE, columns=self.HISTORY_COLUMNS)
+        self.history_table.setRowCount(0)
+        self._history_ready = None
+        # clearing a large summary costs more than the first page; grey it out until replaced
+        self.history_summary.setEnabled(False)
+        self.history_plot.setEnabled(False)
+        rows, key = database.query_page(**self._history_query)
+        self.append_history_rows(rows)
+        self.prefetch_history(key)
+
+        # the summary and plot aggregate the whole filtered range; they arrive through drain_events
+        gen = self._history_gen
+
+        def aggregate():
+            self.events.push('history_summary', (gen, database.summarize_results(**q),
+                                                 database.latency_series(points=200, **q)))
+        threading.Thread(target=aggregate, name="history-summary", daemon=True).start()
+
+    def prefetch_history(self, key):
+        """Queries the page after 'key' on the history pool; it arrives through drain_events."""
+        if key is None:
+            return
+        gen = self._history_gen
+
+        def done(future):
+            try:
+                self.events.push('history_page', (gen,) + future.result())
+            except Exception as e:
+                self.log_schedule(f"History page failed: {e}")
+        self._history_pool.submit(database.query_page, after=key, **self._history_query).add_done_callback(done)
+
+    def history_page_ready(self, gen, rows, key):
+        if gen != self._history_gen:
+            return  # filters changed while it was fetched
+        self._history_ready = (rows, key)
+        self.history_scrolled(self.history_table.verticalScrollBar().value())
+
+    def history_scrolled(self, value):
+        bar = self.history_table.verticalScrollBar()
+        if self._history_ready is not None and value >= bar.maximum() - 20:
+            rows, key = self._history_ready
+            self._history_ready = None
+            self.append_history_rows(rows)
+            self.prefetch_history(key)
+
+    def append_history_rows(self, rows):
+        first = self.history_table.rowCount()
+        self.history_table.setRowCount(first + len(rows))
+        for i, row in enumerate(rows, start=first):
+            for j, value in enumerate(row):
+                self.history_table.setItem(i, j, QTableWidgetItem(value if j < 2 else str(value)))
+
+    def show_history_summary(self, gen, summary, series):
+        if gen != self._history_gen:
+            return  # filters changed while it was computed
+        self.history_summary.setRowCount(len(summary))
+        self.history_summary.setEnabled(True)
+        for i, row in enumerate(summary):
+            s = dict(zip(database.SUMMARY_COLUMNS, row))
+            cells = [s['host'], s['samples'], s['avg_latency'], s['p50_latency'], s['p95_latency'],
+                     s['max_latency'], s['avg_packet_loss'], s['alert_count']]
+            for j, value in enumerate(cells):
+                text = f"{value:.2f}" if isinstance(value, float) else str(value)
+                self.history_summary.setItem(i, j, QTableWidgetItem(text))
+        # bucketed averages: a long range draws a few hundred points per host, not every sample
         self.history_plot.clear()
-        for i, row in enumerate(rows):
-            _, host, _, timestamp, avg, pkt, jitter, *_, alerts = row
-            self.history_table.setItem(i, 0, QTableWidgetItem(timestamp))
-            self.history_table.setItem(i, 1, QTableWidgetItem(host))
-            self.history_table.setItem(i, 2, QTableWidgetItem(str(avg)))
-            self.history_table.setItem(i, 3, QTableWidgetItem(str(pkt)))
-            self.history_table.setItem(i, 4, QTableWidgetItem(str(jitter)))
-            self.history_table.setItem(i, 5, QTableWidgetItem(str(alerts)))
-            if avg is not None:
-                self.history_plot.add_point(host, timestamp, avg)
+        self.history_plot.add_points(series)
+        self.history_plot.setEnabled(True)
 
     def export_history(self):
-        gid = self.history_group_select.currentData()
-        start_ts = self.start_date.date().toString("yyyy-MM-dd") + " 00:00:00"
-        end_ts = self.end_date.date().toString("yyyy-MM-dd") + " 23:59:59"
-        group_ids = [gid] if gid else None
-        rows = database.query_results(
-            start_ts=start_ts, end_ts=end_ts, group_ids=group_ids)
+        # the same filters as the table on screen, for every sheet and chart
+        q = self.history_filters()
         folder = QFileDialog.getExistingDirectory(self, "Select Export Folder")
         if not folder:
             return
@@ -656,14 +914,160 @@ class NetPulseApp(QWidget):
         if not fmt:
             return
         if fmt.endswith(".xlsx"):
-            reporting.export_to_excel(fmt, rows)
+            reporting.export_to_excel(fmt, database.iter_results(**q), summary=database.summarize_results(**q))
             QMessageBox.information(self, "Exported", f"Excel saved to {fmt}")
         else:
-            reporting.export_to_pdf(fmt, rows)
+            reporting.export_to_pdf(fmt, database.summarize_results(**q), database.latency_series(**q))
             QMessageBox.information(self, "Exported", f"PDF saved to {fmt}")
 
 
+    # Tab 5: Diagnostics
+    def setup_diagnostics_tab(self):
+        widget = QWidget()
+        v = QVBoxLayout()
+        h = QHBoxLayout()
+        self.timing_enabled = QCheckBox("Enable stage timing")
+        self.timing_enabled.setChecked(instrumentation.is_enabled())
+        self.timing_enabled.toggled.connect(instrumentation.enable)
+        h.addWidget(self.timing_enabled)
+        refresh_btn = QPushButton("Refresh")
+        refresh_btn.clicked.connect(self.refresh_diagnostics)
+        h.addWidget(refresh_btn)
+        reset_btn = QPushButton("Reset")
+        reset_btn.clicked.connect(lambda: (instrumentation.reset(), self.refresh_diagnostics()))
+        h.addWidget(reset_btn)
+        h.addWidget(QLabel("Profiler:"))
+        self.profiler_mode = QComboBox()
+        self.profiler_mode.addItem("cProfile (probe threads)", "cprofile")
+        self.profiler_mode.addItem("Sampling (all threads)", "sampling")
+        h.addWidget(self.profiler_mode)
+        self.profiler_btn = QPushButton("Start Profiler")
+        self.profiler_btn.clicked.connect(self.toggle_profiler)
+        h.addWidget(self.profiler_btn)
+        v.addLayout(h)
+
+        self.diag_table = QTableWidget()
+        self.diag_table.setColumnCount(6)
+        self.diag_table.setHorizontalHeaderLabels(
+            ["Stage", "Count", "p50 (ms)", "p99 (ms)", "Mean (ms)", "Total (s)"])
+        v.addWidget(self.diag_table)
+        self.cache_label = QLabel()
+        v.addWidget(self.cache_label)
+
+        topo_box = QGroupBox("Topology")
+        t_layout = QHBoxLayout()
+        self.topology_hop = QLineEdit()
+        self.topology_hop.setPlaceholderText("hop address")
+        t_layout.addWidget(self.topology_hop)
+        for label, handler in (("Hosts via Hop", self.show_hop_hosts),
+                               ("Route Changes (1h)", self.show_route_changes),
+                               ("Shared Fate of Firing Alerts", self.show_shared_fate)):
+            btn = QPushButton(label)
+            btn.clicked.connect(handler)
+            t_layout.addWidget(btn)
+        topo_box.setLayout(t_layout)
+        v.addWidget(topo_box)
+
+        archive_box = QGroupBox("Cold Archive")
+        a_layout = QHBoxLayout()
+        a_layout.addWidget(QLabel("Archive results older than (days):"))
+        self.archive_days = QSpinBox()
+        self.archive_days.setRange(1, 3650)
+        self.archive_days.setValue(archive.ARCHIVE_AFTER_DAYS)
+        self.archive_days.valueChanged.connect(archive.configure)
+        a_layout.addWidget(self.archive_days)
+        archive_btn = QPushButton("Archive Now")
+        archive_btn.clicked.connect(
+            lambda: threading.Thread(target=self.run_archive, name="archive", daemon=True).start())
+        a_layout.addWidget(archive_btn)
+        self.archive_label = QLabel()
+        a_layout.addWidget(self.archive_label, 1)
+        archive_box.setLayout(a_layout)
+        v.addWidget(archive_box)
+        self.show_archive_stats()
+        self.profiler_output = QTextEdit()
+        self.profiler_output.setReadOnly(True)
+        self.profiler_output.setLineWrapMode(QTextEdit.NoWrap)
+        v.addWidget(self.profiler_output)
+        widget.setLayout(v)
+
+        self.diag_timer = QTimer(self)
+        self.diag_timer.timeout.connect(self.refresh_diagnostics)
+        self.diag_timer.start(2000)
+        self.refresh_diagnostics()
+        return widget
+
+    def refresh_diagnostics(self):
+        c = recent_cache.get_cache().stats()
+        self.cache_label.setText(
+            f"Recent-results cache: {c['hosts']} hosts, {c['samples']} samples "
+            f"({c['capacity']} per host), {c['bytes'] / 1048576:.1f} MiB "
+            f"({c['bytes_per_host'] / 1024:.1f} KiB per host)")
+        rows = instrumentation.summary()
+        self.diag_table.setRowCount(len(rows))
+        for i, r in enumerate(rows):
+            self.diag_table.setItem(i, 0, QTableWidgetItem(r['stage']))
+            self.diag_table.setItem(i, 1, QTableWidgetItem(str(r['count'])))
+            self.diag_table.setItem(i, 2, QTableWidgetItem(f"{r['p50_ms']:.2f}"))
+            self.diag_table.setItem(i, 3, QTableWidgetItem(f"{r['p99_ms']:.2f}"))
+            self.diag_table.setItem(i, 4, QTableWidgetItem(f"{r['mean_ms']:.2f}"))
+            self.diag_table.setItem(i, 5, QTableWidgetItem(f"{r['total_ms'] / 1000:.2f}"))
+
+    def run_archive(self):
+        """Scheduler/worker thread: archive, then report through the event channel."""
+        if not archive.available():
+            self.log_schedule("Archive skipped: pyarrow is not installed")
+            return
+        try:
+            moved = archive.archive_older_than()
+            self.log_schedule(f"Archived {moved} results older than {archive.ARCHIVE_AFTER_DAYS} days")
+        except Exception as e:
+            self.log_schedule(f"Archive error: {e}")
+        self.events.push('archive', None)
+
+    def show_archive_stats(self):
+        if not archive.available():
+            self.archive_label.setText("pyarrow not installed; all results stay in SQLite")
+            return
+        a = archive.stats()
+        self.archive_label.setText(
+            f"{a['partitions']} partitions, {a['bytes'] / 1048576:.1f} MiB"
+            + (f", {a['first_day']} to {a['last_day']}" if a['partitions'] else ""))
+
+    def show_hop_hosts(self):
+        hop = self.topology_hop.text().strip()
+        graph = topology.get_graph()
+        hosts = graph.hosts_sharing(hop)
+        nexts = ", ".join(f"{h} ({n})" for h, n in sorted(graph.next_hops(hop).items()))
+        self.profiler_output.setPlainText(
+            f"{len(hosts)} hosts route via {hop}\nNext hops: {nexts or '-'}\n\n" + "\n".join(hosts))
+
+    def show_route_changes(self):
+        lines = [f"{datetime.utcfromtimestamp(epoch).isoformat(sep=' ', timespec='seconds')}  {host}\n"
+                 f"    was: {' > '.join(old)}\n    now: {' > '.join(new)}"
+                 for epoch, host, old, new in topology.get_graph().route_changes(within=3600)]
+        self.profiler_output.setPlainText(f"{len(lines)} route changes in the last hour\n\n" + "\n".join(lines))
+
+    def show_shared_fate(self):
+        firing = {a['host'] for a in alert_pipeline.get_pipeline().tracker.active()}
+        suspects = topology.get_graph().shared_fate(firing)
+        lines = [f"{' > '.join(s['segment'])}: {s['alerting']}/{s['hosts']} hosts alerting ({s['fraction']:.0%})"
+                 for s in suspects]
+        self.profiler_output.setPlainText(f"{len(firing)} hosts with firing alerts\n\n" +
+                                          ("\n".join(lines) or "No shared hop explains them"))
+
+    def toggle_profiler(self):
+        if instrumentation.profiler_running():
+            self.profiler_output.setPlainText(instrumentation.stop_profiler())
+            self.profiler_btn.setText("Start Profiler")
+        else:
+            instrumentation.start_profiler(self.profiler_mode.currentData())
+            self.profiler_output.setPlainText("Profiling...")
+            self.profiler_btn.setText("Stop Profiler")
+
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # probe worker processes in the frozen build
     app = QApplication(sys.argv)
     window = NetPulseApp()
     window.show()
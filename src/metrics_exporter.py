@@ -0,0 +1,210 @@
+# metrics_exporter.py
+# Local OpenMetrics/Prometheus endpoint. Every probe batch updates an
+# in-memory snapshot in which each host's sample lines are rendered up front;
+# a scrape only joins cached bytes and never touches the database.
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import database
+
+DEFAULT_PORT = 9464
+
+# (family name, help text, getter on a probe result)
+HOST_GAUGES = [
+    ('netpulse_host_latency_ms', 'Average RTT of the last probe', lambda r: r['stats'].get('avg_latency')),
+    ('netpulse_host_packet_loss_percent', 'Packet loss of the last probe', lambda r: r['stats'].get('packet_loss')),
+    ('netpulse_host_jitter_ms', 'RFC 3550 jitter of the last probe', lambda r: r['stats'].get('jitter')),
+    ('netpulse_host_dns_time_ms', 'DNS resolution time of the last probe', lambda r: r.get('dns_time')),
+    ('netpulse_host_tcp_retrans_percent', 'TCP retransmission rate of the last probe', lambda r: r.get('tcp_retrans_rate')),
+    ('netpulse_host_tcp_connect_ms', 'TCP connect time of the last service check', lambda r: r.get('tcp_connect_ms')),
+    ('netpulse_host_tls_handshake_ms', 'TLS handshake time of the last service check', lambda r: r.get('tls_handshake_ms')),
+    ('netpulse_host_http_ttfb_ms', 'HTTP time to first byte of the last service check', lambda r: r.get('http_ttfb_ms')),
+    ('netpulse_host_alerts', 'Alerts raised by the last probe', lambda r: len(r.get('alert_list', ()))),
+    ('netpulse_host_last_probe_timestamp_seconds', 'Time of the last probe', lambda r: r.get('epoch')),
+]
+# group families average the latest value of each host in the group
+GROUP_GAUGES = [
+    ('netpulse_group_latency_ms', 'Mean of the hosts\' last average RTT', 0),
+    ('netpulse_group_packet_loss_percent', 'Mean of the hosts\' last packet loss', 1),
+    ('netpulse_group_jitter_ms', 'Mean of the hosts\' last jitter', 2),
+]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _header(name, help_text, kind):
+    return f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n".encode()
+
+
+class MetricsSnapshot:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._host_lines = {}   # host -> tuple of bytes, one per HOST_GAUGES family
+        self._host_values = {}  # host -> (group_id, tuple of values feeding GROUP_GAUGES)
+        self._group_sums = {}   # group_id -> [count, [sum, n] per GROUP_GAUGES family]
+        self._group_names = {}
+        self._body = None       # cached gauge section, rebuilt after an update
+        self.probes_total = 0
+        self.batches_total = 0
+        self.last_batch_seconds = 0.0
+
+    def _group_name(self, group_id):
+        if group_id is None:
+            return "None"
+        if group_id not in self._group_names:
+            try:
+                self._group_names.update(database.list_groups())
+            except Exception:
+                pass
+            # remember unknown (e.g. deleted) groups so they are not looked up per host
+            self._group_names.setdefault(group_id, str(group_id))
+        return self._group_names[group_id]
+
+    def _add_to_group(self, group_id, values, sign):
+        sums = self._group_sums.setdefault(group_id, [0, [[0.0, 0] for _ in GROUP_GAUGES]])
+        sums[0] += sign
+        for slot, v in zip(sums[1], values):
+            if v is not None:
+                slot[0] += sign * v
+                slot[1] += sign
+
+    def update(self, results, batch_seconds=None):
+        with self._lock:
+            for r in results:
+                host = r['host']
+                group_id = r.get('group_id')
+                labels = f'{{host="{_escape(host)}",group="{_escape(self._group_name(group_id))}"}}'
+                lines = []
+                for _, _, getter in HOST_GAUGES:
+                    v = getter(r)
+                    lines.append(f"{labels} {v}\n".encode() if v is not None else b"")
+                self._host_lines[host] = tuple(lines)
+                values = tuple(getter(r) for _, _, getter in HOST_GAUGES[:len(GROUP_GAUGES)])
+                old = self._host_values.get(host)
+                if old is not None:
+                    self._add_to_group(old[0], old[1], -1)
+                self._add_to_group(group_id, values, 1)
+                self._host_values[host] = (group_id, values)
+            self.probes_total += len(results)
+            self.batches_total += 1
+            if batch_seconds is not None:
+                self.last_batch_seconds = batch_seconds
+            self._body = None
+
+    def forget_host(self, host):
+        with self._lock:
+            self._host_lines.pop(host, None)
+            old = self._host_values.pop(host, None)
+            if old is not None:
+                self._add_to_group(old[0], old[1], -1)
+            self._body = None
+
+    def _gauges(self):
+        if self._body is None:
+            parts = []
+            for i, (name, help_text, _) in enumerate(HOST_GAUGES):
+                parts.append(_header(name, help_text, 'gauge'))
+                prefix = name.encode()
+                parts.extend(prefix + lines[i] for lines in self._host_lines.values() if lines[i])
+            parts.append(_header('netpulse_group_hosts', 'Hosts with at least one probe', 'gauge'))
+            for gid, (count, _) in self._group_sums.items():
+                if count:
+                    parts.append(f'netpulse_group_hosts{{group="{_escape(self._group_name(gid))}"}} {count}\n'.encode())
+            for name, help_text, idx in GROUP_GAUGES:
+                parts.append(_header(name, help_text, 'gauge'))
+                for gid, (_, sums) in self._group_sums.items():
+                    total, n = sums[idx]
+                    if n:
+                        parts.append(f'{name}{{group="{_escape(self._group_name(gid))}"}} {total / n}\n'.encode())
+            self._body = b"".join(parts)
+        return self._body
+
+    def render(self, openmetrics=True):
+        with self._lock:
+            body = self._gauges()
+            probes, batches, last = self.probes_total, self.batches_total, self.last_batch_seconds
+        counters = [('netpulse_probes', 'Hosts probed', probes),
+                    ('netpulse_probe_batches', 'Probe batches completed', batches)]
+        gauges = [('netpulse_batch_processing_seconds', 'Time spent evaluating and storing the last probe batch', last)]
+        try:
+            import rate_limiter
+            limiter = rate_limiter.stats()
+            counters.append(('netpulse_probe_limiter_wait_seconds', 'Time probes spent waiting on the rate limiter',
+                             limiter['wait_time']))
+        except Exception:
+            pass
+        try:
+            import alert_pipeline
+            dispatch = alert_pipeline.get_pipeline().dispatcher.stats()
+            counters.append(('netpulse_notifications_sent', 'Alert notifications delivered', dispatch['sent']))
+            counters.append(('netpulse_notifications_dropped', 'Alert notifications dropped on a full queue',
+                             dispatch['dropped']))
+            gauges.append(('netpulse_notifications_queued', 'Alert notifications waiting', dispatch['queued']))
+        except Exception:
+            pass
+        try:
+            import recent_cache
+            gauges.append(('netpulse_recent_cache_bytes', 'Memory held by the recent-results cache',
+                           recent_cache.get_cache().stats()['bytes']))
+        except Exception:
+            pass
+        parts = [body]
+        for name, help_text, value in counters:
+            # OpenMetrics names the family without the _total suffix, Prometheus text with it
+            family = name if openmetrics else name + '_total'
+            parts.append(_header(family, help_text, 'counter'))
+            parts.append(f"{name}_total {value}\n".encode())
+        for name, help_text, value in gauges:
+            parts.append(_header(name, help_text, 'gauge'))
+            parts.append(f"{name} {value}\n".encode())
+        if openmetrics:
+            parts.append(b"# EOF\n")
+        return b"".join(parts)
+
+
+_snapshot = MetricsSnapshot()
+
+
+def get_snapshot():
+    return _snapshot
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+        body = _snapshot.render(openmetrics)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+                         if openmetrics else 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_exporter(port=DEFAULT_PORT, addr='127.0.0.1'):
+    """Serves /metrics on a daemon thread. Returns the server (already running)."""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((addr, port), _Handler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return _server
+
+
+def stop_exporter():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -1,52 +1,72 @@
 # network_tests.py
-from pythonping import ping
-import dns.resolver
-import subprocess
-import statistics
-import time
+# Probe functions used by the sweep. The packets themselves are sent by the
+# active probe_backend (real network or the simulator).
+import re
 from tcp_monitor import monitor_retransmissions
+import rate_limiter
+from probe_backend import get_backend
+from stream_stats import RttAccumulator
 
-def ping_stats(host, count=5, timeout=2):
-    """Returns dict with avg_latency (ms), packet_loss (%), jitter (ms), min_latency, max_latency"""
+def ping_stats(host, count=5, timeout=2, on_partial=None, chunk=10):
+    """Returns dict with avg_latency (ms), packet_loss (%), jitter (RFC 3550, ms), min_latency,
+    max_latency, plus mean_rtt_delta (mean |RTT difference|, ms), stdev, p50/p95/p99, sent and
+    received. Only successful replies count
+    towards latency. Long probes are sent in chunks of 'chunk' pings and on_partial(summary)
+    is called after each chunk but the last."""
+    acc = RttAccumulator()
     try:
-        responses = ping(host, count=count, timeout=timeout, size=56)
-        latencies = [resp.time_elapsed_ms for resp in responses]
-        successes = [resp.success for resp in responses]
-        if len(latencies) == 0:
-            return {"avg_latency": None, "packet_loss": 100.0, "jitter": None, "min_latency": None, "max_latency": None}
-        packet_loss = 100.0 * (1 - (sum(successes) / len(successes)))
-        jitter = statistics.stdev(latencies) if len(latencies) > 1 else 0.0
-        avg_latency = sum(latencies)/len(latencies)
-        return {"avg_latency": avg_latency, "packet_loss": packet_loss, "jitter": jitter, "min_latency": min(latencies), "max_latency": max(latencies)}
+        remaining = count
+        while remaining > 0:
+            n = min(chunk, remaining)
+            rate_limiter.acquire(n)
+            for rtt_ms, success in get_backend().ping(host, n, timeout):
+                acc.add(rtt_ms, success)
+            remaining -= n
+            if on_partial and remaining > 0:
+                on_partial(acc.summary(partial=True))
     except Exception as e:
-        return {"avg_latency": None, "packet_loss": 100.0, "jitter": None, "min_latency": None, "max_latency": None}
+        # count whatever was not sent as lost
+        while acc.sent < count:
+            acc.add(None, False)
+    return acc.summary()
 
 def dns_lookup(host):
     try:
-        resolver = dns.resolver.Resolver()
-        start = time.time()
-        resolver.resolve(host)
-        elapsed_ms = (time.time() - start) * 1000.0
-        return elapsed_ms
+        rate_limiter.acquire(1)
+        return get_backend().dns(host)
     except Exception:
         return None
 
+_HOP_LINE = re.compile(r'^\s*\d+\s', re.M)
+
 def traceroute(host, max_hops=30):
-    """Uses platform traceroute (tracert on Windows). Returns text output."""
+    """Uses platform traceroute (tracert on Windows). Returns text output.
+    Traceroute paces itself hop by hop, so one token is taken to start it and
+    the other hops it actually probed are charged afterwards; the next probes
+    wait for them."""
     try:
-        import platform
-        if platform.system().lower().startswith("win"):
-            cmd = ["tracert", "-d", host]
-        else:
-            cmd = ["traceroute", "-n", host]
-        p = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-        return p.stdout
+        rate_limiter.acquire(1)
+        text = get_backend().traceroute(host, max_hops)
+        rate_limiter.charge(len(_HOP_LINE.findall(text or "")) - 1)
+        return text
     except Exception as e:
         return str(e)
 
+def service_checks(targets, timeout=5.0, concurrency=1000):
+    """TCP connect / TLS handshake / HTTP TTFB for (host, tcp_port, tls_port, http_url)
+    targets, all run concurrently. Returns {host: metrics dict}; {} if the engine fails."""
+    try:
+        return get_backend().services(targets, timeout, concurrency)
+    except Exception:
+        return {}
+
 def measure_tcp_retrans(duration=5, iface=None):
     try:
         res = monitor_retransmissions(duration=duration, iface=iface)
         return res  # includes rate
     except Exception as e:
         return {'total':0,'retransmissions':0,'rate':0.0,'duration':0}
+
+def limiter_stats():
+    """Time probes spent blocked on the shared rate limiter (see rate_limiter.py)."""
+    return rate_limiter.stats()
@@ -0,0 +1,192 @@
+# probe_backend.py
+# Everything that touches the real network goes through a ProbeBackend, so the
+# rest of the pipeline can be exercised against SimulatedBackend, which is
+# deterministic for a given seed and never sends a packet.
+import random
+import subprocess
+import time
+import zlib
+
+
+class ProbeBackend:
+    def ping(self, host, count, timeout):
+        """Returns a list of (rtt_ms, success), one per echo request."""
+        raise NotImplementedError
+
+    def dns(self, host):
+        """Returns resolution time in ms, or None on failure."""
+        raise NotImplementedError
+
+    def traceroute(self, host, max_hops):
+        """Returns the text output of a traceroute."""
+        raise NotImplementedError
+
+    def tcp_packets(self, duration, iface, filter_expr='tcp'):
+        """Yields (src, dst, sport, dport, seq) for TCP packets seen during 'duration' seconds."""
+        raise NotImplementedError
+
+    def services(self, targets, timeout, concurrency):
+        """TCP/TLS/HTTP checks for (host, tcp_port, tls_port, http_url) targets;
+        returns {host: dict keyed by service_probes.SERVICE_METRICS}."""
+        raise NotImplementedError
+
+
+class RealBackend(ProbeBackend):
+    def ping(self, host, count, timeout):
+        from pythonping import ping
+        return [(resp.time_elapsed_ms, resp.success) for resp in ping(host, count=count, timeout=timeout, size=56)]
+
+    def dns(self, host):
+        import dns.resolver
+        resolver = dns.resolver.Resolver()
+        start = time.time()
+        resolver.resolve(host)
+        return (time.time() - start) * 1000.0
+
+    def traceroute(self, host, max_hops):
+        import platform
+        if platform.system().lower().startswith("win"):
+            cmd = ["tracert", "-d", "-h", str(max_hops), host]
+        else:
+            cmd = ["traceroute", "-n", "-m", str(max_hops), host]
+        p = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        return p.stdout
+
+    def tcp_packets(self, duration, iface, filter_expr='tcp'):
+        from scapy.all import sniff, TCP, IP
+        packets = []
+
+        def process_packet(pkt):
+            if IP in pkt and TCP in pkt:
+                packets.append((pkt[IP].src, pkt[IP].dst, pkt[TCP].sport, pkt[TCP].dport, int(pkt[TCP].seq)))
+
+        sniff(prn=process_packet, filter=filter_expr, iface=iface, timeout=duration, store=False)
+        return packets
+
+    def services(self, targets, timeout, concurrency):
+        import service_probes
+        return service_probes.probe_services(targets, timeout, concurrency)
+
+
+class SimulatedBackend(ProbeBackend):
+    """Synthetic network. Each host gets a stable base latency and route derived
+    from its name; per-call noise comes from a seeded RNG per host, so a run is
+    reproducible. 'profiles' overrides any parameter for selected hosts."""
+
+    def __init__(self, seed=0, latency_ms=20.0, latency_spread_ms=30.0, jitter_ms=3.0, loss=0.01,
+                 dns_ms=15.0, dns_failure=0.0, core_hops=4, max_tail_hops=6, retrans_rate=0.01,
+                 packets_per_second=2000, service_failure=0.0, server_ms=5.0, sleep=False, profiles=None):
+        self.seed = seed
+        self.params = dict(latency_ms=latency_ms, latency_spread_ms=latency_spread_ms, jitter_ms=jitter_ms,
+                           loss=loss, dns_ms=dns_ms, dns_failure=dns_failure, core_hops=core_hops,
+                           max_tail_hops=max_tail_hops, retrans_rate=retrans_rate,
+                           packets_per_second=packets_per_second, service_failure=service_failure,
+                           server_ms=server_ms)
+        self.sleep = sleep  # really wait for simulated RTTs (off for benchmarks)
+        self.profiles = profiles or {}
+        self._rngs = {}
+
+    def _p(self, host, name):
+        return self.profiles.get(host, {}).get(name, self.params[name])
+
+    def _rng(self, host):
+        rng = self._rngs.get(host)
+        if rng is None:
+            rng = self._rngs[host] = random.Random(zlib.crc32(host.encode()) ^ self.seed)
+        return rng
+
+    def _base_latency(self, host):
+        return self._p(host, 'latency_ms') + (zlib.crc32(b'lat' + host.encode()) % 1000) / 1000.0 * self._p(host, 'latency_spread_ms')
+
+    def ping(self, host, count, timeout):
+        rng = self._rng(host)
+        base = self._base_latency(host)
+        jitter, loss = self._p(host, 'jitter_ms'), self._p(host, 'loss')
+        out = []
+        for _ in range(count):
+            if rng.random() < loss:
+                out.append((timeout * 1000.0, False))
+            else:
+                out.append((max(0.05, base + rng.gauss(0, jitter)), True))
+        if self.sleep:
+            time.sleep(sum(rtt for rtt, _ in out) / 1000.0)
+        return out
+
+    def dns(self, host):
+        rng = self._rng(host)
+        if rng.random() < self._p(host, 'dns_failure'):
+            raise OSError("simulated NXDOMAIN")
+        return max(0.1, rng.gauss(self._p(host, 'dns_ms'), self._p(host, 'dns_ms') / 5))
+
+    def route(self, host):
+        """Hop addresses: a core shared by every host, a regional hop shared by
+        hosts with the same crc bucket, then a host-specific tail."""
+        h = zlib.crc32(host.encode())
+        hops = [f"10.255.0.{i + 1}" for i in range(self._p(host, 'core_hops'))]
+        hops.append(f"10.254.{h % 16}.1")
+        tail = h % (self._p(host, 'max_tail_hops') + 1)
+        hops.extend(f"172.{16 + (h >> 8) % 16}.{(h >> 12) % 256}.{i + 1}" for i in range(tail))
+        hops.append(host)
+        return hops
+
+    def traceroute(self, host, max_hops):
+        rng = self._rng(host)
+        base = self._base_latency(host)
+        hops = self.route(host)[:max_hops]
+        lines = [f"traceroute to {host} ({host}), {max_hops} hops max, 60 byte packets"]
+        for i, hop in enumerate(hops, 1):
+            rtt = base * i / len(hops)
+            times = "  ".join(f"{max(0.05, rtt + rng.gauss(0, 0.5)):.3f} ms" for _ in range(3))
+            lines.append(f"{i:2d}  {hop}  {times}")
+        return "\n".join(lines) + "\n"
+
+    def tcp_packets(self, duration, iface, filter_expr='tcp'):
+        """Synthetic capture: a handful of flows with sequential segments, a
+        fraction of which are repeated as retransmissions."""
+        rng = random.Random(self.seed)
+        rate = self.params['retrans_rate']
+        packets = []
+        flows = [(f"192.168.1.{10 + i}", f"10.0.0.{i + 1}", 40000 + i, 443) for i in range(8)]
+        seqs = [rng.randrange(1 << 31) for _ in flows]
+        for _ in range(int(duration * self.params['packets_per_second'])):
+            i = rng.randrange(len(flows))
+            if packets and rng.random() < rate:
+                packets.append(packets[rng.randrange(max(0, len(packets) - 50), len(packets))])
+                continue
+            seqs[i] = (seqs[i] + 1448) % (1 << 32)
+            packets.append(flows[i] + (seqs[i],))
+        return packets
+
+    def services(self, targets, timeout, concurrency):
+        """One RTT for the TCP handshake, two for TLS 1.2, and the HTTP first
+        byte after connect, TLS for https, one request RTT and 'server_ms'."""
+        out = {}
+        for host, tcp_port, tls_port, http_url in targets:
+            rng = self._rng(host)
+            rtt = lambda: max(0.05, self._base_latency(host) + rng.gauss(0, self._p(host, 'jitter_ms')))
+            up = lambda: rng.random() >= self._p(host, 'service_failure')
+            m = dict(tcp_connect_ms=None, tls_handshake_ms=None, http_ttfb_ms=None, http_status=None)
+            if tcp_port and up():
+                m['tcp_connect_ms'] = rtt()
+            if tls_port and up():
+                m['tls_handshake_ms'] = 2 * rtt()
+            if http_url and up():
+                tls = 2 * rtt() if http_url.startswith('https') else 0.0
+                m['http_ttfb_ms'] = rtt() + tls + rtt() + abs(rng.gauss(self._p(host, 'server_ms'), 1.0))
+                m['http_status'] = 200
+            out[host] = m
+        return out
+
+
+_backend = RealBackend()
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(backend):
+    """Swaps the backend used by network_tests; returns the previous one."""
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
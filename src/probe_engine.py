@@ -0,0 +1,120 @@
+# probe_engine.py
+# Probe loop shared by the manual TestWorker and scheduled jobs: probe each
+# host, evaluate alerts for the batch in one pass, then save the batch.
+import time
+import network_tests
+import database
+import utils
+import alerts
+import baseline
+import alert_pipeline
+import metrics_exporter
+import recent_cache
+import topology
+from instrumentation import span, profile_block
+
+
+def probe_host(host, group_id):
+    with span('probe.ping'):
+        stats = network_tests.ping_stats(host, count=5)
+    with span('probe.dns'):
+        dns_time = network_tests.dns_lookup(host)
+    with span('probe.traceroute'):
+        tracer = network_tests.traceroute(host)
+    return {
+        "host": host,
+        "group_id": group_id,
+        "stats": stats,
+        "dns_time": dns_time,
+        "traceroute": tracer,
+        "hops": topology.parse_traceroute(tracer),  # parsed here, off the single writer
+        "tcp_retrans_rate": stats.get('tcp_retrans_rate'),
+        "timestamp": utils.now_iso(),
+        "epoch": time.time(),
+    }
+
+
+def result_row(r):
+    """Tuple in database.save_result argument order."""
+    s = r['stats']
+    return (r['host'], r['group_id'], r['timestamp'], s.get('avg_latency'), s.get('packet_loss'),
+            s.get('jitter'), s.get('min_latency'), s.get('max_latency'), r.get('dns_time'),
+            r.get('traceroute'), r.get('tcp_retrans_rate'), r.get('alerts', ""),
+            r.get('tcp_connect_ms'), r.get('tls_handshake_ms'), r.get('http_ttfb_ms'), r.get('http_status'))
+
+
+def probe_services(results, services):
+    """Adds TCP/TLS/HTTP check results to the hosts configured for them
+    (services: database.host_services()); the checks of the whole batch run at once.
+    The ping fields are left as measured; a host that drops ICMP is judged
+    reachable by its checks instead (see alerts.Sweep.service_reachable)."""
+    targets = {r['host']: (r['host'],) + services[r['host']] for r in results if r['host'] in services}
+    if not targets:
+        return
+    measured = network_tests.service_checks(targets.values())
+    for r in results:
+        if r['host'] not in targets:
+            continue
+        r['services'] = services[r['host']]
+        r.update(measured.get(r['host'], ()))
+
+
+def finish_batch(results, evaluator=None, agent_progress=None):
+    """Evaluates alerts for a batch of probe results, fills in 'alerts' /
+    'alert_list' on each, stores the batch in one transaction and hands
+    state changes to the notification pipeline. agent_progress is passed
+    through to database.save_results for batches from collector agents."""
+    start = time.perf_counter()
+    evaluator = evaluator or alerts.get_evaluator()
+    with span('alerts.evaluate'):
+        found_lists = evaluator.evaluate(results)
+    for r, found in zip(results, found_lists):
+        r['alert_list'] = found
+        r['alerts'] = alerts.alerts_text(found)
+    with span('cache.update'):
+        # before saving: a cache created here warms from the database and must not see this batch twice
+        recent_cache.get_cache().add_results(results)
+    database.save_results([result_row(r) for r in results], agent_progress)  # timed as db.save_results
+    with span('baseline.flush'):
+        baseline.get_detector().flush()
+    with span('topology.update'):
+        graph = topology.get_graph()
+        graph.update(results)
+        graph.flush()
+    with span('alerts.pipeline'):
+        alert_pipeline.get_pipeline().process(results)
+    with span('metrics.update'):
+        metrics_exporter.get_snapshot().update(results, time.perf_counter() - start)
+    return results
+
+
+def run_sweep(hosts_with_groups, should_continue=lambda: True, on_result=None, batch_size=None, evaluator=None):
+    """Probes every (host, group_id) once. Alerts are evaluated per batch of
+    'batch_size' results (the whole sweep when None). Returns all results."""
+    done = []
+    pending = []
+    services = database.host_services()
+
+    def flush():
+        with span('probe.services'):
+            probe_services(pending, services)
+        with profile_block():
+            finish_batch(pending, evaluator)
+        if on_result:
+            with span('gui.emit'):
+                for r in pending:
+                    on_result(r)
+        done.extend(pending)
+        pending.clear()
+
+    with span('sweep'):
+        for host, group_id in hosts_with_groups:
+            if not should_continue():
+                break
+            with profile_block(), span('probe.host'):
+                pending.append(probe_host(host, group_id))
+            if batch_size and len(pending) >= batch_size:
+                flush()
+        if pending:
+            flush()
+    return done
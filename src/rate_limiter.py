@@ -0,0 +1,99 @@
+# rate_limiter.py
+# Central token bucket shared by every probe type and every job, so several
+# sweeps running at once cannot burst more packets than the network tolerates.
+import threading
+import time
+
+DEFAULT_RATE = 400.0   # tokens (roughly packets) per second; see benchmarks.bench_rate_limit
+DEFAULT_BURST = 800.0  # bucket capacity
+
+
+class TokenBucket:
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self._lock = threading.Lock()
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self.wait_time = 0.0   # total seconds callers spent blocked
+        self.waits = 0         # number of acquisitions that had to wait
+        self.acquired = 0      # total tokens handed out
+
+    def configure(self, rate=None, burst=None):
+        with self._lock:
+            self._refill()
+            if rate is not None:
+                self.rate = max(float(rate), 0.001)
+            if burst is not None:
+                self.burst = max(float(burst), 1.0)
+            self._tokens = min(self._tokens, self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1.0):
+        """Blocks until 'tokens' are available. Requests larger than the bucket are
+        clamped to its capacity. Returns the seconds spent waiting."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def reserve(self, tokens=1.0):
+        """Takes 'tokens' without blocking and returns how long the caller must
+        wait before using them (asyncio callers sleep on this themselves)."""
+        tokens = min(float(tokens), self.burst)
+        with self._lock:
+            self._refill()
+            # reserve now and go into debt; callers queue up in arrival order
+            self._tokens -= tokens
+            self.acquired += tokens
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if delay > 0:
+                self.wait_time += delay
+                self.waits += 1
+        return delay
+
+    def charge(self, tokens):
+        """Takes 'tokens' already spent (e.g. counted after a probe finished);
+        never blocks, later callers wait for any debt."""
+        if tokens <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = max(self._tokens - float(tokens), -self.burst)
+            self.acquired += tokens
+
+    def stats(self):
+        with self._lock:
+            return {'rate': self.rate, 'burst': self.burst, 'wait_time': self.wait_time,
+                    'waits': self.waits, 'acquired': self.acquired}
+
+
+_limiter = TokenBucket()
+
+
+def get_limiter():
+    return _limiter
+
+
+def configure(rate=None, burst=None):
+    _limiter.configure(rate, burst)
+
+
+def acquire(tokens=1.0):
+    return _limiter.acquire(tokens)
+
+
+def reserve(tokens=1.0):
+    return _limiter.reserve(tokens)
+
+
+def charge(tokens):
+    _limiter.charge(tokens)
+
+
+def stats():
+    return _limiter.stats()
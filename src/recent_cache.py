@@ -0,0 +1,161 @@
+# recent_cache.py
+# Last N probe results per host, kept in typed arrays so the Manual Test plot,
+# the Diagnostics view and alert rules can read recent history without a
+# database round trip. Filled by probe_engine.finish_batch and warmed from the
+# results table on first use.
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+
+import baseline
+import database
+
+METRICS = ('avg_latency', 'packet_loss', 'jitter', 'dns_time', 'tcp_retrans_rate')
+DEFAULT_CAPACITY = 120  # two hours at the default 60 s schedule
+
+
+class HostRing:
+    """Fixed-size ring of (epoch seconds, metrics) samples plus a loss bitmap.
+    Every sample is written twice, at slot and slot + capacity, so the newest n
+    samples are always one contiguous slice and window() can return views.
+    Views alias the ring: copy them if they must outlive the next capacity
+    writes for this host."""
+    __slots__ = ('capacity', 'count', '_pos', 'ts', 'values', 'loss')
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, width=len(METRICS)):
+        self.capacity = capacity
+        self.count = 0
+        self._pos = 0  # slot the next sample goes to
+        self.ts = np.zeros(2 * capacity, dtype=np.int64)
+        self.values = np.full((2 * capacity, width), np.nan, dtype=np.float32)
+        self.loss = np.zeros((capacity + 7) // 8, dtype=np.uint8)
+
+    def append(self, epoch, values, lost=False):
+        i, cap = self._pos, self.capacity
+        self.ts[i] = self.ts[i + cap] = epoch
+        self.values[i] = self.values[i + cap] = values
+        byte, bit = divmod(i, 8)
+        if lost:
+            self.loss[byte] |= 1 << bit
+        else:
+            self.loss[byte] &= ~(1 << bit) & 0xFF
+        self._pos = (i + 1) % cap
+        if self.count < cap:
+            self.count += 1
+
+    def _bounds(self, n):
+        n = self.count if n is None else min(n, self.count)
+        end = self._pos if self._pos >= n else self._pos + self.capacity
+        return end - n, end
+
+    def window(self, n=None, since=None):
+        """(timestamps, values) views over the newest n samples, oldest first,
+        optionally limited to samples at or after epoch 'since'."""
+        start, end = self._bounds(n)
+        ts = self.ts[start:end]
+        if since is not None:
+            start += int(np.searchsorted(ts, since, side='left'))
+        return self.ts[start:end], self.values[start:end]
+
+    def loss_flags(self, n=None):
+        """Booleans, oldest first, for the same samples as window(n)."""
+        start, end = self._bounds(n)
+        bits = np.unpackbits(self.loss, bitorder='little')
+        return bits[np.arange(start, end) % self.capacity].astype(bool)
+
+    @property
+    def nbytes(self):
+        return self.ts.nbytes + self.values.nbytes + self.loss.nbytes
+
+
+class RecentCache:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def _ring(self, host):
+        ring = self._rings.get(host)
+        if ring is None:
+            ring = self._rings[host] = HostRing(self.capacity)
+        return ring
+
+    def add(self, host, epoch, values, lost=False):
+        with self._lock:
+            self._ring(host).append(epoch, values, lost)
+
+    def add_results(self, results):
+        with self._lock:
+            for r in results:
+                s = r['stats']
+                values = [s.get('avg_latency'), s.get('packet_loss'), s.get('jitter'),
+                          r.get('dns_time'), r.get('tcp_retrans_rate')]
+                epoch = r.get('epoch') or baseline.to_epoch(r['timestamp'])
+                self._ring(r['host']).append(int(epoch), [np.nan if v is None else v for v in values],
+                                             bool(s.get('packet_loss')))
+
+    def warm(self, since_ts=None):
+        """Loads the newest 'capacity' stored results per host."""
+        rows = database.recent_results(self.capacity, since_ts)
+        with self._lock:
+            for host, timestamp, *values in rows:
+                self._ring(host).append(int(baseline.to_epoch(timestamp)),
+                                        [np.nan if v is None else v for v in values], bool(values[1]))
+
+    def window(self, host, n=None, since=None):
+        """(timestamps int64, values float32 [samples x METRICS]), or None for a
+        host with no samples. Copied under the lock: probe threads keep writing
+        to the ring while the caller reads."""
+        with self._lock:
+            ring = self._rings.get(host)
+            if ring is None:
+                return None
+            ts, values = ring.window(n, since)
+            return ts.copy(), values.copy()
+
+    def series(self, host, metric, n=None, since=None):
+        """(timestamps, values) for one metric, copied like window()."""
+        with self._lock:
+            ring = self._rings.get(host)
+            if ring is None:
+                return None
+            ts, values = ring.window(n, since)
+            return ts.copy(), values[:, METRICS.index(metric)].copy()
+
+    def loss_flags(self, host, n=None):
+        with self._lock:
+            ring = self._rings.get(host)
+            return ring.loss_flags(n) if ring is not None else None
+
+    def hosts(self):
+        return list(self._rings)
+
+    def forget(self, host):
+        with self._lock:
+            self._rings.pop(host, None)
+
+    def stats(self):
+        with self._lock:
+            rings = list(self._rings.values())
+        nbytes = sum(r.nbytes for r in rings)
+        return {'hosts': len(rings), 'samples': sum(r.count for r in rings), 'capacity': self.capacity,
+                'bytes': nbytes, 'bytes_per_host': rings[0].nbytes if rings else 0}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide cache, warmed from the last two days of stored results on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RecentCache()
+            try:
+                since = datetime.utcnow() - timedelta(days=2)
+                _cache.warm(since_ts=since.isoformat(sep=' ', timespec='seconds'))
+            except Exception:
+                pass
+    return _cache
+
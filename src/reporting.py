@@ -6,17 +6,45 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 import matplotlib.pyplot as plt
 from datetime import datetime
+from instrumentation import timed
+import database
 
 def df_from_query(rows):
-    cols = ['id','host','group_id','timestamp','avg_latency','packet_loss','jitter','min_latency','max_latency','dns_time','traceroute','tcp_retrans_rate','alerts']
-    return pd.DataFrame(rows, columns=cols)
+    """database.query_results rows (all RESULT_COLUMNS) as a DataFrame."""
+    return pd.DataFrame(rows, columns=database.RESULT_COLUMNS)
 
-def export_to_excel(save_path, rows):
-    df = df_from_query(rows)
-    df.to_excel(save_path, index=False)
+@timed('report.excel')
+def export_to_excel(save_path, rows, summary=None):
+    """Raw rows on the first sheet; with a database.summarize_results summary,
+    a per-host Summary sheet after it. 'rows' hold every RESULT_COLUMNS field
+    and may be any iterable, such as database.iter_results: the workbook is
+    write-only, so rows go to disk as they are read instead of being collected
+    first."""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Results" if summary is not None else "Sheet1")
+    ws.append(database.RESULT_COLUMNS)
+    for row in rows:
+        ws.append(list(row))
+    if summary is not None:
+        ws = wb.create_sheet("Summary")
+        ws.append(database.SUMMARY_COLUMNS)
+        for row in summary:
+            ws.append(list(row))
+    wb.save(save_path)
 
-def export_to_pdf(save_path, rows):
-    df = df_from_query(rows)
+def _fmt(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+@timed('report.pdf')
+def export_to_pdf(save_path, summary, series=None):
+    """summary: database.summarize_results rows; series: database.latency_series
+    rows for the per-host charts. Neither grows with the number of samples."""
+    charts = {}
+    for host, ts, value in series or ():
+        charts.setdefault(host, ([], []))
+        charts[host][0].append(ts)
+        charts[host][1].append(value)
     c = canvas.Canvas(save_path, pagesize=letter)
     width, height = letter
     y = height - 50
@@ -24,25 +52,30 @@ def export_to_pdf(save_path, rows):
     c.drawString(40, y, f"NetPulse Report - {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}")
     y -= 30
     c.setFont("Helvetica", 10)
-    grouped = df.groupby('host')
-    for host, g in grouped:
+    for row in summary:
+        s = dict(zip(database.SUMMARY_COLUMNS, row))
+        host = s['host']
         if y < 140:
             c.showPage()
             y = height - 50
-        c.drawString(40, y, f"Host: {host} | Entries: {len(g)}")
+        c.drawString(40, y, f"Host: {host} | Entries: {s['samples']} | Alerts: {s['alert_count']}")
         y -= 14
-        try:
-            avg_latency = g['avg_latency'].mean() if not g['avg_latency'].isnull().all() else None
-            pkt_loss = g['packet_loss'].mean() if not g['packet_loss'].isnull().all() else None
-            retrans = g['tcp_retrans_rate'].mean() if 'tcp_retrans_rate' in g and not g['tcp_retrans_rate'].isnull().all() else None
-            c.drawString(50, y, f"Avg Latency (ms): {avg_latency:.2f}  | Avg Packet Loss (%): {pkt_loss:.2f}  | Avg TCP Retrans (%): {retrans:.2f}" if avg_latency is not None else "No data")
-        except Exception:
-            c.drawString(50, y, "Summary data not available")
+        if s['avg_latency'] is None:
+            c.drawString(50, y, "No data")
+        else:
+            c.drawString(50, y, f"Avg Latency (ms): {_fmt(s['avg_latency'])}  | Avg Packet Loss (%): {_fmt(s['avg_packet_loss'])}"
+                                f"  | Avg TCP Retrans (%): {_fmt(s['avg_tcp_retrans_rate'])}")
+            y -= 12
+            c.drawString(50, y, f"p50/p95 Latency (ms): {_fmt(s['p50_latency'])} / {_fmt(s['p95_latency'])}"
+                                f"  | Min/Max (ms): {_fmt(s['min_latency'])} / {_fmt(s['max_latency'])}")
         y -= 12
+        if host not in charts:
+            continue
         # small plot
         try:
+            ts, values = charts[host]
             fig, ax = plt.subplots(figsize=(4,1.2))
-            ax.plot(pd.to_datetime(g['timestamp']), g['avg_latency'], marker='o')
+            ax.plot(pd.to_datetime(ts), values, marker='o')
             ax.set_title(host)
             ax.set_ylabel('ms')
             ax.grid(True)
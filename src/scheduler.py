@@ -1,7 +1,9 @@
 # scheduler.py
 from apscheduler.schedulers.background import BackgroundScheduler
+from datetime import datetime, timedelta
 
 _scheduler = None
+_interval_jobs = {}  # interval seconds -> [job_id, ...] in scheduling order
 
 def start_scheduler():
     global _scheduler
@@ -14,11 +16,40 @@ def stop_scheduler():
     if _scheduler:
         _scheduler.shutdown(wait=False)
 
+def _spread_interval_jobs(seconds):
+    """Stagger all jobs sharing an interval so their start offsets are evenly spaced
+    across it. The earliest job keeps its phase; the others are placed after it."""
+    ids = [j for j in _interval_jobs.get(seconds, []) if _scheduler.get_job(j)]
+    _interval_jobs[seconds] = ids
+    if len(ids) < 2:
+        return
+    now = datetime.now(_scheduler.timezone)
+    anchor = min((_scheduler.get_job(j).next_run_time or now) for j in ids)
+    step = seconds / len(ids)
+    for i, job_id in enumerate(ids):
+        _scheduler.modify_job(job_id, next_run_time=anchor + timedelta(seconds=step * i))
+
 def schedule_job(job_id, func, trigger, trigger_args):
     start_scheduler()
     if trigger['type'] == 'interval':
-        return _scheduler.add_job(func, 'interval', seconds=trigger.get('seconds',60), id=job_id, args=trigger_args, replace_existing=True)
+        seconds = trigger.get('seconds', 60)
+        for ids in _interval_jobs.values():
+            if job_id in ids:
+                ids.remove(job_id)
+        job = _scheduler.add_job(func, 'interval', seconds=seconds, id=job_id, args=trigger_args, replace_existing=True)
+        _interval_jobs.setdefault(seconds, []).append(job_id)
+        _spread_interval_jobs(seconds)
+        return job
     elif trigger['type'] == 'cron':
         return _scheduler.add_job(func, 'cron', id=job_id, **trigger.get('cron',{}), args=trigger_args, replace_existing=True)
     else:
         raise ValueError("Unsupported trigger type")
+
+def unschedule_job(job_id):
+    start_scheduler()
+    _scheduler.remove_job(job_id)
+    for seconds, ids in _interval_jobs.items():
+        if job_id in ids:
+            ids.remove(job_id)
+            _spread_interval_jobs(seconds)
+            break
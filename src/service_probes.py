@@ -0,0 +1,169 @@
+# service_probes.py
+# TCP connect, TLS handshake and HTTP time-to-first-byte checks, for targets
+# that drop ICMP. All checks of a batch run on one asyncio loop: a semaphore
+# bounds how many sockets are open at once and every check has its own timeout.
+import asyncio
+import ssl
+import time
+import urllib.parse
+
+import rate_limiter
+
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_CONCURRENCY = 1000
+SERVICE_METRICS = ('tcp_connect_ms', 'tls_handshake_ms', 'http_ttfb_ms', 'http_status')
+
+
+def tls_context():
+    """Handshakes are timed, not validated: self-signed and expired certificates still count."""
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+async def _tokens(n=1):
+    delay = rate_limiter.reserve(n)
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+def _close(writer):
+    try:
+        writer.close()
+    except Exception:
+        pass
+
+
+async def _connect(host, port, timeout):
+    loop = asyncio.get_running_loop()
+    transport, _ = await asyncio.wait_for(loop.create_connection(asyncio.Protocol, host, port), timeout)
+    return transport
+
+
+async def tcp_connect(host, port, timeout=DEFAULT_TIMEOUT):
+    """Milliseconds until the TCP connection is established, or None."""
+    start = time.perf_counter()
+    try:
+        transport = await _connect(host, port, timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    elapsed = (time.perf_counter() - start) * 1000.0
+    transport.close()
+    return elapsed
+
+
+async def tls_handshake(host, port, timeout=DEFAULT_TIMEOUT, ctx=None):
+    """Milliseconds for the TLS handshake alone, measured after the TCP
+    connection is up, or None."""
+    loop = asyncio.get_running_loop()
+    try:
+        transport = await _connect(host, port, timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    try:
+        start = time.perf_counter()
+        tls = await asyncio.wait_for(
+            loop.start_tls(transport, transport.get_protocol(), ctx or tls_context(), server_hostname=host),
+            timeout)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        tls.close()
+        return elapsed
+    except (OSError, ssl.SSLError, asyncio.TimeoutError):
+        return None
+    finally:
+        transport.close()
+
+
+async def http_ttfb(url, timeout=DEFAULT_TIMEOUT, ctx=None):
+    """(milliseconds from connecting to the first response byte, HTTP status),
+    like curl's time_starttransfer; (None, None) on failure."""
+    u = urllib.parse.urlsplit(url)
+    https = u.scheme == 'https'
+    port = u.port or (443 if https else 80)
+    path = (u.path or '/') + (f"?{u.query}" if u.query else "")
+    request = (f"GET {path} HTTP/1.1\r\nHost: {u.netloc}\r\nUser-Agent: NetPulse\r\n"
+               f"Accept: */*\r\nConnection: close\r\n\r\n").encode()
+
+    async def fetch():
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection(
+            u.hostname, port, ssl=(ctx or tls_context()) if https else None,
+            server_hostname=u.hostname if https else None)
+        try:
+            writer.write(request)
+            await writer.drain()
+            first = await reader.read(1)
+            if not first:
+                return None, None
+            elapsed = (time.perf_counter() - start) * 1000.0
+            status_line = first + await reader.readline()
+            parts = status_line.split()
+            status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+            return elapsed, status
+        finally:
+            _close(writer)
+
+    try:
+        return await asyncio.wait_for(fetch(), timeout)
+    except (OSError, ssl.SSLError, asyncio.TimeoutError, ValueError):
+        return None, None
+
+
+async def check_host(host, tcp_port=None, tls_port=None, http_url=None, timeout=DEFAULT_TIMEOUT, ctx=None):
+    """Runs the configured checks for one host concurrently; returns a dict
+    with SERVICE_METRICS keys (None for checks not configured or failed).
+    Takes no rate limiter tokens itself; probe_many does that."""
+    out = dict.fromkeys(SERVICE_METRICS)
+
+    async def tcp():
+        out['tcp_connect_ms'] = await tcp_connect(host, tcp_port, timeout)
+
+    async def tls():
+        out['tls_handshake_ms'] = await tls_handshake(host, tls_port, timeout, ctx)
+
+    async def http():
+        out['http_ttfb_ms'], out['http_status'] = await http_ttfb(http_url, timeout, ctx)
+
+    checks = [f() for f, enabled in ((tcp, tcp_port), (tls, tls_port), (http, http_url)) if enabled]
+    await asyncio.gather(*checks)
+    return out
+
+
+async def probe_many(targets, timeout=DEFAULT_TIMEOUT, concurrency=DEFAULT_CONCURRENCY):
+    """targets: iterable of (host, tcp_port, tls_port, http_url). Returns {host: metrics}."""
+    ctx = tls_context()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(target):
+        # wait for the rate limiter before taking a slot, so a throttled check
+        # never holds a socket slot while it sleeps
+        await _tokens(sum(1 for x in target[1:] if x))
+        async with sem:
+            return target[0], await check_host(*target, timeout=timeout, ctx=ctx)
+
+    return dict(await asyncio.gather(*(one(t) for t in targets)))
+
+
+def _raise_fd_limit(wanted):
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def probe_services(targets, timeout=DEFAULT_TIMEOUT, concurrency=DEFAULT_CONCURRENCY):
+    """Blocking entry point for probe threads; runs its own event loop."""
+    targets = list(targets)
+    if not targets:
+        return {}
+    # up to three sockets per host, plus headroom for the database and GUI
+    _raise_fd_limit(3 * concurrency + 256)
+    return asyncio.run(probe_many(targets, timeout, concurrency))
@@ -0,0 +1,187 @@
+# sharded_probe.py
+# Multi-process probing for inventories too large for one core. Hosts are
+# split across worker processes by jump consistent hash; each worker probes
+# its shard and streams result batches back over a bounded queue. The parent
+# process is the single writer: it evaluates alerts and stores every batch
+# through probe_engine.finish_batch, exactly like an in-process sweep.
+import hashlib
+import multiprocessing as mp
+import os
+import queue
+import threading
+
+import database
+import probe_backend
+import probe_engine
+import rate_limiter
+from instrumentation import span
+
+
+def jump_hash(key, buckets):
+    """Lamping & Veach jump consistent hash. Growing from n to n+1 buckets
+    moves only about 1/(n+1) of the keys, so a host keeps its worker (and
+    that worker's warm state) when the pool is resized."""
+    k = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        k = (k * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((k >> 33) + 1)))
+    return b
+
+
+def _worker_main(index, backend, tasks, results, cancel):
+    probe_backend.set_backend(backend)
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        sweep_id, hosts, batch_size, rate, burst = task
+        # the limit applies to the whole pool, so every worker gets its share
+        rate_limiter.configure(rate=rate, burst=burst)
+        batch, services = [], {}
+        for host, group_id, svc in hosts:
+            if cancel.is_set():
+                break
+            batch.append(probe_engine.probe_host(host, group_id))
+            if svc:
+                services[host] = svc
+            if len(batch) >= batch_size:
+                probe_engine.probe_services(batch, services)
+                results.put((sweep_id, index, batch))
+                batch, services = [], {}
+        if batch:
+            probe_engine.probe_services(batch, services)
+            results.put((sweep_id, index, batch))
+        results.put((sweep_id, index, None))  # shard done
+
+
+class ShardedProber:
+    """Pool of probe processes, started on first use and reused across sweeps."""
+
+    def __init__(self, workers=None, batch_size=500):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self._ctx = mp.get_context('spawn')  # fork is unsafe with Qt and scheduler threads running
+        self._procs = []
+        self._tasks = []
+        self._results = None
+        self._cancel = None
+        self._sweep_id = 0
+        self._lock = threading.Lock()  # one sweep at a time
+
+    def start(self):
+        if self._procs:
+            return
+        # bounded: when the writer falls behind, workers block instead of piling up results
+        self._results = self._ctx.Queue(maxsize=self.workers * 4)
+        self._cancel = self._ctx.Event()
+        backend = probe_backend.get_backend()
+        for i in range(self.workers):
+            tasks = self._ctx.Queue()
+            p = self._ctx.Process(target=_worker_main, args=(i, backend, tasks, self._results, self._cancel),
+                                  name=f"netpulse-probe-{i}", daemon=True)
+            p.start()
+            self._procs.append(p)
+            self._tasks.append(tasks)
+
+    def shard(self, hosts_with_groups):
+        shards = [[] for _ in range(self.workers)]
+        services = database.host_services()
+        for host, group_id in hosts_with_groups:
+            shards[jump_hash(host, self.workers)].append((host, group_id, services.get(host)))
+        return shards
+
+    def sweep(self, hosts_with_groups, should_continue=lambda: True, on_result=None, evaluator=None):
+        """Same contract as probe_engine.run_sweep; result order follows batch arrival."""
+        with self._lock:
+            self.start()
+            self._sweep_id += 1
+            self._cancel.clear()
+            limiter = rate_limiter.stats()
+            for tasks, hosts in zip(self._tasks, self.shard(hosts_with_groups)):
+                tasks.put((self._sweep_id, hosts, self.batch_size,
+                           limiter['rate'] / self.workers, max(limiter['burst'] / self.workers, 1.0)))
+            running = self.workers
+            done = []
+            with span('sweep'):
+                while running:
+                    if not should_continue():
+                        self._cancel.set()
+                    try:
+                        sweep_id, _, batch = self._results.get(timeout=0.5)
+                    except queue.Empty:
+                        if not all(p.is_alive() for p in self._procs):
+                            self._reset()
+                            raise RuntimeError("a probe worker process exited unexpectedly")
+                        continue
+                    if sweep_id != self._sweep_id:
+                        continue
+                    if batch is None:
+                        running -= 1
+                        continue
+                    probe_engine.finish_batch(batch, evaluator)
+                    if on_result:
+                        with span('gui.emit'):
+                            for r in batch:
+                                on_result(r)
+                    done.extend(batch)
+            return done
+
+    def _reset(self):
+        for p in self._procs:
+            if p.is_alive():
+                p.terminate()
+        self._procs, self._tasks = [], []
+
+    def cancel(self):
+        """Asks a sweep in progress to stop early."""
+        if self._cancel is not None:
+            self._cancel.set()
+
+    def close(self, wait=True):
+        """Stops the workers. With wait=False a pool busy with a sweep is left
+        alone; returns whether it was stopped."""
+        if not self._lock.acquire(blocking=wait):
+            return False
+        try:
+            for tasks in self._tasks:
+                tasks.put(None)
+            for p in self._procs:
+                p.join(timeout=5)
+            self._reset()
+        finally:
+            self._lock.release()
+        return True
+
+
+_prober = None
+_retired = []  # pools replaced by get_prober, stopped once no sweep is using them
+_probers_lock = threading.Lock()
+
+
+def get_prober(workers=None):
+    """Shared pool. Asking for another worker count replaces it; the old pool
+    finishes any sweep in progress and is stopped on a later call."""
+    global _prober
+    workers = workers or os.cpu_count() or 1
+    with _probers_lock:
+        if _prober is not None and _prober.workers != workers:
+            _retired.append(_prober)
+            _prober = None
+        if _prober is None:
+            _prober = ShardedProber(workers)
+        _retired[:] = [p for p in _retired if not p.close(wait=False)]
+        return _prober
+
+
+def shutdown_probers():
+    """Stops every pool, cancelling sweeps in progress. Called on app and scheduler shutdown."""
+    global _prober
+    with _probers_lock:
+        pools = _retired + ([_prober] if _prober is not None else [])
+        _retired.clear()
+        _prober = None
+    for p in pools:
+        p.cancel()
+        p.close()
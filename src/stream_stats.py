@@ -0,0 +1,73 @@
+# stream_stats.py
+# One-pass latency statistics for ping probes. Lost packets are counted
+# separately instead of being averaged in with their timeout durations.
+import math
+from tdigest import TDigest
+
+
+class RttAccumulator:
+    """Welford mean/variance, RFC 3550 interarrival jitter, the mean absolute
+    RTT difference, min/max and t-digest percentiles over successful RTTs,
+    updated per sample."""
+
+    __slots__ = ('sent', 'received', 'mean', '_m2', 'min', 'max', 'jitter', '_diff_sum', '_diffs', '_last',
+                 '_digest')
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self.jitter = 0.0
+        self._diff_sum = 0.0
+        self._diffs = 0
+        self._last = None
+        self._digest = TDigest(compression=100)
+
+    def add(self, rtt_ms, success=True):
+        self.sent += 1
+        if not success or rtt_ms is None:
+            return
+        self.received += 1
+        d = rtt_ms - self.mean
+        self.mean += d / self.received
+        self._m2 += d * (rtt_ms - self.mean)
+        if self.min is None or rtt_ms < self.min:
+            self.min = rtt_ms
+        if self.max is None or rtt_ms > self.max:
+            self.max = rtt_ms
+        # RFC 3550 6.4.1: probes leave at a fixed spacing, so the transit-time
+        # difference of consecutive replies is the difference of their RTTs.
+        # J starts at 0 as the RFC says, so a 5-ping probe has only climbed a
+        # fifth of the way; the plain mean of |D| is kept alongside for those.
+        if self._last is not None:
+            d = abs(rtt_ms - self._last)
+            self.jitter += (d - self.jitter) / 16.0
+            self._diff_sum += d
+            self._diffs += 1
+        self._last = rtt_ms
+        self._digest.add(rtt_ms)
+
+    def stdev(self):
+        return math.sqrt(self._m2 / (self.received - 1)) if self.received > 1 else 0.0
+
+    def mean_rtt_delta(self):
+        return self._diff_sum / self._diffs if self._diffs else None
+
+    def percentile(self, q):
+        return self._digest.quantile(q)
+
+    def summary(self, partial=False):
+        """Dict in the shape ping_stats has always returned, plus extra fields."""
+        loss = 100.0 * (1 - self.received / self.sent) if self.sent else 100.0
+        if not self.received:
+            return {"avg_latency": None, "packet_loss": loss, "jitter": None, "mean_rtt_delta": None,
+                    "min_latency": None,
+                    "max_latency": None, "stdev": None, "p50": None, "p95": None, "p99": None,
+                    "sent": self.sent, "received": 0, "partial": partial}
+        return {"avg_latency": self.mean, "packet_loss": loss, "jitter": self.jitter,
+                "mean_rtt_delta": self.mean_rtt_delta(), "min_latency": self.min, "max_latency": self.max, "stdev": self.stdev(),
+                "p50": self.percentile(0.5), "p95": self.percentile(0.95), "p99": self.percentile(0.99),
+                "sent": self.sent, "received": self.received, "partial": partial}
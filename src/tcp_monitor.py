@@ -1,31 +1,28 @@
 # tcp_monitor.py
-# Uses scapy to sniff TCP packets and detect retransmissions.
-from scapy.all import sniff, TCP, IP
+# Sniffs TCP packets (scapy, via the probe backend) and detects retransmissions.
 from collections import defaultdict
-import time
 
-def monitor_retransmissions(duration=5, iface=None, filter_expr='tcp'):
-    """Sniffs traffic for 'duration' seconds and returns retransmission metrics.
-    Returns dict: {'total': int, 'retransmissions': int, 'rate': float} where rate is percent."""
+def count_retransmissions(packets):
+    """packets: iterable of (src, dst, sport, dport, seq). A segment whose sequence number
+    was already seen on the same flow counts as a retransmission.
+    Returns (total, retransmissions)."""
     seq_seen = defaultdict(set)
     retransmissions = 0
     total_packets = 0
-    start_time = time.time()
-
-    def process_packet(pkt):
-        nonlocal retransmissions, total_packets
-        if IP in pkt and TCP in pkt:
-            total_packets += 1
-            try:
-                flow_id = (pkt[IP].src, pkt[IP].dst, pkt[TCP].sport, pkt[TCP].dport)
-                seq = int(pkt[TCP].seq)
-                if seq in seq_seen[flow_id]:
-                    retransmissions += 1
-                else:
-                    seq_seen[flow_id].add(seq)
-            except Exception:
-                pass
+    for src, dst, sport, dport, seq in packets:
+        total_packets += 1
+        seen = seq_seen[(src, dst, sport, dport)]
+        if seq in seen:
+            retransmissions += 1
+        else:
+            seen.add(seq)
+    return total_packets, retransmissions
 
-    sniff(prn=process_packet, filter=filter_expr, iface=iface, timeout=duration, store=False)
+def monitor_retransmissions(duration=5, iface=None, filter_expr='tcp'):
+    """Sniffs traffic for 'duration' seconds and returns retransmission metrics.
+    Returns dict: {'total': int, 'retransmissions': int, 'rate': float} where rate is percent."""
+    import probe_backend
+    total_packets, retransmissions = count_retransmissions(
+        probe_backend.get_backend().tcp_packets(duration, iface, filter_expr))
     rate = (retransmissions / total_packets * 100.0) if total_packets else 0.0
     return {'total': total_packets, 'retransmissions': retransmissions, 'rate': rate, 'duration': duration}
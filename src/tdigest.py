@@ -0,0 +1,87 @@
+# tdigest.py
+# Mergeable quantile sketch shared by the per-host baselines and the ping
+# statistics. Standard library only, so either can import it cheaply.
+from array import array
+
+
+class TDigest:
+    """Merging t-digest (Dunning). Points are buffered and merged in sorted
+    batches, so add() is an append and quantile() costs one pass over centroids."""
+
+    __slots__ = ('compression', 'means', 'weights', 'total', '_buf', '_buf_size')
+
+    def __init__(self, compression=25):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.total = 0.0
+        self._buf = []
+        self._buf_size = compression * 4
+
+    def add(self, x):
+        self._buf.append(x)
+        if len(self._buf) >= self._buf_size:
+            self._compress()
+
+    def _compress(self):
+        if not self._buf:
+            return
+        points = sorted(list(zip(self.means, self.weights)) + [(x, 1.0) for x in self._buf])
+        total = self.total + len(self._buf)
+        self._buf = []
+        means, weights = [], []
+        cur_m, cur_w = points[0]
+        so_far = 0.0
+        # k0-style size limit: centroids near the tails stay small
+        scale = 4.0 * total / self.compression
+        for m, w in points[1:]:
+            q = (so_far + cur_w + w / 2.0) / total
+            if cur_w + w <= max(1.0, scale * q * (1.0 - q)):
+                cur_m += (m - cur_m) * w / (cur_w + w)
+                cur_w += w
+            else:
+                means.append(cur_m)
+                weights.append(cur_w)
+                so_far += cur_w
+                cur_m, cur_w = m, w
+        means.append(cur_m)
+        weights.append(cur_w)
+        self.means, self.weights, self.total = means, weights, total
+
+    def count(self):
+        return self.total + len(self._buf)
+
+    def quantile(self, q):
+        self._compress()
+        if not self.means:
+            return None
+        if len(self.means) == 1:
+            return self.means[0]
+        target = q * self.total
+        cum = 0.0
+        prev_center, prev_mean = None, None
+        for m, w in zip(self.means, self.weights):
+            center = cum + w / 2.0
+            if target < center:
+                if prev_center is None:
+                    return m
+                frac = (target - prev_center) / (center - prev_center)
+                return prev_mean + frac * (m - prev_mean)
+            prev_center, prev_mean = center, m
+            cum += w
+        return self.means[-1]
+
+    def to_bytes(self):
+        self._compress()
+        # float32 is plenty for latency values and halves the stored size
+        return array('f', [v for pair in zip(self.means, self.weights) for v in pair]).tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob, compression=25):
+        d = cls(compression)
+        values = array('f')
+        values.frombytes(blob or b'')
+        d.means = list(values[0::2])
+        d.weights = list(values[1::2])
+        d.total = float(sum(d.weights))
+        return d
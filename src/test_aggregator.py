@@ -0,0 +1,198 @@
+# test_aggregator.py
+# An Aggregator and several CollectorAgents talking over localhost.
+import asyncio
+import struct
+import threading
+import time
+
+import pytest
+
+import agent_protocol
+import probe_engine
+from aggregator import Aggregator
+from collector_agent import CollectorAgent
+
+
+def wait_for(condition, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+@pytest.fixture
+def serve(db):
+    """Starts an Aggregator on a free localhost port in its own event loop."""
+    running = []
+
+    def start(**kwargs):
+        agg = Aggregator(port=0, **kwargs)
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(agg.start())
+            ready.set()
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        assert ready.wait(5)
+        running.append((agg, loop, thread))
+        return agg
+
+    async def shutdown(agg):
+        agg.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    yield start
+    for agg, loop, thread in running:
+        asyncio.run_coroutine_threadsafe(shutdown(agg), loop).result(10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+@pytest.fixture
+def agents():
+    started = []
+
+    def start(agg, shard, shards, **kwargs):
+        kwargs.setdefault('interval', 3600)
+        kwargs.setdefault('batch_size', 10)
+        kwargs.setdefault('flush_interval', 0.2)
+        agent = CollectorAgent(f"127.0.0.1:{agg.port}", shard, shards, agent_id=f"test-{shard}of{shards}",
+                               **kwargs)
+        started.append((agent, agent.start()))
+        return agent
+
+    yield start
+    for agent, thread in started:
+        agent.stop()
+        thread.join(5)
+
+
+def add_hosts(db, n):
+    db.add_group("g")
+    gid = db.list_groups()[0][0]
+    names = [f"10.1.{i // 256}.{i % 256}" for i in range(n)]
+    for name in names:
+        db.add_host(name, gid)
+    return set(names)
+
+
+def stored_hosts(db):
+    return [row[0] for row in db.query_results(columns=['host'])]
+
+
+def exchange(port, *frames):
+    """Sends raw frames on one connection; returns the frames read back until it closes."""
+    async def run():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for frame in frames:
+            writer.write(frame)
+        await writer.drain()
+        replies = []
+        try:
+            while True:
+                replies.append(await asyncio.wait_for(agent_protocol.read_frame(reader), 2.0))
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        writer.close()
+        return replies
+    return asyncio.run(run())
+
+
+def test_agents_split_hosts_by_shard_and_store_every_result(db, sim, serve, agents):
+    hosts = add_hosts(db, 60)
+    agg = serve()
+    running = [agents(agg, shard, 3) for shard in range(3)]
+    assert wait_for(lambda: len(stored_hosts(db)) >= len(hosts))
+    shards = [set(h for h, _ in agent.hosts) for agent in running]
+    assert set().union(*shards) == hosts
+    assert sum(len(s) for s in shards) == len(hosts)  # disjoint
+    for shard, names in enumerate(shards):
+        assert all(agent_protocol.shard_of(h, 3) == shard for h in names)
+    stored = stored_hosts(db)
+    assert sorted(stored) == sorted(hosts)
+
+
+def test_resent_batch_after_reconnect_is_stored_once(db, sim, serve):
+    add_hosts(db, 2)
+    agg = serve()
+    hello = agent_protocol.encode({'type': 'hello', 'agent_id': 'raw', 'shard': 0, 'shards': 1})
+    results = [probe_engine.probe_host("10.1.0.0", 1), probe_engine.probe_host("10.1.0.1", 1)]
+    batch = agent_protocol.encode({'type': 'batch', 'seq': 1, 'results': results})
+
+    replies = exchange(agg.port, hello, batch)
+    assert replies[0]['type'] == 'welcome' and replies[0]['last_seq'] == 0
+    assert replies[1] == {'type': 'ack', 'seq': 1}
+
+    # the ack was lost: the agent reconnects and sends the same batch again
+    replies = exchange(agg.port, hello, batch)
+    assert replies[0]['last_seq'] == 1
+    assert replies[1] == {'type': 'ack', 'seq': 1}
+    assert agg.duplicates == 1
+    assert len(stored_hosts(db)) == 2
+
+
+def test_slow_aggregator_blocks_the_probe_loop(db, sim, serve, agents, monkeypatch):
+    add_hosts(db, 300)
+    agg = serve(window=2)
+    release = threading.Event()
+    ingest = agg._ingest
+    monkeypatch.setattr(agg, '_ingest', lambda *a: (release.wait(10), ingest(*a)))
+    probed = []
+
+    def probe(host, group_id):
+        probed.append(host)
+        return probe_engine.probe_host(host, group_id)
+
+    agent = agents(agg, 0, 1, batch_size=5, max_batches=3, probe=probe)
+    assert wait_for(lambda: agent.stats()['pending_batches'] >= 3)
+    time.sleep(0.5)
+    # outbox (3 batches) + result queue (2 batches) + the batch being taken + the probe in hand
+    assert len(probed) <= 3 * 5 + 2 * 5 + 5 + 1
+    assert agent.stats()['pending_batches'] <= 3
+    release.set()
+    assert wait_for(lambda: len(stored_hosts(db)) == 300)
+    assert sorted(stored_hosts(db)) == sorted(set(probed))
+
+
+def test_wrong_token_is_refused_before_anything_is_stored(db, sim, serve):
+    add_hosts(db, 1)
+    agg = serve(token="s3cret")
+    result = probe_engine.probe_host("10.1.0.0", 1)
+    replies = exchange(agg.port,
+                       agent_protocol.encode({'type': 'hello', 'agent_id': 'x', 'token': 'guess',
+                                              'shard': 0, 'shards': 1}),
+                       agent_protocol.encode({'type': 'batch', 'seq': 1, 'results': [result]}))
+    assert replies == [{'type': 'error', 'error': 'unauthorized'}]
+    assert agg.rejected == 1
+    assert stored_hosts(db) == []
+
+
+def test_agent_with_the_token_is_accepted(db, sim, serve, agents):
+    hosts = add_hosts(db, 5)
+    agg = serve(token="s3cret")
+    agents(agg, 0, 1, token="s3cret")
+    assert wait_for(lambda: sorted(stored_hosts(db)) == sorted(hosts))
+
+
+@pytest.mark.parametrize('frame', [
+    struct.pack('>I', 5) + b"junk!",                                   # not zlib
+    agent_protocol.encode({'type': 'batch', 'seq': 1, 'results': []}),  # batch before hello
+    agent_protocol.encode({'type': 'hello'}),                           # fields missing
+])
+def test_malformed_frame_closes_only_that_connection(db, sim, serve, agents, frame):
+    hosts = add_hosts(db, 3)
+    agg = serve()
+    assert exchange(agg.port, frame) == []
+    agents(agg, 0, 1)
+    assert wait_for(lambda: sorted(stored_hosts(db)) == sorted(hosts))
@@ -0,0 +1,73 @@
+# test_alert_pipeline.py
+# AlertTracker turning per-sweep alert lists into firing/resolved transitions.
+from types import SimpleNamespace
+
+import pytest
+
+import alert_pipeline
+from alert_pipeline import AlertTracker
+
+
+@pytest.fixture
+def now(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(alert_pipeline, 'time', SimpleNamespace(time=lambda: clock[0]))
+    return clock
+
+
+def result(host, *alerts, ts="2026-01-01 00:00:00"):
+    return {'host': host, 'group_id': 7, 'timestamp': ts, 'alert_list': list(alerts)}
+
+
+def test_first_alert_fires_once(now):
+    tracker = AlertTracker()
+    events = tracker.process([result("a", ('latency', "Latency 300ms"))])
+    assert [(e['host'], e['rule'], e['state'], e['count']) for e in events] == [("a", 'latency', 'firing', 1)]
+    assert events[0]['group_id'] == 7 and events[0]['since'] == 1000.0
+
+
+def test_alert_still_firing_is_not_raised_again(now):
+    tracker = AlertTracker()
+    tracker.process([result("a", ('latency', "Latency 300ms"))])
+    assert tracker.process([result("a", ('latency', "Latency 350ms"))]) == []
+    [active] = tracker.active()
+    assert active['count'] == 2
+    assert active['message'] == "Latency 350ms"
+
+
+def test_alert_missing_from_the_next_sweep_resolves(now):
+    tracker = AlertTracker()
+    tracker.process([result("a", ('latency', "Latency 300ms"))])
+    now[0] += 90
+    [event] = tracker.process([result("a", ts="2026-01-01 00:01:30")])
+    assert event['state'] == 'resolved'
+    assert event['duration'] == 90
+    assert event['timestamp'] == "2026-01-01 00:01:30"
+    assert event['message'] == "Latency 300ms"
+    assert tracker.active() == []
+
+
+def test_rules_and_hosts_change_state_independently(now):
+    tracker = AlertTracker()
+    tracker.process([result("a", ('latency', "L"), ('loss', "P")), result("b", ('loss', "P"))])
+    events = tracker.process([result("a", ('loss', "P")), result("b", ('loss', "P"), ('jitter', "J"))])
+    assert sorted((e['host'], e['rule'], e['state']) for e in events) == [
+        ("a", 'latency', 'resolved'), ("b", 'jitter', 'firing')]
+    assert sorted((a['host'], a['rule']) for a in tracker.active()) == [("a", 'loss'), ("b", 'jitter'), ("b", 'loss')]
+
+
+def test_resolved_alert_fires_again_as_new(now):
+    tracker = AlertTracker()
+    tracker.process([result("a", ('latency', "L"))])
+    tracker.process([result("a")])
+    now[0] += 5
+    [event] = tracker.process([result("a", ('latency', "L"))])
+    assert event['state'] == 'firing'
+    assert event['count'] == 1 and event['since'] == 1005.0
+
+
+def test_hosts_absent_from_a_sweep_keep_their_alerts(now):
+    tracker = AlertTracker()
+    tracker.process([result("a", ('latency', "L"))])
+    assert tracker.process([result("b")]) == []
+    assert [a['host'] for a in tracker.active()] == ["a"]
@@ -0,0 +1,157 @@
+# test_database.py
+# Keyset paging, the archive merge, inventory sync and schema upgrades.
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import database
+
+
+def save(db, *rows):
+    """rows: (host, timestamp[, alerts]) with fixed metrics."""
+    db.save_results([(host, None, ts, 10.0, 0.0, 1.0, 9.0, 11.0, None, "", 0.0, rest[0] if rest else "")
+                     for host, ts, *rest in rows])
+
+
+def all_pages(db, limit, **filters):
+    pages, key = [], None
+    while True:
+        rows, key = db.query_page(after=key, limit=limit, **filters)
+        pages.append(rows)
+        if key is None:
+            return pages
+
+
+def test_paging_over_equal_timestamps_misses_and_repeats_nothing(db):
+    save(db, *[(f"h{i}", "2026-01-01 00:00:00") for i in range(10)])
+    pages = all_pages(db, 3, columns=['id', 'host'])
+    assert [len(p) for p in pages] == [3, 3, 3, 1]
+    ids = [row[0] for page in pages for row in page]
+    assert ids == sorted(ids) and len(set(ids)) == 10
+
+
+def test_last_full_page_has_no_next_key(db):
+    save(db, *[("h", f"2026-01-01 00:00:0{i}") for i in range(6)])
+    assert [len(p) for p in all_pages(db, 3)] == [3, 3]
+    assert db.query_page(limit=6)[1] is None
+    assert db.query_page(limit=5)[1] is not None
+
+
+def test_empty_range_is_one_empty_page(db):
+    save(db, ("h", "2026-01-01 00:00:00"))
+    assert db.query_page(start_ts="2027-01-01 00:00:00") == ([], None)
+
+
+def test_paging_returns_only_the_asked_columns(db):
+    save(db, *[("h", f"2026-01-01 00:00:0{i}") for i in range(4)])
+    pages = all_pages(db, 2, columns=['host'])
+    assert pages == [[("h",), ("h",)], [("h",), ("h",)]]
+
+
+def test_filters_apply_to_every_page(db):
+    save(db, *[(f"h{i % 2}", f"2026-01-01 00:00:0{i}", "Latency" if i % 3 == 0 else "") for i in range(9)])
+    rows = [r for page in all_pages(db, 2, host="h0", alerts_only=True, columns=['host', 'alerts'])
+            for r in page]
+    assert rows == [("h0", "Latency"), ("h0", "Latency")]
+
+
+def test_pages_merge_archived_days_with_sqlite_in_order(db):
+    pytest.importorskip("pyarrow")
+    import archive
+    save(db, *[(f"h{i}", f"2026-01-0{1 + i % 3} 12:00:00") for i in range(9)])   # old days
+    save(db, *[(f"h{i}", f"2026-03-01 0{i}:00:00") for i in range(4)])           # recent
+    assert archive.archive_older_than(days=30, now=datetime(2026, 3, 1)) == 9
+    assert len(db.query_page(include_archive=False, limit=100)[0]) == 4
+
+    pages = all_pages(db, 4, columns=['timestamp', 'id'])
+    rows = [r for page in pages for r in page]
+    assert [len(p) for p in pages] == [4, 4, 4, 1]
+    assert rows == sorted(rows) and len(set(rows)) == 13
+    assert len(list(db.iter_results(page_size=5))) == 13
+
+
+def test_late_rows_for_an_archived_day_still_page_in_order(db):
+    pytest.importorskip("pyarrow")
+    import archive
+    save(db, *[("h", f"2026-01-01 0{i}:00:00") for i in range(0, 9, 2)])
+    archive.archive_older_than(days=30, now=datetime(2026, 3, 1))
+    save(db, *[("h", f"2026-01-01 0{i}:00:00") for i in range(1, 9, 2)])   # arrived after the move
+    rows = [r for page in all_pages(db, 2, columns=['timestamp']) for r in page]
+    assert rows == [(f"2026-01-01 0{i}:00:00",) for i in range(9)]
+
+
+def hosts(db):
+    return sorted((host, group) for _, host, _, group in db.list_hosts())
+
+
+def test_sync_hosts_adds_moves_and_removes(db):
+    db.add_group("old")
+    gid = db.list_groups()[0][0]
+    db.add_host("keep", gid)
+    db.add_host("move", gid)
+    db.add_host("drop", gid)
+    result = db.sync_hosts({'keep': {'group': 'old'}, 'move': {'group': 'new'}, 'add': {'group': 'new'}},
+                           {'new': {'max_latency': 50.0}})
+    assert result == {'added': 1, 'moved': 1, 'updated': 0, 'unchanged': 1, 'removed': ['drop']}
+    assert hosts(db) == [("add", "new"), ("keep", "old"), ("move", "new")]
+    new = dict((name, i) for i, name in db.list_groups())["new"]
+    assert db.get_thresholds(new)['max_latency'] == 50.0
+
+
+def test_failed_sync_changes_nothing(db):
+    db.add_group("g")
+    gid = db.list_groups()[0][0]
+    db.add_host("a", gid)
+    db.add_host("b", gid)
+    before = db.get_thresholds(gid)
+    with pytest.raises(sqlite3.Error):
+        # the deletes and threshold upsert run before the bad insert
+        db.sync_hosts({'c': {'group': 'other', 'tcp_port': object()}}, {'g': {'max_latency': 1.0}})
+    assert hosts(db) == [("a", "g"), ("b", "g")]
+    assert [name for _, name in db.list_groups()] == ["g"]
+    db.invalidate_thresholds()
+    assert db.get_thresholds(gid) == before
+
+
+def test_sync_keeps_the_stored_spelling_of_a_host(db):
+    db.add_host("Web01.Example.com")
+    result = db.sync_hosts({'web01.example.com': {}})
+    assert result['unchanged'] == 1 and result['removed'] == []
+    assert hosts(db) == [("Web01.Example.com", None)]
+
+
+def test_init_db_upgrades_an_old_schema_in_place(tmp_path, monkeypatch):
+    path = tmp_path / "old.db"
+    monkeypatch.setattr(database, 'DB_FILE', str(path))
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE host_groups (id INTEGER PRIMARY KEY AUTOINCREMENT, group_name TEXT UNIQUE);
+        CREATE TABLE hosts (id INTEGER PRIMARY KEY AUTOINCREMENT, host TEXT, group_id INTEGER);
+        CREATE TABLE alert_thresholds (id INTEGER PRIMARY KEY AUTOINCREMENT, group_id INTEGER UNIQUE,
+                                       max_latency REAL, max_packet_loss REAL, max_jitter REAL);
+        CREATE TABLE results (id INTEGER PRIMARY KEY AUTOINCREMENT, host TEXT, group_id INTEGER,
+                              timestamp TEXT, avg_latency REAL, packet_loss REAL, jitter REAL,
+                              min_latency REAL, max_latency REAL, dns_time REAL, traceroute TEXT,
+                              tcp_retrans_rate REAL, alerts TEXT);
+        INSERT INTO hosts (host, group_id) VALUES ('a', NULL);
+        INSERT INTO results (host, timestamp, avg_latency) VALUES ('a', '2026-01-01 00:00:00', 12.5);
+    ''')
+    conn.close()
+
+    database.init_db()
+    database.init_db()  # a second run finds nothing to add
+    conn = sqlite3.connect(path)
+    columns = {table: [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+               for table in ('hosts', 'results', 'alert_thresholds')}
+    conn.close()
+    assert columns['results'] == database.RESULT_COLUMNS
+    assert columns['hosts'][-3:] == ['tcp_port', 'tls_port', 'http_url']
+    assert set(database.THRESHOLD_COLUMNS) <= set(columns['alert_thresholds'])
+
+    [row] = database.query_results(include_archive=False)
+    assert row[:5] == (1, 'a', None, '2026-01-01 00:00:00', 12.5)
+    assert row[-4:] == (None, None, None, None)
+    database.save_result("a", None, "2026-01-02 00:00:00", 1.0, 0.0, 0.0, 1.0, 1.0, None, "", 0.0, "",
+                         tcp_connect_ms=3.0, http_status=200)
+    assert database.query_results(columns=['tcp_connect_ms', 'http_status'], include_archive=False)[-1] == (3.0, 200)
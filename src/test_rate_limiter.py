@@ -0,0 +1,93 @@
+# test_rate_limiter.py
+# TokenBucket accounting against a fake clock.
+import pytest
+
+import rate_limiter
+from rate_limiter import TokenBucket
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(rate_limiter, 'time', fake)
+    return fake
+
+
+def test_full_bucket_serves_a_burst_without_waiting(clock):
+    bucket = TokenBucket(rate=100, burst=50)
+    assert bucket.reserve(50) == 0.0
+    assert bucket.stats()['waits'] == 0
+
+
+def test_callers_queue_up_behind_the_debt(clock):
+    bucket = TokenBucket(rate=100, burst=50)
+    bucket.reserve(50)
+    assert bucket.reserve(10) == pytest.approx(0.1)
+    assert bucket.reserve(10) == pytest.approx(0.2)
+    stats = bucket.stats()
+    assert stats['waits'] == 2
+    assert stats['wait_time'] == pytest.approx(0.3)
+    assert stats['acquired'] == 70
+
+
+def test_refill_pays_off_debt_and_stops_at_burst(clock):
+    bucket = TokenBucket(rate=100, burst=50)
+    bucket.reserve(50)
+    bucket.reserve(20)        # 20 tokens in debt
+    clock.now += 0.2          # +20: back to zero
+    assert bucket.reserve(1) == pytest.approx(0.01)
+    clock.now += 10.0         # far more than the bucket holds
+    assert bucket.reserve(50) == 0.0
+    assert bucket.reserve(1) == pytest.approx(0.01)
+
+
+def test_requests_larger_than_the_bucket_are_clamped(clock):
+    bucket = TokenBucket(rate=100, burst=50)
+    assert bucket.reserve(5000) == 0.0
+    assert bucket.stats()['acquired'] == 50
+    assert bucket.reserve(5000) == pytest.approx(0.5)
+
+
+def test_acquire_sleeps_for_the_reserved_delay(clock):
+    bucket = TokenBucket(rate=100, burst=10)
+    assert bucket.acquire(10) == 0.0
+    assert bucket.acquire(5) == pytest.approx(0.05)
+    assert clock.slept == [pytest.approx(0.05)]
+
+
+def test_charge_never_blocks_but_later_callers_wait(clock):
+    bucket = TokenBucket(rate=100, burst=50)
+    bucket.charge(30)
+    assert bucket.reserve(30) == pytest.approx(0.1)
+    bucket.charge(0)
+    bucket.charge(-5)
+    assert bucket.stats()['acquired'] == 60
+
+
+def test_charged_debt_is_capped_at_one_bucket(clock):
+    bucket = TokenBucket(rate=100, burst=50)
+    bucket.charge(10_000)
+    # the bucket holds at most 50 tokens of debt: 0.5 s plus the request
+    assert bucket.reserve(1) == pytest.approx(0.51)
+
+
+def test_lowering_burst_drops_the_surplus(clock):
+    bucket = TokenBucket(rate=100, burst=50)
+    bucket.configure(burst=10)
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve(1) == pytest.approx(0.01)
+    bucket.configure(rate=0)
+    assert bucket.rate == pytest.approx(0.001)
@@ -0,0 +1,173 @@
+# topology.py
+# Network paths parsed from traceroute output. Each host's current path is
+# kept in memory with a hop -> hosts index and an edge count, updated only for
+# hosts whose path changed, so a sweep costs one parse and one tuple compare
+# per host. Current paths and route changes are persisted, so startup never
+# re-reads stored traceroute text.
+import collections
+import threading
+import time
+
+import database
+
+
+def _address(token):
+    token = token.strip('[]()')
+    if token.count('.') == 3 or (token.count(':') >= 2 and 'ms' not in token):
+        return token
+    return None
+
+
+def parse_traceroute(text):
+    """Responding hop addresses, in order, from Linux 'traceroute -n' or
+    Windows 'tracert -d' output. Hops that timed out are left out; when a hop
+    answered from several addresses the first one is used."""
+    hops = []
+    for line in (text or "").splitlines():
+        tokens = line.split()
+        if len(tokens) < 2 or not tokens[0].isdigit():
+            continue
+        for token in tokens[1:]:
+            addr = _address(token)
+            if addr:
+                if addr not in hops:
+                    hops.append(addr)
+                break
+    return tuple(hops)
+
+
+class TopologyGraph:
+    def __init__(self, max_changes=100000):
+        self._paths = {}                                 # host -> tuple of hops
+        self._hop_hosts = collections.defaultdict(set)   # hop -> hosts whose path crosses it
+        self._edges = collections.Counter()              # (hop, next hop) -> host count
+        self._changes = collections.deque(maxlen=max_changes)  # (epoch, host, old, new)
+        self._dirty = {}
+        self._new_changes = []
+        self._lock = threading.Lock()
+
+    def _set_path(self, host, path):
+        old = self._paths.get(host, ())
+        for hop in old:
+            hosts = self._hop_hosts[hop]
+            hosts.discard(host)
+            if not hosts:
+                del self._hop_hosts[hop]
+        for edge in zip(old, old[1:]):
+            self._edges[edge] -= 1
+            if not self._edges[edge]:
+                del self._edges[edge]
+        self._paths[host] = path
+        for hop in path:
+            self._hop_hosts[hop].add(host)
+        self._edges.update(zip(path, path[1:]))
+
+    def update(self, results):
+        """Applies a batch of probe results; returns the number of changed routes."""
+        changed = 0
+        with self._lock:
+            for r in results:
+                hops = r.get('hops')  # pre-parsed by probe_host
+                path = tuple(hops) if hops is not None else parse_traceroute(r.get('traceroute'))
+                if not path:
+                    continue  # failed trace: keep the last known route
+                host = r['host']
+                old = self._paths.get(host)
+                if old == path:
+                    continue
+                self._set_path(host, path)
+                self._dirty[host] = path
+                if old is not None:
+                    change = (r.get('epoch') or time.time(), host, old, path)
+                    self._changes.append(change)
+                    self._new_changes.append(change)
+                    changed += 1
+        return changed
+
+    def flush(self):
+        """Writes routes and changes recorded since the last flush."""
+        with self._lock:
+            routes, self._dirty = self._dirty, {}
+            changes, self._new_changes = self._new_changes, []
+        if routes or changes:
+            database.save_routes([(host, " ".join(path)) for host, path in routes.items()],
+                                 [(host, epoch, " ".join(old), " ".join(new)) for epoch, host, old, new in changes])
+
+    def load(self, changes_since=86400):
+        with self._lock:
+            for host, path in database.load_routes():
+                self._set_path(host, tuple(path.split()))
+            for host, epoch, old, new in database.route_changes_since(time.time() - changes_since):
+                self._changes.append((epoch, host, tuple(old.split()), tuple(new.split())))
+
+    def forget(self, host):
+        with self._lock:
+            self._set_path(host, ())
+            del self._paths[host]
+
+    # queries
+    def path(self, host):
+        return self._paths.get(host, ())
+
+    def hosts_sharing(self, hop):
+        with self._lock:
+            return sorted(self._hop_hosts.get(hop, ()))
+
+    def next_hops(self, hop):
+        """{next hop: number of hosts routed over that edge}."""
+        with self._lock:
+            return {b: n for (a, b), n in self._edges.items() if a == hop}
+
+    def route_changes(self, within=3600):
+        """(epoch, host, old path, new path) for changes in the last 'within' seconds, oldest first."""
+        cutoff = time.time() - within
+        with self._lock:
+            return [c for c in self._changes if c[0] >= cutoff]
+
+    def shared_fate(self, alerting_hosts, min_hosts=3, min_fraction=0.5):
+        """Hops that many of the alerting hosts have in common, as likely shared
+        causes. A hop qualifies when at least min_hosts alerting hosts cross it
+        and they are at least min_fraction of all hosts crossing it. Hops carrying
+        exactly the same hosts (a chain with no branches) are reported together
+        as one segment. Strongest suspects first."""
+        alerting = set(alerting_hosts)
+        with self._lock:
+            counts = collections.Counter()
+            for host in alerting:
+                counts.update(self._paths.get(host, ()))
+            segments = {}
+            for hop, k in counts.items():
+                hosts = self._hop_hosts[hop]
+                if k >= min_hosts and k / len(hosts) >= min_fraction:
+                    segments.setdefault(frozenset(hosts), []).append(hop)
+            suspects = []
+            for hosts, hops in segments.items():
+                order = self._paths[next(iter(hosts & alerting))]
+                hops.sort(key=order.index)
+                k = counts[hops[0]]
+                suspects.append({'hop': hops[0], 'segment': hops, 'alerting': k, 'hosts': len(hosts),
+                                 'fraction': k / len(hosts)})
+        suspects.sort(key=lambda s: (-s['fraction'], -s['alerting']))
+        return suspects
+
+    def stats(self):
+        with self._lock:
+            return {'hosts': len(self._paths), 'hops': len(self._hop_hosts), 'edges': len(self._edges),
+                    'changes': len(self._changes)}
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    """Process-wide graph, restored from the database on first use."""
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = TopologyGraph()
+            try:
+                _graph.load()
+            except Exception:
+                pass
+    return _graph